@@ -14,7 +14,7 @@ LiquidCrystal_I2C lcd(0x27, 16, 2);  // Try 0x3F if blank screen
 // === CONFIGURATION ===
 const char* ssid = "jabed";
 const char* password = "12345678";
-const char* django_url = "http://192.168.227.94:8000/api/upload/"; 
+const char* django_url = "http://192.168.227.94:8000/api/upload/fast/"; 
 
 // === NTP/Time Setup ===
 WiFiUDP ntpUDP;
@@ -50,6 +50,7 @@ ArduinoSensorData latestArduinoData;
 
 // Function prototypes
 String getFormattedTime();
+void trackSecondTick();
 void sendCombinedData();
 void parseAndStoreArduinoData(char* packet);
 void updateLCD();
@@ -133,6 +134,7 @@ void loop() {
     yield();
 
     timeClient.update(); 
+    trackSecondTick();
     yield();
 
     if (WiFi.status() == WL_CONNECTED && millis() - lastSend >= sendInterval) {
@@ -247,6 +249,23 @@ void parseAndStoreArduinoData(char* packet) {
     }
 }
 
+// millis() when the NTP clock last ticked to a new second, so capture
+// times can carry milliseconds ("HH:MM:SS.mmm")
+unsigned long lastEpoch = 0;
+unsigned long secondStartMillis = 0;
+
+void trackSecondTick() {
+    unsigned long epoch = timeClient.getEpochTime();
+    if (epoch != lastEpoch) {
+        lastEpoch = epoch;
+        secondStartMillis = millis();
+    }
+}
+
 String getFormattedTime() {
-    return timeClient.getFormattedTime();
+    trackSecondTick();
+    char buf[16];
+    snprintf(buf, sizeof(buf), "%s.%03lu", timeClient.getFormattedTime().c_str(),
+             (millis() - secondStartMillis) % 1000);
+    return String(buf);
 }
\ No newline at end of file
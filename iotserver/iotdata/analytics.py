@@ -0,0 +1,411 @@
+# iotdata/analytics.py
+"""
+Server-side aggregates for the analytics dashboard (/api/analytics/).
+
+A window is split into fixed buckets (1 min or 1 h, epoch aligned) and each
+bucket is aggregated once per sensor with NumPy: samples, IR occupancy and
+relay on-counts (weighted by ``repeats``), rising IR edges (vehicles),
+a histogram of measured vehicle speeds (the Arduino holds the last speed
+until the next vehicle, so a new non-zero value is one measurement) and a
+histogram of piezo readings. A bucket also keeps its first and last
+readings, so edges and speed changes across a bucket boundary are counted
+when neighbouring buckets are merged.
+
+Buckets are cached in process per (resolution, bucket start). A bucket that
+ended more than IOTDATA_ANALYTICS_SETTLE seconds before it was read is
+sealed and reused as is. A newer one keeps the highest primary key it has
+seen per table; the next read loads only rows stored after it and merges
+them in like one more bucket (or rebuilds the bucket if they are older than
+what it holds), so the open head bucket costs one small query per refresh.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+
+from . import archive
+from .rollups import RAW_SOURCES
+
+RESOLUTIONS = {"minute": 60, "hour": 3600}
+# Windows longer than this default to hourly buckets
+MINUTE_WINDOW_LIMIT = timedelta(hours=6)
+# Most buckets one request may ask for
+MAX_BUCKETS = 1500
+# Rows are loaded in slices of this size to bound memory
+LOAD_STEP = 3600
+
+# km/h, 10 km/h bins; the last bin is open (200+)
+SPEED_EDGES = np.arange(0, 201, 10, dtype=np.float64)
+# analogRead() range 0..1023 in 16 bins
+PIEZO_EDGES = np.arange(0, 1025, 64, dtype=np.float64)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def settle_seconds():
+    return getattr(settings, 'IOTDATA_ANALYTICS_SETTLE', 30.0)
+
+
+def pick_resolution(start, end, name=None):
+    """Bucket width (s) from ?resolution= (minute/hour or seconds), else by window length."""
+    if name:
+        resolution = RESOLUTIONS.get(name) or int(name)
+        if resolution not in RESOLUTIONS.values():
+            raise ValueError(f"resolution must be one of {sorted(RESOLUTIONS)}")
+        return resolution
+    return RESOLUTIONS["minute" if end - start <= MINUTE_WINDOW_LIMIT else "hour"]
+
+
+def _fields(source):
+    _, relay_field, piezo_relay_field = RAW_SOURCES[source]
+    relays = tuple(f for f in (relay_field, piezo_relay_field) if f)
+    analog = ('piezo', 'speed') if source == "arduino" else ()
+    return analog, relays
+
+
+def _bins(values, edges):
+    return np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(edges) - 1)
+
+
+class _Partial:
+    """Aggregates of one sensor over one bucket (or a run of merged buckets)."""
+    __slots__ = ("samples", "on", "relays", "edges", "speed_hist", "speed_sum",
+                 "piezo_hist", "piezo_sum", "piezo_max", "first", "last", "last_time")
+
+    def copy(self):
+        other = _Partial()
+        for name in self.__slots__:
+            value = getattr(self, name)
+            setattr(other, name, value.copy() if isinstance(value, np.ndarray) else value)
+        return other
+
+    def boundary(self, following):
+        """(IR edges, new speed or None) between this run's last reading and ``following``'s first."""
+        edges = ((self.last[:2] <= 0) & (following.first[:2] > 0)).astype(np.int64)
+        speed = following.first[2]
+        return edges, (speed if speed > 0 and speed != self.last[2] else None)
+
+    def extend(self, following):
+        """Merge ``following`` (the next rows of the same sensor) into this one."""
+        edges, speed = self.boundary(following)
+        self.edges += edges + following.edges
+        if speed is not None:
+            self.speed_hist[_bins(speed, SPEED_EDGES)] += 1
+            self.speed_sum += speed
+        self.samples += following.samples
+        self.on += following.on
+        self.relays += following.relays
+        self.speed_hist += following.speed_hist
+        self.speed_sum += following.speed_sum
+        self.piezo_hist += following.piezo_hist
+        self.piezo_sum += following.piezo_sum
+        self.piezo_max = max(self.piezo_max, following.piezo_max)
+        self.last, self.last_time = following.last, following.last_time
+
+
+def _partials(source, columns, resolution):
+    """
+    {bucket start: {(source, sensor_id): _Partial}} for rows of ``source`` ordered by
+    receive time; ``columns`` maps each loaded column name to an array.
+    """
+    analog, relays = _fields(source)
+    sensors, inverse = np.unique(columns['sensor_id'], return_inverse=True)
+    result = {}
+    for k, sensor_id in enumerate(sensors):
+        idx = np.flatnonzero(inverse == k)
+        times = columns['time'][idx]
+        repeats = columns['repeats'][idx]
+        ir = np.stack([columns['ir1'][idx], columns['ir2'][idx]])
+        buckets = (times // resolution).astype(np.int64) * resolution
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(idx)] - 1
+        group = np.cumsum(np.r_[True, buckets[1:] != buckets[:-1]]) - 1
+        n = len(starts)
+        first_in_bucket = np.zeros(len(idx), dtype=bool)
+        first_in_bucket[starts] = True
+
+        def per_bucket(weights):
+            return np.bincount(group, weights=weights, minlength=n)
+
+        on = ir > 0
+        rising = np.zeros_like(on)
+        rising[:, 1:] = on[:, 1:] & ~on[:, :-1]
+        rising[:, first_in_bucket] = False
+        sums = {
+            "samples": per_bucket(repeats),
+            "on": np.stack([per_bucket(repeats * on[c]) for c in range(2)], axis=1),
+            "edges": np.stack([per_bucket(rising[c]) for c in range(2)], axis=1),
+            "relays": np.stack([per_bucket(repeats * columns[f][idx]) for f in relays], axis=1),
+        }
+        speed = columns['speed'][idx] if analog else np.zeros(len(idx))
+        if analog:
+            new_speed = np.r_[False, (speed[1:] > 0) & (speed[1:] != speed[:-1])] & ~first_in_bucket
+            speed_bins = _bins(speed, SPEED_EDGES)
+            sums["speed_hist"] = np.bincount(group[new_speed] * len(SPEED_EDGES) + speed_bins[new_speed],
+                                             minlength=n * len(SPEED_EDGES)).reshape(n, -1)
+            sums["speed_sum"] = per_bucket(speed * new_speed)
+            piezo = columns['piezo'][idx]
+            sums["piezo_hist"] = np.bincount(group * len(PIEZO_EDGES) + _bins(piezo, PIEZO_EDGES),
+                                             weights=repeats,
+                                             minlength=n * len(PIEZO_EDGES)).reshape(n, -1)
+            sums["piezo_sum"] = per_bucket(repeats * piezo)
+            sums["piezo_max"] = np.maximum.reduceat(piezo, starts)
+        readings = np.stack([ir[0], ir[1], speed], axis=1).astype(np.float64)
+
+        for b in range(n):
+            p = _Partial()
+            p.samples = int(sums["samples"][b])
+            p.on = sums["on"][b].astype(np.int64)
+            p.edges = sums["edges"][b].astype(np.int64)
+            p.relays = sums["relays"][b].astype(np.int64)
+            p.speed_hist = (sums["speed_hist"][b].astype(np.int64) if analog
+                            else np.zeros(len(SPEED_EDGES), dtype=np.int64))
+            p.speed_sum = float(sums["speed_sum"][b]) if analog else 0.0
+            p.piezo_hist = (sums["piezo_hist"][b].astype(np.int64) if analog
+                            else np.zeros(len(PIEZO_EDGES), dtype=np.int64))
+            p.piezo_sum = float(sums["piezo_sum"][b]) if analog else 0.0
+            p.piezo_max = float(sums["piezo_max"][b]) if analog else 0.0
+            p.first, p.last = readings[starts[b]], readings[ends[b]]
+            p.last_time = float(times[ends[b]])
+            result.setdefault(int(buckets[starts[b]]), {})[(source, str(sensor_id))] = p
+    return result
+
+
+def _load(source, lo, hi, after_id=None):
+    """
+    (column arrays, highest id) for rows of ``source`` received in [lo, hi)
+    (epoch seconds), archive included; only ids above ``after_id`` if given.
+    """
+    model = RAW_SOURCES[source][0]
+    analog, relays = _fields(source)
+    names = ('id', 'sensor_id', 'server_receive_time', 'ir1', 'ir2', *analog, *relays, 'repeats')
+    start, end = EPOCH + timedelta(seconds=lo), EPOCH + timedelta(seconds=hi)
+    rows = []
+    edge = archive.horizon()
+    if after_id is None and edge and start < edge:
+        rows.extend(archive.rows(source, start, min(end, edge), names))
+        start = max(start, edge)
+    qs = model.objects.filter(server_receive_time__gte=start, server_receive_time__lt=end)
+    if after_id is not None:
+        qs = qs.filter(id__gt=after_id)
+    stored = list(qs.order_by('server_receive_time').values_list(*names).iterator(chunk_size=5000))
+    rows.extend(stored)
+    top = max((row[0] for row in stored), default=after_id or 0)
+    if not rows:
+        return None, top
+
+    data = list(zip(*rows))
+    columns = {name: np.asarray(data[i]) for i, name in enumerate(names) if i > 2}
+    columns['sensor_id'] = np.asarray(data[1], dtype=object)
+    columns['time'] = np.fromiter((t.timestamp() for t in data[2]), dtype=np.float64, count=len(rows))
+    columns['repeats'] = columns['repeats'].astype(np.float64)
+    for name in relays:
+        columns[name] = columns[name].astype(np.float64)
+    return columns, top
+
+
+class _Bucket:
+    __slots__ = ("start", "sensors", "cursor", "sealed")
+
+    def __init__(self, start):
+        self.start = start
+        self.sensors = {}                 # (source, sensor_id) -> _Partial
+        self.cursor = {source: 0 for source in RAW_SOURCES}
+        self.sealed = False
+
+
+class BucketCache:
+    """Per-(resolution, bucket start) aggregates; see the module docstring."""
+
+    def __init__(self, max_buckets=10000, settle=30.0):
+        self.max_buckets = max_buckets
+        self.settle = settle
+        self._buckets = OrderedDict()     # (resolution, start) -> _Bucket
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshed = 0
+        self.computed = 0
+
+    def buckets(self, resolution, first, last, now):
+        """_Bucket for every start in [first, last] (epoch s), filled or refreshed as needed."""
+        with self._lock:
+            starts = range(first, last + 1, resolution)
+            missing = []
+            for start in starts:
+                bucket = self._buckets.get((resolution, start))
+                if bucket is None:
+                    missing.append(start)
+                elif bucket.sealed:
+                    self.hits += 1
+                    self._buckets.move_to_end((resolution, start))
+                elif not self._refresh(resolution, bucket, now):
+                    missing.append(start)
+            self._compute(resolution, missing, now)
+            result = [self._buckets[(resolution, start)] for start in starts]
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return result
+
+    def _compute(self, resolution, starts, now):
+        """Build the ``starts`` buckets, loading contiguous runs in LOAD_STEP slices."""
+        i = 0
+        while i < len(starts):
+            lo = starts[i]
+            hi = lo + resolution
+            j = i + 1
+            while j < len(starts) and starts[j] == hi and hi - lo < max(LOAD_STEP, resolution):
+                hi += resolution
+                j += 1
+            fresh = {start: _Bucket(start) for start in starts[i:j]}
+            for source in RAW_SOURCES:
+                columns, top = _load(source, lo, hi)
+                for bucket in fresh.values():
+                    bucket.cursor[source] = top
+                if columns is not None:
+                    for start, sensors in _partials(source, columns, resolution).items():
+                        fresh[start].sensors.update(sensors)
+            for start, bucket in fresh.items():
+                bucket.sealed = start + resolution + self.settle <= now
+                self._buckets[(resolution, start)] = bucket
+            self.computed += len(fresh)
+            i = j
+
+    def _refresh(self, resolution, bucket, now):
+        """Merge rows stored since ``bucket`` was read; False if it must be rebuilt."""
+        for source in RAW_SOURCES:
+            columns, top = _load(source, bucket.start, bucket.start + resolution,
+                                 after_id=bucket.cursor[source])
+            if columns is None:
+                continue
+            for key, p in _partials(source, columns, resolution).get(bucket.start, {}).items():
+                held = bucket.sensors.get(key)
+                if held is None:
+                    bucket.sensors[key] = p
+                elif columns['time'][columns['sensor_id'] == key[1]].min() >= held.last_time:
+                    held.extend(p)
+                else:
+                    return False          # stored out of order: rebuild the bucket
+            bucket.cursor[source] = top
+        bucket.sealed = bucket.start + resolution + self.settle <= now
+        self.refreshed += 1
+        self._buckets.move_to_end((resolution, bucket.start))
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        return {"buckets": len(self._buckets), "hits": self.hits,
+                "refreshed": self.refreshed, "computed": self.computed}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide bucket cache, created on first use from settings."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = BucketCache(
+                    max_buckets=getattr(settings, 'IOTDATA_ANALYTICS_CACHE_BUCKETS', 10000),
+                    settle=settle_seconds(),
+                )
+    return _cache
+
+
+def stats():
+    return get_cache().stats() if _cache is not None else {"buckets": 0}
+
+
+# ---------- window assembly ----------
+def _ratio(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def _edges_list(edges):
+    return [int(e) for e in edges] + [None]
+
+
+def window(start, end, resolution, now=None):
+    """Aggregates for [start, end) rounded out to whole ``resolution`` buckets."""
+    now = now if now is not None else time.time()
+    first = int(start.timestamp()) // resolution * resolution
+    last = (int(np.ceil(end.timestamp())) - 1) // resolution * resolution
+    if (last - first) // resolution + 1 > MAX_BUCKETS:
+        raise ValueError(f"more than {MAX_BUCKETS} buckets; use a coarser resolution")
+    buckets = get_cache().buckets(resolution, first, last, now)
+
+    keys = sorted({key for bucket in buckets for key in bucket.sensors})
+    totals, series = {}, {}
+    for key in keys:
+        total = None
+        rows = series[key] = {"samples": [], "on": [], "relays": [], "vehicles": []}
+        for bucket in buckets:
+            p = bucket.sensors.get(key)
+            if p is None:
+                rows["samples"].append(0)
+                rows["on"].append(None)
+                rows["relays"].append(None)
+                rows["vehicles"].append(0)
+                continue
+            boundary = total.boundary(p)[0] if total is not None else np.zeros(2, dtype=np.int64)
+            rows["samples"].append(p.samples)
+            rows["on"].append(p.on)
+            rows["relays"].append(p.relays)
+            rows["vehicles"].append(int(p.edges[0] + boundary[0]))
+            if total is None:
+                total = p.copy()
+            else:
+                total.extend(p)
+        totals[key] = total
+
+    sensors, occupancy, duty, vehicles = {}, {"y": [], "z": []}, {}, {}
+    speed_counts, piezo_counts = {}, {}
+    for key in keys:
+        source, sensor_id = key
+        t, rows = totals[key], series[key]
+        _, relays = _fields(source)
+        sensors[sensor_id] = {
+            "source": source,
+            "samples": t.samples,
+            "vehicles": int(t.edges[0]),
+            "ir_edges": {"ir1": int(t.edges[0]), "ir2": int(t.edges[1])},
+            "occupancy": {"ir1": _ratio(t.on[0], t.samples), "ir2": _ratio(t.on[1], t.samples)},
+            "duty": {name: _ratio(t.relays[r], t.samples) for r, name in enumerate(relays)},
+        }
+        for c, channel in enumerate(('ir1', 'ir2')):
+            occupancy["y"].append(f"{sensor_id} {channel}")
+            occupancy["z"].append([None if on is None else _ratio(on[c], n)
+                                   for on, n in zip(rows["on"], rows["samples"])])
+        for r, name in enumerate(relays):
+            duty[f"{sensor_id} {name}"] = [None if on is None else _ratio(on[r], n)
+                                           for on, n in zip(rows["relays"], rows["samples"])]
+        vehicles[sensor_id] = rows["vehicles"]
+        if source == "arduino":
+            measured = int(t.speed_hist.sum())
+            sensors[sensor_id].update(
+                speed_measurements=measured,
+                mean_speed=round(t.speed_sum / measured, 2) if measured else None,
+                piezo_mean=round(t.piezo_sum / t.samples, 2) if t.samples else None,
+                piezo_max=t.piezo_max,
+            )
+            speed_counts[sensor_id] = t.speed_hist.tolist()
+            piezo_counts[sensor_id] = t.piezo_hist.tolist()
+
+    return {
+        "resolution": resolution,
+        "buckets": [(EPOCH + timedelta(seconds=b.start)).isoformat() for b in buckets],
+        "sensors": sensors,
+        "speed_histogram": {"bin_edges": _edges_list(SPEED_EDGES), "counts": speed_counts},
+        "piezo_histogram": {"bin_edges": _edges_list(PIEZO_EDGES), "counts": piezo_counts},
+        "occupancy_heatmap": occupancy,
+        "duty_cycles": duty,
+        "vehicle_counts": vehicles,
+    }
@@ -0,0 +1,376 @@
+# iotdata/archive.py
+"""
+Retention for the raw sample tables, with compressed columnar archives.
+
+Raw rows older than IOTDATA_RAW_RETENTION_DAYS (whole UTC days) are exported
+and then deleted. Each (source, day, sensor) becomes one NumPy ``.npz`` file
+(zip-deflated, one array per column) under IOTDATA_ARCHIVE_DIR:
+
+    <archive dir>/<source>/<YYYY-MM-DD>/<sensor_id>.npz
+
+sensor_id comes from the boards, so it is percent-encoded in the file name
+(quote(..., safe='')): "/" and "\\" can never leave the day folder.
+
+A day's files are written to temp files and renamed into place, then
+manifest.json's "horizon" (end of the newest archived day) moves past it,
+and only then are its rows deleted: in chunks of IOTDATA_PRUNE_CHUNK ids,
+each in its own short transaction, so the SQLite write lock is never held
+for long and ingest keeps flowing. The unified readings table (readings.py)
+is pruned for the same days; it has no archive of its own.
+
+Readers call split(): for a window starting before the horizon it returns
+the archived rows up to the horizon (same tuple layout as the values_list()
+call they replace) and the cutoff to use for the database part.
+"""
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time as clock
+import zipfile
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from urllib.parse import quote, unquote
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from . import readings
+from .models import ArduinoData, NodeMCUData
+
+# source -> (model, stored columns besides id / sensor_id / times / run columns)
+SOURCES = {
+    "arduino": (ArduinoData, ('device_capture_time', 'device_capture_at', 'ir1', 'ir2', 'piezo',
+                              'speed', 'arduino_relay', 'piezo_relay')),
+    "nodemcu": (NodeMCUData, ('device_capture_time', 'device_capture_at', 'ir1', 'ir2',
+                              'nodemcu_relay')),
+}
+
+# column -> dtype on disk (datetimes/times as int64 microseconds, -1 = null)
+DTYPES = {
+    'id': np.int64, 'server_receive_time': np.int64, 'run_until': np.int64,
+    'repeats': np.int32, 'device_capture_time': np.int64, 'device_capture_at': np.int64,
+    'ir1': np.int32, 'ir2': np.int32, 'piezo': np.float64, 'speed': np.float64,
+    'arduino_relay': np.bool_, 'piezo_relay': np.bool_, 'nodemcu_relay': np.bool_,
+}
+
+DAY = timedelta(days=1)
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def archive_dir():
+    return str(getattr(settings, 'IOTDATA_ARCHIVE_DIR', 'archive'))
+
+
+def retention_days():
+    return getattr(settings, 'IOTDATA_RAW_RETENTION_DAYS', None)
+
+
+def _columns(source):
+    return ('id', 'server_receive_time', *SOURCES[source][1], 'repeats', 'run_until')
+
+
+def _day_start(dt):
+    return datetime.combine(dt.astimezone(dt_timezone.utc).date(), time(), tzinfo=dt_timezone.utc)
+
+
+def _us(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+# ---------- encoding ----------
+# Stored as datetimes (int64 microseconds since the epoch)
+DATETIMES = ('server_receive_time', 'run_until', 'device_capture_at')
+
+
+def _encode(column, values):
+    if column in DATETIMES:
+        values = [-1 if v is None else _us(v) for v in values]
+    elif column == 'device_capture_time':
+        values = [-1 if v is None else
+                  ((v.hour * 60 + v.minute) * 60 + v.second) * 1000000 + v.microsecond
+                  for v in values]
+    return np.asarray(values, dtype=DTYPES[column])
+
+
+def _decoder(column):
+    if column in DATETIMES:
+        return lambda us: None if us < 0 else EPOCH + timedelta(microseconds=us)
+    if column == 'device_capture_time':
+        def capture(us):
+            if us < 0:
+                return None
+            seconds, micro = divmod(us, 1000000)
+            return time(seconds // 3600, seconds // 60 % 60, seconds % 60, micro)
+        return capture
+    return None
+
+
+# ---------- manifest ----------
+_manifest_cache = (None, None)     # (mtime, manifest)
+
+
+def _manifest_path():
+    return os.path.join(archive_dir(), 'manifest.json')
+
+
+def manifest():
+    global _manifest_cache
+    path = _manifest_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {"horizon": None}
+    if _manifest_cache[0] != mtime:
+        with open(path) as f:
+            _manifest_cache = (mtime, json.load(f))
+    return _manifest_cache[1]
+
+
+def horizon():
+    """End of the newest archived day, or None."""
+    value = manifest().get("horizon")
+    return datetime.fromisoformat(value) if value else None
+
+
+def _atomic_write(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _set_horizon(value):
+    data = dict(manifest())
+    if data.get("horizon") and datetime.fromisoformat(data["horizon"]) >= value:
+        return
+    data["horizon"] = value.isoformat()
+    _atomic_write(_manifest_path(), lambda f: f.write(json.dumps(data, indent=2).encode()))
+
+
+# ---------- writing ----------
+def _day_path(source, day, sensor_id):
+    return os.path.join(archive_dir(), source, day.strftime('%Y-%m-%d'),
+                        f"{quote(sensor_id, safe='')}.npz")
+
+
+def _spool(rows, columns, folder, chunk):
+    """
+    Encode ``rows`` (tuples of ``columns``) ``chunk`` rows at a time,
+    appending each column's values to <folder>/<column>.bin. Returns rows.
+    """
+    files = {c: open(os.path.join(folder, f"{c}.bin"), 'wb') for c in columns}
+    total = 0
+    try:
+        while True:
+            batch = list(itertools.islice(rows, chunk))
+            if not batch:
+                return total
+            for c, values in zip(columns, zip(*batch)):
+                _encode(c, values).tofile(files[c])
+            total += len(batch)
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def _write_npz(f, columns, folder, n):
+    """The spooled columns as an .npz (what np.savez_compressed writes), copied file by file."""
+    with zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as npz:
+        for c in columns:
+            with npz.open(f"{c}.npy", 'w', force_zip64=True) as member, \
+                    open(os.path.join(folder, f"{c}.bin"), 'rb') as data:
+                np.lib.format.write_array_header_1_0(member, {
+                    'descr': np.lib.format.dtype_to_descr(np.dtype(DTYPES[c])),
+                    'fortran_order': False,
+                    'shape': (n,),
+                })
+                shutil.copyfileobj(data, member)
+
+
+def _merge_existing(path, fresh, columns):
+    """Replace ``path`` (left by an earlier, interrupted run) with its rows merged with ``fresh``'s."""
+    with np.load(fresh) as new:
+        arrays = {c: new[c] for c in columns}
+    with np.load(path) as old:
+        keep = ~np.isin(old['id'], arrays['id'])
+        arrays = {c: np.concatenate([_column(old, c)[keep], arrays[c]]) for c in columns}
+    order = np.argsort(arrays['server_receive_time'], kind='stable')
+    _atomic_write(path, lambda f: np.savez_compressed(f, **{c: a[order] for c, a in arrays.items()}))
+
+
+def archive_day(source, day, chunk=None):
+    """
+    Export every row of ``source`` received on ``day`` (UTC midnight) into
+    per-sensor files, merging with files an earlier interrupted run left.
+    Rows are read and encoded ``chunk`` (IOTDATA_PRUNE_CHUNK) at a time and
+    spooled to disk, so memory does not grow with the day. Returns rows
+    written.
+    """
+    model = SOURCES[source][0]
+    chunk = chunk or getattr(settings, 'IOTDATA_PRUNE_CHUNK', 5000)
+    columns = _columns(source)
+    day_rows = model.objects.filter(server_receive_time__gte=day,
+                                    server_receive_time__lt=day + DAY)
+    written = 0
+    for sensor_id in day_rows.values_list('sensor_id', flat=True).distinct().order_by():
+        rows = (day_rows.filter(sensor_id=sensor_id).order_by('server_receive_time', 'id')
+                .values_list(*columns).iterator(chunk_size=chunk))
+        path = _day_path(source, day, sensor_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(path)) as folder:
+            n = _spool(rows, columns, folder, chunk)
+            if os.path.exists(path):
+                # Recovery only: merging holds both files' arrays in memory
+                fresh = os.path.join(folder, 'fresh.npz')
+                with open(fresh, 'wb') as f:
+                    _write_npz(f, columns, folder, n)
+                _merge_existing(path, fresh, columns)
+            else:
+                _atomic_write(path, lambda f: _write_npz(f, columns, folder, n))
+        written += n
+    return written
+
+
+def prune_day(source, day, chunk=None, pause=0.0):
+    """Delete ``source`` rows received on ``day`` in id chunks; returns rows deleted."""
+    model = SOURCES[source][0]
+    chunk = chunk or getattr(settings, 'IOTDATA_PRUNE_CHUNK', 5000)
+    day_rows = model.objects.filter(server_receive_time__gte=day,
+                                    server_receive_time__lt=day + DAY)
+    deleted = 0
+    while True:
+        ids = list(day_rows.order_by().values_list('id', flat=True)[:chunk])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted += model.objects.filter(id__in=ids).delete()[0]
+        if pause:
+            clock.sleep(pause)
+
+
+def expired_days(now=None, days=None):
+    """UTC days (oldest first) that hold raw rows older than the retention period."""
+    days = retention_days() if days is None else days
+    if days is None:
+        return []
+    cutoff = _day_start((now or timezone.now()) - timedelta(days=days))
+    oldest = [SOURCES[s][0].objects.aggregate(t=Min('server_receive_time'))['t'] for s in SOURCES]
+    oldest = [t for t in oldest if t is not None]
+    if not oldest:
+        return []
+    day, result = _day_start(min(oldest)), []
+    while day < cutoff:
+        result.append(day)
+        day += DAY
+    return result
+
+
+def run_retention(now=None, days=None, archive=True, chunk=None, pause=0.0, log=print):
+    """
+    Archive (unless ``archive`` is false) and prune every expired day, oldest
+    first. Returns {"days": n, "archived": rows, "deleted": rows}.
+    """
+    totals = {"days": 0, "archived": 0, "deleted": 0}
+    for day in expired_days(now, days):
+        if archive:
+            for source in SOURCES:
+                totals["archived"] += archive_day(source, day, chunk)
+            # Readers switch to the archive for this day before its rows go
+            _set_horizon(day + DAY)
+        for source in SOURCES:
+            deleted = prune_day(source, day, chunk, pause)
+            totals["deleted"] += deleted
+            log(f"[RETENTION] {source} {day:%Y-%m-%d}: deleted {deleted}"
+                + (" (archived)" if archive else ""))
+        deleted = readings.prune(day, day + DAY, chunk, pause)
+        if deleted:
+            log(f"[RETENTION] readings {day:%Y-%m-%d}: deleted {deleted}")
+        totals["days"] += 1
+    return totals
+
+
+# ---------- reading ----------
+def _column(data, column):
+    """One column of a loaded day file; -1 (null) for columns added after it was written."""
+    if column in data.files:
+        return data[column]
+    return np.full(len(data['id']), -1, dtype=DTYPES[column])
+
+
+def _load_day(source, day, start_us, end_us, names):
+    folder = os.path.join(archive_dir(), source, day.strftime('%Y-%m-%d'))
+    try:
+        files = sorted(f for f in os.listdir(folder) if f.endswith('.npz'))
+    except FileNotFoundError:
+        return None
+    parts = []
+    for name in files:
+        with np.load(os.path.join(folder, name)) as data:
+            t = data['server_receive_time']
+            mask = (t >= start_us) & (t < end_us)
+            if not mask.any():
+                continue
+            part = {c: _column(data, c)[mask] for c in names if c != 'sensor_id'}
+            part['server_receive_time'] = t[mask]
+            if 'sensor_id' in names:
+                part['sensor_id'] = np.full(int(mask.sum()), unquote(name[:-4]), dtype=object)
+            parts.append(part)
+    if not parts:
+        return None
+    merged = {c: np.concatenate([p[c] for p in parts]) for c in parts[0]}
+    order = np.argsort(merged['server_receive_time'], kind='stable')
+    return {c: a[order] for c, a in merged.items()}
+
+
+def rows(source, start, end, names):
+    """
+    Archived rows of ``source`` received in [start, end), ordered by receive
+    time, as tuples of ``names`` (any stored column plus 'sensor_id').
+    """
+    start_us, end_us = _us(start), _us(end)
+    day = _day_start(start)
+    decoders = [_decoder(c) for c in names]
+    while day < end:
+        data = _load_day(source, day, start_us, end_us, names)
+        day += DAY
+        if data is None:
+            continue
+        columns = []
+        for name, decode in zip(names, decoders):
+            values = data[name].tolist()
+            columns.append([decode(v) for v in values] if decode else values)
+        yield from zip(*columns)
+
+
+def count(source, start, end):
+    """Samples (repeats included) archived for ``source`` in [start, end)."""
+    total, day = 0, _day_start(start)
+    while day < end:
+        data = _load_day(source, day, _us(start), _us(end), ('repeats',))
+        day += DAY
+        if data is not None:
+            total += int(data['repeats'].sum())
+    return total
+
+
+def split(source, cutoff, names):
+    """
+    (archived rows, database cutoff) for a window starting at ``cutoff``:
+    archived rows from ``cutoff`` up to the horizon, and the database is
+    read from the horizon on (rows of a day being pruned are not read twice).
+    """
+    edge = horizon()
+    if edge is None or cutoff >= edge:
+        return iter(()), cutoff
+    return rows(source, cutoff, edge, names), edge
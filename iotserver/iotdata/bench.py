@@ -0,0 +1,252 @@
+# iotdata/bench.py
+"""
+Helpers shared by the benchmark management commands: a throw-away database
+with the real schema, fast synthetic history seeding, timers, firmware-shaped
+upload bodies and a stub of the NodeMCU relay web server. Nothing here is used by the running
+server.
+"""
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArduinoData, NodeMCUData
+
+SAMPLE_INTERVAL_MS = 70      # firmware send interval
+
+
+@contextmanager
+def scratch_database(path=None):
+    """
+    Point the default connection at a fresh, migrated database for the
+    duration of the block (SQLite: a temp file, so 10M rows don't live in
+    RAM). The configured database is never touched.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    tmp_dir = None
+    if connection.vendor == 'sqlite':
+        if path is None:
+            tmp_dir = tempfile.mkdtemp(prefix='iotbench-')
+            path = os.path.join(tmp_dir, 'bench.sqlite3')
+        test_settings['NAME'] = str(path)
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)   # WAL/SHM files included
+
+
+def _arduino_row(rnd, sensor_id, ts, capture):
+    busy = rnd.random() < 0.05
+    return (sensor_id, capture, int(busy and rnd.random() < 0.5), int(busy and rnd.random() < 0.5),
+            rnd.randint(900, 1023) if busy else rnd.randint(0, 40),
+            round(rnd.uniform(5, 60), 1) if busy else 0.0,
+            rnd.random() < 0.3, busy and rnd.random() < 0.5, ts)
+
+
+def _nodemcu_row(rnd, sensor_id, ts, capture):
+    busy = rnd.random() < 0.05
+    return (sensor_id, capture, int(busy and rnd.random() < 0.5), int(busy and rnd.random() < 0.5),
+            rnd.random() < 0.3, ts)
+
+
+SEED_SPECS = {
+    ArduinoData: (('sensor_id', 'device_capture_time', 'ir1', 'ir2', 'piezo', 'speed',
+                   'arduino_relay', 'piezo_relay', 'server_receive_time'), _arduino_row, 'ARDU_{:02d}'),
+    NodeMCUData: (('sensor_id', 'device_capture_time', 'ir1', 'ir2', 'nodemcu_relay',
+                   'server_receive_time'), _nodemcu_row, 'NMCU_{:02d}'),
+}
+
+
+def seed_history(model, start, stop, end=None, sensors=1, interval_ms=SAMPLE_INTERVAL_MS,
+                 chunk=50000, seed=0):
+    """
+    Insert rows number ``start``..``stop`` of a synthetic history for ``model``
+    with raw executemany (no model instances). Row i is stamped
+    ``end - i * interval_ms`` and rows rotate across ``sensors`` boards, so
+    calling this repeatedly with growing ranges extends the same history
+    further into the past.
+    """
+    end = end or timezone.now()
+    columns, make_row, sensor_fmt = SEED_SPECS[model]
+    ops = connection.ops
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        ops.quote_name(model._meta.db_table),
+        ', '.join(ops.quote_name(c) for c in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    rnd = random.Random(seed + start)
+    sensor_ids = [sensor_fmt.format(i + 1) for i in range(sensors)]
+
+    with connection.cursor() as cursor:
+        for lo in range(start, stop, chunk):
+            rows = []
+            for i in range(lo, min(lo + chunk, stop)):
+                at = end - timedelta(milliseconds=i * interval_ms)
+                rows.append(make_row(
+                    rnd, sensor_ids[i % sensors],
+                    ops.adapt_datetimefield_value(at),
+                    ops.adapt_timefield_value(at.time().replace(microsecond=0)),
+                ))
+            with transaction.atomic():
+                cursor.executemany(sql, rows)
+    return end
+
+
+def timed(fn, repeat=5):
+    """Run ``fn`` ``repeat`` times; returns (median_ms, min_ms, last_result)."""
+    samples, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), min(samples), result
+
+
+def percentiles(samples_ms):
+    """p50/p95/p99/max of a list of millisecond timings (nearest rank)."""
+    if not samples_ms:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples_ms)
+
+    def rank(p):
+        return round(ordered[max(int(len(ordered) * p + 0.5) - 1, 0)], 2)
+
+    return {
+        "p50_ms": rank(0.50),
+        "p95_ms": rank(0.95),
+        "p99_ms": rank(0.99),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def firmware_payload(rnd, pair=1, now=None):
+    """
+    One upload body exactly as sendCombinedData() builds it (NodeMcuCode/
+    nodemcu_received_data.ino) for simulated board pair ``pair``.
+    """
+    # NTP time of day in the firmware's zone, with milliseconds
+    zone = dt_timezone(timedelta(seconds=getattr(settings, 'IOTDATA_DEVICE_UTC_OFFSET', 0)))
+    capture = (now or timezone.now()).astimezone(zone).strftime('%H:%M:%S.%f')[:-3]
+    busy = rnd.random() < 0.05
+    return {
+        "nodemcu": {
+            "sensor_id": f"NMCU_{pair:02d}",
+            "device_capture_time": capture,
+            "ir1": int(busy and rnd.random() < 0.5),
+            "ir2": int(busy and rnd.random() < 0.5),
+            "nodemcu_relay": rnd.random() < 0.3,
+        },
+        "arduino": {
+            "sensor_id": f"ARDU_{pair:02d}",
+            "device_capture_time": capture,
+            "ir1": int(busy and rnd.random() < 0.5),
+            "ir2": int(busy and rnd.random() < 0.5),
+            "piezo": rnd.randint(900, 1023) if busy else rnd.randint(0, 40),
+            "speed": round(rnd.uniform(5, 60), 1) if busy else 0.0,
+            "arduino_relay": rnd.random() < 0.3,
+            "piezo_relay": busy and rnd.random() < 0.5,
+        },
+    }
+
+
+class RelayStub:
+    """
+    Stand-in for the NodeMCU firmware's relay web server: answers /relay/on,
+    /relay/off and /relay/arduino/{on,off} with the firmware's bodies after
+    a configurable delay. By default requests are served one at a time like
+    ESP8266WebServer; ``hang_rate`` makes that fraction of requests never
+    answer, to exercise timeouts.
+    """
+    RESPONSES = {
+        "/relay/on": "ON",
+        "/relay/off": "OFF",
+        "/relay/arduino/on": "ARDUINO_ON_COMMAND_SENT",
+        "/relay/arduino/off": "ARDUINO_OFF_COMMAND_SENT",
+    }
+
+    def __init__(self, latency_ms=20.0, jitter_ms=0.0, hang_rate=0.0,
+                 serial=True, keep_alive=True, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.hang_rate = hang_rate
+        self.serial = serial
+        self.keep_alive = keep_alive
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = None
+
+    async def _respond(self, path):
+        if self.random.random() < self.hang_rate:
+            await asyncio.sleep(3600)
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(delay, 0) / 1000)
+        return self.RESPONSES.get(path)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                path = request_line.split()[1].decode()
+                self.requests += 1
+
+                if self.serial:
+                    async with self._lock:
+                        body = await self._respond(path)
+                else:
+                    body = await self._respond(path)
+
+                status = "200 OK" if body is not None else "404 Not Found"
+                body = (body or "Not found").encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: text/plain\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if self.keep_alive else 'close'}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+                if not self.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        self._lock = asyncio.Lock()
+        return await asyncio.start_server(self.handle, host, port)
+
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        """Run the stub on its own loop in a daemon thread; returns the bound port."""
+        ready = threading.Event()
+        bound = {}
+
+        def run():
+            loop = asyncio.new_event_loop()
+            server = loop.run_until_complete(self.serve(host, port))
+            bound["port"] = server.sockets[0].getsockname()[1]
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name="relay-stub", daemon=True).start()
+        ready.wait()
+        return bound["port"]
@@ -0,0 +1,28 @@
+# iotdata/consumers.py
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from . import live
+
+
+class DashboardConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes the /api/latest/ payload to the browser whenever ingest stores a
+    new sample (or a relay command changes state). Clients get one snapshot
+    on connect and then only the group broadcasts.
+    """
+
+    async def connect(self):
+        await self.channel_layer.group_add(live.DASHBOARD_GROUP, self.channel_name)
+        await self.accept()
+        await self.send_json(await database_sync_to_async(live.latest_payload)())
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(live.DASHBOARD_GROUP, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Read-only channel; anything from the client is ignored.
+        pass
+
+    async def dashboard_update(self, event):
+        await self.send_json(event["data"])
@@ -0,0 +1,207 @@
+# iotdata/delta.py
+"""
+Change-only ("delta") storage for the raw sample tables.
+
+With IOTDATA_DELTA_STORAGE on, ingest folds consecutive samples of a sensor
+whose readings are identical into one row: the first sample's values and
+receive time, ``repeats`` = how many samples it stands for and ``run_until``
+= when the last of them arrived. A run is written when a reading changes or
+its IOTDATA_DELTA_HEARTBEAT window (aligned to the epoch) ends, so an idle
+board costs one row per heartbeat instead of one per 70 ms. With the default
+1 s heartbeat a run never spans two 1 s rollup buckets; with a longer one,
+rollups split each run across the seconds its samples fall in.
+
+Open runs live in process memory, so a row reaches the tables up to one
+heartbeat after its first sample (the live cache and WebSocket push still
+see every sample as it arrives). A background thread writes runs whose
+window has ended even if the board goes quiet, and stop() writes the rest
+at exit.
+
+Readers pass rows through expand() to get one tuple per sample back, evenly
+spaced between the run's first and last receive time; rollups weight each
+row by ``repeats``. Rows stored without delta mode have repeats=1 and pass
+through untouched.
+"""
+import atexit
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+# Readings compared between consecutive samples (capture time is ignored:
+# it ticks every second whether anything happens or not)
+COMPARED = {
+    "arduino": ('ir1', 'ir2', 'piezo', 'speed', 'arduino_relay', 'piezo_relay'),
+    "nodemcu": ('ir1', 'ir2', 'nodemcu_relay'),
+}
+
+# Extra columns readers add to values_list() for expand()
+RUN_COLUMNS = ('repeats', 'run_until')
+
+
+def is_enabled():
+    return getattr(settings, 'IOTDATA_DELTA_STORAGE', False)
+
+
+def heartbeat():
+    return getattr(settings, 'IOTDATA_DELTA_HEARTBEAT', 1.0)
+
+
+def expand(rows, ts_index):
+    """
+    Yield one tuple per sample from ``rows`` whose last two values are
+    RUN_COLUMNS (which are dropped); ``ts_index`` is the position of
+    server_receive_time, rewritten for the repeated samples of a run.
+    """
+    for row in rows:
+        repeats, until = row[-2], row[-1]
+        if repeats == 1 or until is None:
+            yield row[:-2]
+            continue
+        values = list(row[:-2])
+        start = values[ts_index]
+        step = (until - start) / (repeats - 1)
+        for i in range(repeats):
+            values[ts_index] = start + step * i
+            yield tuple(values)
+
+
+class _Run:
+    __slots__ = ("head", "key", "window", "count", "last")
+
+    def __init__(self, head, key, window):
+        self.head = head                  # first sample (the row that gets stored)
+        self.key = key
+        self.window = window
+        self.count = 1
+        self.last = head.server_receive_time
+
+    def close(self):
+        self.head.repeats = self.count
+        self.head.run_until = self.last if self.count > 1 else None
+        return self.head
+
+
+class DeltaFilter:
+    def __init__(self, writer, heartbeat=1.0):
+        self.writer = writer              # callable({source: [instances]})
+        self.heartbeat = heartbeat
+
+        self._runs = {}                   # (source, sensor_id) -> _Run
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        # Counters (read via stats())
+        self.received = 0
+        self.stored = 0
+
+    def _window(self, when):
+        return int(when.timestamp() // self.heartbeat)
+
+    def _expired(self, current, everything=False):
+        closed = {}
+        for key, run in list(self._runs.items()):
+            if everything or run.window < current:
+                closed.setdefault(key[0], []).append(run.close())
+                del self._runs[key]
+        return closed
+
+    def fold(self, batches):
+        """
+        Fold new samples into the open runs. Returns {source: [instances]}
+        for the runs that closed (changed reading or ended heartbeat window),
+        ready to store.
+        """
+        self._ensure_started()
+        closed = {}
+        with self._lock:
+            for source, instances in batches.items():
+                fields = COMPARED[source]
+                for instance in instances:
+                    key = tuple(getattr(instance, f) for f in fields)
+                    window = self._window(instance.server_receive_time)
+                    run = self._runs.get((source, instance.sensor_id))
+                    if run is not None and run.key == key and run.window == window:
+                        run.count += 1
+                        run.last = instance.server_receive_time
+                        continue
+                    if run is not None:
+                        closed.setdefault(source, []).append(run.close())
+                    self._runs[(source, instance.sensor_id)] = _Run(instance, key, window)
+                self.received += len(instances)
+
+            for source, heads in self._expired(self._window(timezone.now())).items():
+                closed.setdefault(source, []).extend(heads)
+            self.stored += sum(len(heads) for heads in closed.values())
+        return closed
+
+    # ---------- background writer ----------
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="iotdata-delta", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _write_expired(self, everything=False):
+        with self._lock:
+            closed = self._expired(self._window(timezone.now()), everything)
+            self.stored += sum(len(heads) for heads in closed.values())
+        if closed:
+            try:
+                self.writer(closed)
+            except Exception as e:
+                print(f"[DELTA] writing {sum(map(len, closed.values()))} runs failed: {e}")
+
+    def _run(self):
+        try:
+            while not self._stopping.wait(self.heartbeat / 2):
+                self._write_expired()
+        finally:
+            connection.close()
+
+    def stop(self):
+        """Write every open run and stop the thread (registered with atexit)."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(self.heartbeat)
+        self._write_expired(everything=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": True,
+                "heartbeat": self.heartbeat,
+                "open_runs": len(self._runs),
+                "received": self.received,
+                "stored": self.stored,
+                "ratio": round(self.received / self.stored, 2) if self.stored else None,
+            }
+
+
+_filter = None
+_filter_lock = threading.Lock()
+
+
+def get_filter(writer):
+    """Process-wide filter, created on first use from settings."""
+    global _filter
+    if _filter is None:
+        with _filter_lock:
+            if _filter is None:
+                _filter = DeltaFilter(
+                    writer, heartbeat=heartbeat()
+                )
+    return _filter
+
+
+def stats():
+    if _filter is None:
+        return {"enabled": is_enabled(), "open_runs": 0}
+    return _filter.stats()
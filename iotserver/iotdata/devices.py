@@ -0,0 +1,187 @@
+# iotdata/devices.py
+"""
+Device registry: IP, last-seen time and ingest rate per sensor_id.
+
+State lives in the Django cache named by IOTDATA_DEVICE_CACHE (a file-based
+cache by default, so every worker process on the host sees the same boards;
+point it at Redis/Memcached for several hosts). Uploads only touch a
+per-process dict; it is merged into the cache at most once every
+IOTDATA_DEVICE_FLUSH_INTERVAL seconds with one get_many/set_many, and reads
+reuse a snapshot of the cache for READ_TTL seconds overlaid with what this
+process has seen since.
+
+Merges are read-modify-write, so two processes flushing at the same instant
+can lose part of one rate window; last_seen and IP are always the newest
+either of them saw.
+
+Record: {"sensor_id", "source", "ip", "first_seen", "last_seen" (epoch
+seconds), "samples" (total), "rate" (samples/s over the last RATE_WINDOW)}.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = "iotdata:device:"
+INDEX_KEY = "iotdata:devices"
+
+# Seconds a read snapshot of the shared cache is reused
+READ_TTL = 0.5
+# Seconds of samples behind each "rate" figure
+RATE_WINDOW = 5.0
+
+# Relay commands go here when no NodeMCU has reported yet
+FALLBACK_IP = "192.168.1.100"
+
+
+def _cache():
+    return caches[getattr(settings, 'IOTDATA_DEVICE_CACHE', 'default')]
+
+
+def _flush_interval():
+    return getattr(settings, 'IOTDATA_DEVICE_FLUSH_INTERVAL', 1.0)
+
+
+def _ttl():
+    return getattr(settings, 'IOTDATA_DEVICE_TTL', 7 * 24 * 3600)
+
+
+_lock = threading.Lock()
+# sensor_id -> {"source", "ip", "first_seen", "last_seen", "samples"} seen since the last flush
+_pending = {}
+_last_flush = 0.0
+_snapshot = {}
+_snapshot_at = 0.0
+
+
+def seen(source, counts, ip, now=None):
+    """
+    Record that ``counts`` ({sensor_id: samples}) arrived from ``ip`` for
+    ``source``. Cheap: the shared cache is written at most once per flush
+    interval.
+    """
+    now = now or time.time()
+    with _lock:
+        for sensor_id, n in counts.items():
+            entry = _pending.get(sensor_id)
+            if entry is None:
+                _pending[sensor_id] = {"source": source, "ip": ip, "first_seen": now,
+                                       "last_seen": now, "samples": n}
+            else:
+                entry["last_seen"] = now
+                entry["samples"] += n
+                if ip:
+                    entry["ip"] = ip
+        due = now - _last_flush >= _flush_interval()
+    if due:
+        flush(now)
+
+
+def _merge(record, sensor_id, entry, now):
+    if record is None:
+        record = {"sensor_id": sensor_id, "source": entry["source"], "ip": None,
+                  "first_seen": entry["first_seen"], "last_seen": 0.0, "samples": 0,
+                  "rate": 0.0, "rate_at": now, "rate_samples": 0}
+    if entry["last_seen"] >= record["last_seen"]:
+        record["last_seen"] = entry["last_seen"]
+        record["ip"] = entry["ip"] or record["ip"]
+    record["samples"] += entry["samples"]
+    record["rate_samples"] += entry["samples"]
+    elapsed = now - record["rate_at"]
+    if elapsed >= RATE_WINDOW:
+        record["rate"] = round(record["rate_samples"] / elapsed, 2)
+        record["rate_at"], record["rate_samples"] = now, 0
+    return record
+
+
+def flush(now=None):
+    """Merge this process's pending sightings into the shared cache."""
+    global _last_flush, _pending, _snapshot_at
+    now = now or time.time()
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = now
+    if not pending:
+        return
+
+    cache = _cache()
+    keys = [KEY_PREFIX + sensor_id for sensor_id in pending]
+    stored = cache.get_many(keys + [INDEX_KEY])
+    index = set(stored.get(INDEX_KEY) or ())
+    updates = {}
+    for key, (sensor_id, entry) in zip(keys, pending.items()):
+        updates[key] = _merge(stored.get(key), sensor_id, entry, now)
+        index.add(sensor_id)
+    updates[INDEX_KEY] = sorted(index)
+    cache.set_many(updates, timeout=_ttl())
+    with _lock:
+        _snapshot_at = 0.0     # next read sees our own flush
+
+
+def _shared():
+    """All records in the shared cache, reused for READ_TTL seconds."""
+    global _snapshot, _snapshot_at
+    now = time.monotonic()
+    if now - _snapshot_at < READ_TTL:
+        return _snapshot
+    cache = _cache()
+    index = cache.get(INDEX_KEY) or ()
+    records = cache.get_many([KEY_PREFIX + sensor_id for sensor_id in index])
+    snapshot = {record["sensor_id"]: record for record in records.values()}
+    with _lock:
+        _snapshot, _snapshot_at = snapshot, now
+    return snapshot
+
+
+def _public(record):
+    return {k: record[k] for k in ("sensor_id", "source", "ip", "first_seen", "last_seen",
+                                   "samples", "rate")}
+
+
+def all_devices():
+    """{sensor_id: record} across every process, newest local sightings included."""
+    devices = {sensor_id: dict(record) for sensor_id, record in _shared().items()}
+    with _lock:
+        pending = {sensor_id: dict(entry) for sensor_id, entry in _pending.items()}
+    for sensor_id, entry in pending.items():
+        record = devices.get(sensor_id)
+        if record is None:
+            devices[sensor_id] = {"sensor_id": sensor_id, "rate": 0.0, **entry}
+            continue
+        record["samples"] += entry["samples"]
+        if entry["last_seen"] > record["last_seen"]:
+            record["last_seen"] = entry["last_seen"]
+            record["ip"] = entry["ip"] or record["ip"]
+    stale = time.time() - RATE_WINDOW * 2
+    for record in devices.values():
+        if record["last_seen"] < stale:
+            record["rate"] = 0.0     # stopped sending since the last rate window
+    return {sensor_id: _public(record) for sensor_id, record in devices.items()}
+
+
+def get(sensor_id):
+    return all_devices().get(sensor_id)
+
+
+def newest(source):
+    """Most recently seen device of ``source``, or None."""
+    candidates = [d for d in all_devices().values() if d["source"] == source]
+    return max(candidates, key=lambda d: d["last_seen"], default=None)
+
+
+def relay_ip(sensor_id=None):
+    """
+    Address relay commands for ``sensor_id`` go to. Arduino boards are driven
+    through their NodeMCU, which posts for both, so either ID resolves to the
+    same IP. Without an ID the most recently seen NodeMCU is used.
+    """
+    device = get(sensor_id) if sensor_id else newest("nodemcu")
+    return device["ip"] if device and device["ip"] else FALLBACK_IP
+
+
+def reset():
+    """Forget this process's pending sightings and read snapshot (the cache is kept)."""
+    global _pending, _snapshot, _snapshot_at, _last_flush
+    with _lock:
+        _pending, _snapshot, _snapshot_at, _last_flush = {}, {}, 0.0, 0.0
@@ -0,0 +1,162 @@
+# iotdata/downsample.py
+"""
+Shape-preserving downsampling for the chart endpoints.
+
+Largest-Triangle-Three-Buckets keeps, per bucket, the point that forms the
+largest triangle with the previously kept point and the mean of the next
+bucket, so spikes (vehicles passing, relay flips) survive while flat
+stretches collapse. Samples are pulled with values_list() in chunks of
+CHUNK_SIZE rows, each converted into NumPy arrays before the next is read;
+no model instances are built. A window holding more than MAX_RAW_SAMPLES
+samples of a source is charted from a rollup level instead (see
+downsampled_series()).
+"""
+import itertools
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import archive, delta
+from .models import ArduinoData, NodeMCUData, SensorRollup
+
+# Rows read (and converted to arrays) at a time
+CHUNK_SIZE = 20000
+# Samples of one source above which series come from rollups, not raw rows
+MAX_RAW_SAMPLES = 1_000_000
+
+# source -> (model, fields charted per sensor)
+SERIES_FIELDS = {
+    "arduino": (ArduinoData, ('speed', 'piezo', 'ir1', 'ir2', 'arduino_relay', 'piezo_relay')),
+    "nodemcu": (NodeMCUData, ('ir1', 'ir2', 'nodemcu_relay')),
+}
+# charted field -> rollup column summed over a bucket (divided by its samples)
+ROLLUP_SUMS = {
+    'speed': 'speed_sum', 'piezo': 'piezo_sum', 'ir1': 'ir1_on', 'ir2': 'ir2_on',
+    'arduino_relay': 'relay_on', 'nodemcu_relay': 'relay_on', 'piezo_relay': 'piezo_relay_on',
+}
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the ``threshold`` points LTTB keeps from (x, y). The first and
+    last points are always kept; inputs shorter than the threshold are
+    returned whole.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 interior buckets over indices 1 .. n-2
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes
+    # The "next bucket" of the last interior bucket is the final point
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    out = np.empty(threshold, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs(
+            (ax - next_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[i] - ay)
+        )
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def _columns(rows):
+    """
+    {sensor_id: (times in epoch ms, values of shape (fields, n))} from
+    (sensor_id, datetime, *values) tuples, converted CHUNK_SIZE rows at a
+    time so only the arrays are held, never the tuples.
+    """
+    parts = {}
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+        sensors = np.asarray([row[0] for row in chunk], dtype=object)
+        times = np.fromiter((row[1].timestamp() * 1000 for row in chunk),
+                            dtype=np.float64, count=len(chunk))
+        values = np.array([row[2:] for row in chunk], dtype=np.float64).T
+        for sensor_id in np.unique(sensors):
+            mask = sensors == sensor_id
+            parts.setdefault(str(sensor_id), []).append((times[mask], values[:, mask]))
+    return {sensor_id: (np.concatenate([t for t, _ in p]), np.concatenate([v for _, v in p], axis=1))
+            for sensor_id, p in parts.items()}
+
+
+def _raw_rows(source, model, fields, cutoff):
+    names = ('sensor_id', 'server_receive_time', *fields, *delta.RUN_COLUMNS)
+    archived, since = archive.split(source, cutoff, names)
+    return delta.expand(itertools.chain(
+        archived,
+        model.objects.filter(server_receive_time__gte=since)
+        .order_by('server_receive_time')
+        .values_list(*names).iterator(chunk_size=CHUNK_SIZE),
+    ), 1)
+
+
+def _rollup_rows(source, fields, cutoff, resolution):
+    """Per-bucket means (ratios for IR and relays) of ``fields``, shaped like _raw_rows()."""
+    names = ('sensor_id', 'bucket_start', 'samples', *(ROLLUP_SUMS[f] for f in fields))
+    buckets = (SensorRollup.objects
+               .filter(source=source, resolution=resolution,
+                       bucket_start__gt=cutoff - timedelta(seconds=resolution))
+               .order_by('bucket_start').values_list(*names).iterator(chunk_size=CHUNK_SIZE))
+    for sensor_id, start, n, *sums in buckets:
+        n = n or 1
+        yield (sensor_id, start, *(value / n for value in sums))
+
+
+def _resolution(source, model, cutoff, now):
+    """None to chart raw samples, else the finest rollup level with few enough buckets."""
+    edge = archive.horizon()
+    archived = archive.count(source, cutoff, edge) if edge and cutoff < edge else 0
+    stored = (model.objects.filter(server_receive_time__gte=max(cutoff, edge or cutoff))
+              .aggregate(n=Sum('repeats'))['n'] or 0)
+    if archived + stored <= MAX_RAW_SAMPLES:
+        return None
+    window = (now - cutoff).total_seconds()
+    for resolution in SensorRollup.RESOLUTIONS:
+        if window / resolution <= MAX_RAW_SAMPLES:
+            if SensorRollup.objects.filter(source=source, resolution=resolution,
+                                           bucket_start__gte=cutoff).exists():
+                return resolution
+            break
+    return None
+
+
+def downsampled_series(cutoff, max_points, now=None):
+    """
+    ({source: {sensor_id: {field: {"timestamp": [epoch ms], "values": [...]}}}},
+    {source: rollup resolution or None}) for samples since ``cutoff``, each
+    series reduced to at most ``max_points`` points with LTTB. Sources with
+    more than MAX_RAW_SAMPLES samples in the window are charted from the
+    finest rollup level holding at most that many buckets per sensor (when
+    it has been built), so memory stays bounded however long the window is.
+    """
+    now = now or timezone.now()
+    result, resolutions = {}, {}
+    for source, (model, fields) in SERIES_FIELDS.items():
+        resolution = resolutions[source] = _resolution(source, model, cutoff, now)
+        rows = (_raw_rows(source, model, fields, cutoff) if resolution is None
+                else _rollup_rows(source, fields, cutoff, resolution))
+        result[source] = {}
+        for sensor_id, (t, values) in _columns(rows).items():
+            series = {}
+            for field, v in zip(fields, values):
+                keep = lttb_indices(t, v, max_points)
+                series[field] = {
+                    "timestamp": t[keep].astype(np.int64).tolist(),
+                    "values": v[keep].tolist(),
+                }
+            result[source][sensor_id] = series
+    return result, resolutions
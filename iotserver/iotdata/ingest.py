@@ -0,0 +1,151 @@
+# iotdata/ingest.py
+"""
+Ingest pipeline shared by the upload endpoints.
+
+A POST may carry a single sample per source (what the firmware sends today)
+or a list of samples per source (buffered uploads). Both are validated with
+one serializer instance per source and written with ``bulk_create`` inside a
+single transaction (after folding unchanged samples into runs when delta
+storage is on, see delta.py).
+"""
+import time
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from . import delta, devices, latency, live, metrics, readings, relayqueue, writebehind, writer
+from .models import ArduinoData, NodeMCUData
+from .serializers import ArduinoDataSerializer, NodeMCUDataSerializer
+
+# Hard cap on samples per source in one request (~70 s of readings at 70 ms)
+MAX_BATCH_SIZE = 1000
+
+# source key in the payload -> (model, serializer)
+SOURCES = {
+    "arduino": (ArduinoData, ArduinoDataSerializer),
+    "nodemcu": (NodeMCUData, NodeMCUDataSerializer),
+}
+
+
+class BatchTooLarge(Exception):
+    pass
+
+
+def validate_samples(source, samples):
+    """
+    Validate one sample or a list of samples for ``source``.
+    Returns (instances, errors) where errors is a list of
+    {"index": i, "errors": {...}} for every rejected sample.
+    """
+    model, serializer_class = SOURCES[source]
+    if not isinstance(samples, list):
+        samples = [samples]
+    if len(samples) > MAX_BATCH_SIZE:
+        raise BatchTooLarge(f"{source}: {len(samples)} samples (max {MAX_BATCH_SIZE})")
+
+    # One serializer for the whole batch: field setup happens once,
+    # each sample only pays for run_validation().
+    serializer = serializer_class()
+    instances, errors = [], []
+    for index, sample in enumerate(samples):
+        try:
+            validated = serializer.run_validation(sample)
+        except ValidationError as exc:
+            errors.append({"index": index, "errors": exc.detail})
+            continue
+        instances.append(model(**validated))
+    return instances, errors
+
+
+def write_samples(batches):
+    """
+    Write {source: [instances]} in one transaction, one INSERT per source
+    (plus one into the unified readings table when it is on, see readings.py).
+    """
+    started = time.perf_counter()
+    with transaction.atomic():
+        for source, instances in batches.items():
+            if instances:
+                SOURCES[source][0].objects.bulk_create(instances)
+        if readings.is_enabled():
+            readings.write(batches)
+    metrics.DB_WRITE_SECONDS.observe(time.perf_counter() - started)
+    for source, instances in batches.items():
+        metrics.DB_WRITE_ROWS.inc((source,), len(instances))
+    live.notify_stored()
+
+
+def store_samples(batches):
+    """
+    Persist validated samples: through the write-behind buffer when
+    IOTDATA_WRITE_BEHIND is on (may raise writebehind.BufferFull), else on
+    the serialized writer thread when IOTDATA_SERIAL_WRITER is on (may
+    raise writer.WriterTimeout), else
+    directly on the request's connection.
+    """
+    if writebehind.is_enabled():
+        writebehind.get_buffer(write_samples).put(batches)
+    elif writer.is_enabled():
+        writer.get_writer(write_samples).write(batches)
+    else:
+        write_samples(batches)
+
+
+def register_devices(batches, client_ip):
+    """
+    Note every board in ``batches`` as seen from ``client_ip`` (see
+    devices.py) and count its samples in the metrics.
+    """
+    for source, instances in batches.items():
+        counts = {}
+        for instance in instances:
+            counts[instance.sensor_id] = counts.get(instance.sensor_id, 0) + 1
+        if counts:
+            devices.seen(source, counts, client_ip)
+            for sensor_id, n in counts.items():
+                metrics.SAMPLES.inc((source, metrics.sensor_label(sensor_id)), n)
+
+
+def ingest(body, client_ip=None, validate=validate_samples):
+    """
+    Validate and store an upload body. Returns a per-source report:
+    {"arduino": {"accepted": n, "rejected": m, "errors": [...]}, ...}
+    Sources missing from the body are left out of the report. ``validate``
+    is validate_samples() or the compiled schema.validate_samples().
+    """
+    batches, report = {}, {}
+    for source in SOURCES:
+        samples = body.get(source)
+        if not samples:
+            continue
+        instances, errors = validate(source, samples)
+        if errors:
+            print(f"[UPLOAD] {source} rejected {len(errors)} sample(s):", errors[:3])
+            metrics.REJECTED.inc((source,), len(errors))
+        batches[source] = instances
+        report[source] = {
+            "accepted": len(instances),
+            "rejected": len(errors),
+            "errors": errors,
+        }
+
+    accept(batches, client_ip)
+    return report
+
+
+def accept(batches, client_ip=None):
+    """
+    Store validated {source: [instances]} and pass them on to the device
+    registry, the latency tracker, the live cache / WebSocket push and the
+    relay queue. Shared by the upload views and the line-protocol listener
+    (lineproto.py).
+    """
+    latency.stamp(batches)
+    if delta.is_enabled():
+        store_samples(delta.get_filter(store_samples).fold(batches))
+    else:
+        store_samples(batches)
+    register_devices(batches, client_ip)
+    latency.observe(batches)
+    live.publish_samples(batches)
+    relayqueue.observe(batches, client_ip)
@@ -0,0 +1,382 @@
+# iotdata/latency.py
+"""
+Dual-path latency: the Arduino's IR sensors reach the server through the
+Arduino -> serial -> NodeMCU path, the NodeMCU's own IR pins directly. An
+object passing a sensor pair raises ir1 (or ir2) on both boards; the time
+between the two rising edges is the extra latency of the Arduino path.
+
+Capture times. The firmware stamps each upload with its NTP time of day
+("HH:MM:SS", or "HH:MM:SS.mmm"), in the zone set by IOTDATA_DEVICE_UTC_OFFSET
+(seconds east of UTC, as in the firmware's NTPClient). stamp() places it on
+the calendar next to server_receive_time as device_capture_at (the date
+closest to the receive time). receive - capture is the device's clock
+offset plus the network delay; the smallest value over the last
+OFFSET_WINDOW samples is the per-device clock offset estimate. Rows stored
+before device_capture_at existed have it null until `manage.py
+backfill_capture_at` stamps them (backfill()); until then their edges are
+measured on receive times.
+
+Pairing. Boards pair by the part of the sensor_id after "_" (ARDU_01 with
+NMCU_01). Each edge of one source is matched with the nearest edge of the
+other within IOTDATA_LATENCY_WINDOW_MS, each edge used at most once.
+Latency is arduino edge - nodemcu edge in ms, measured on device capture
+times when both rows have one, else on receive times.
+
+window_stats() computes distributions (p50/p95/p99, jitter = mean absolute
+difference between consecutive latencies) for any window with NumPy,
+reading rows SCAN_CHUNK at a time, so memory grows with the edges found
+rather than the rows in the window.
+The Tracker does the same incrementally as samples arrive (observe() is
+called from ingest.accept()), pairing edges greedily in arrival order, and
+feeds latency_diff / latency into the live dashboard payload.
+"""
+import itertools
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from . import archive
+from .models import ArduinoData, NodeMCUData
+
+MODELS = {"arduino": ArduinoData, "nodemcu": NodeMCUData}
+CHANNELS = ('ir1', 'ir2')
+
+# Latencies kept per board pair for the live figures
+LIVE_SIZE = 4096
+# Samples per device behind the clock offset estimate
+OFFSET_WINDOW = 600
+# Rows read (and converted to arrays) at a time by window_stats()
+SCAN_CHUNK = 5000
+# Rows stamped per transaction by backfill()
+BACKFILL_CHUNK = 5000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+DAY = timedelta(days=1)
+HALF_DAY = timedelta(hours=12)
+MS = timedelta(milliseconds=1)
+
+
+def pairing_window_ms():
+    return getattr(settings, 'IOTDATA_LATENCY_WINDOW_MS', 2000)
+
+
+def pair_key(sensor_id):
+    """"01" for both ARDU_01 and NMCU_01."""
+    return sensor_id.partition('_')[2] or sensor_id
+
+
+def _ms(dt):
+    return (dt - EPOCH) / MS
+
+
+# ---------- capture timestamps ----------
+def capture_datetime(capture_time, received):
+    """device_capture_time (device zone) as an aware datetime on the day nearest ``received``."""
+    if capture_time is None:
+        return None
+    zone = dt_timezone(timedelta(seconds=getattr(settings, 'IOTDATA_DEVICE_UTC_OFFSET', 0)))
+    local = received.astimezone(zone)
+    at = datetime.combine(local.date(), capture_time, tzinfo=zone)
+    if at - local > HALF_DAY:
+        at -= DAY
+    elif local - at > HALF_DAY:
+        at += DAY
+    return at.astimezone(dt_timezone.utc)
+
+
+def stamp(batches):
+    """Set device_capture_at on every instance in {source: [instances]}."""
+    for instances in batches.values():
+        for instance in instances:
+            instance.device_capture_at = capture_datetime(instance.device_capture_time,
+                                                          instance.server_receive_time)
+
+
+def backfill(chunk=BACKFILL_CHUNK):
+    """
+    stamp() the stored rows that have a device_capture_time but no
+    device_capture_at, in id order, one transaction per chunk. Archived
+    days are not rewritten. Returns {source: rows updated}.
+    """
+    updated = {}
+    for source, model in MODELS.items():
+        qs = model.objects.filter(device_capture_at__isnull=True, device_capture_time__isnull=False)
+        updated[source], last_id = 0, 0
+        while True:
+            rows = list(qs.filter(id__gt=last_id).order_by('id')
+                        .only('id', 'device_capture_time', 'server_receive_time')[:chunk])
+            if not rows:
+                break
+            stamp({source: rows})
+            with transaction.atomic():
+                model.objects.bulk_update(rows, ['device_capture_at'])
+            updated[source] += len(rows)
+            last_id = rows[-1].id
+    return updated
+
+
+# ---------- vectorized engine ----------
+def rising_edges(values):
+    """Indices where a 0/1 series goes from 0 to non-zero."""
+    on = np.asarray(values) > 0
+    return np.flatnonzero(on[1:] & ~on[:-1]) + 1
+
+
+def pair_edges(a_times, n_times, window_ms):
+    """
+    Nearest one-to-one matching of two sorted edge-time arrays (ms). Returns
+    index arrays (ia, in_) of the matched arduino and nodemcu edges.
+    """
+    empty = np.empty(0, dtype=np.intp)
+    if not len(a_times) or not len(n_times):
+        return empty, empty
+    idx = np.searchsorted(a_times, n_times)
+    left = np.clip(idx - 1, 0, len(a_times) - 1)
+    right = np.clip(idx, 0, len(a_times) - 1)
+    nearest = np.where(np.abs(a_times[right] - n_times) < np.abs(a_times[left] - n_times),
+                       right, left)
+    distance = np.abs(a_times[nearest] - n_times)
+    ok = distance <= window_ms
+    ia, in_, distance = nearest[ok], np.flatnonzero(ok), distance[ok]
+    # An arduino edge nearest to several nodemcu edges keeps the closest one
+    order = np.lexsort((distance, ia))
+    ia, in_ = ia[order], in_[order]
+    first = np.r_[True, ia[1:] != ia[:-1]]
+    ia, in_ = ia[first], in_[first]
+    order = np.argsort(in_, kind='stable')
+    return ia[order], in_[order]
+
+
+def latencies(a_recv, a_cap, n_recv, n_cap, window_ms):
+    """Latency (ms) of every matched edge pair; capture times used where both rows have one."""
+    ia, in_ = pair_edges(a_recv, n_recv, window_ms)
+    by_capture = a_cap[ia] - n_cap[in_]
+    return np.where(np.isnan(by_capture), a_recv[ia] - n_recv[in_], by_capture)
+
+
+def summarize(values):
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {"pairs": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "pairs": int(len(values)),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "min_ms": round(float(values.min()), 3),
+        "max_ms": round(float(values.max()), 3),
+        "std_ms": round(float(values.std()), 3),
+        "jitter_ms": round(float(np.abs(np.diff(values)).mean()), 3) if len(values) > 1 else 0.0,
+    }
+
+
+def _rows(source, sensor_id, start, end):
+    """(receive time, capture time, ir1, ir2) of one board in [start, end), archive included."""
+    names = ('sensor_id', 'server_receive_time', 'device_capture_at', *CHANNELS)
+    archived, cutoff = archive.split(source, start, names)
+    stored = MODELS[source].objects.filter(
+        sensor_id=sensor_id, server_receive_time__gte=cutoff, server_receive_time__lt=end,
+    ).order_by('server_receive_time').values_list(*names)
+    return (row[1:] for row in itertools.chain(archived, stored.iterator(chunk_size=SCAN_CHUNK))
+            if row[0] == sensor_id and row[1] < end)
+
+
+def _scan(rows):
+    """
+    ({channel: (receive ms, capture ms or NaN)} of the rising edges in
+    ``rows``, receive - capture ms of the last OFFSET_WINDOW rows with a
+    capture time), reading SCAN_CHUNK rows at a time.
+    """
+    found = {channel: ([], []) for channel in CHANNELS}
+    offsets = deque(maxlen=OFFSET_WINDOW)
+    previous = None                       # IR values of the last row of the previous chunk
+    while True:
+        chunk = list(itertools.islice(rows, SCAN_CHUNK))
+        if not chunk:
+            break
+        received = np.fromiter((_ms(row[0]) for row in chunk), dtype=np.float64, count=len(chunk))
+        captured = np.fromiter((_ms(row[1]) if row[1] else np.nan for row in chunk),
+                               dtype=np.float64, count=len(chunk))
+        ir = np.array([row[2:] for row in chunk], dtype=np.int64).T
+        for c, (times, captures) in enumerate(found.values()):
+            if previous is None:
+                idx = rising_edges(ir[c])
+            else:                         # an edge may fall on the first row of this chunk
+                idx = rising_edges(np.r_[previous[c], ir[c]]) - 1
+            times.append(received[idx])
+            captures.append(captured[idx])
+        has_capture = ~np.isnan(captured)
+        offsets.extend((received[has_capture] - captured[has_capture])[-OFFSET_WINDOW:].tolist())
+        previous = ir[:, -1]
+    edges = {channel: (np.concatenate(times) if times else np.empty(0),
+                       np.concatenate(captures) if captures else np.empty(0))
+             for channel, (times, captures) in found.items()}
+    return edges, list(offsets)
+
+
+def _offset_summary(offsets):
+    if not offsets:
+        return {"samples": 0}
+    offsets = np.asarray(offsets, dtype=np.float64)
+    low, median = float(offsets.min()), float(np.median(offsets))
+    return {
+        "samples": int(len(offsets)),
+        "offset_ms": round(low, 3),            # clock offset + the smallest network delay
+        "median_delay_ms": round(median - low, 3),   # typical delay on top of that
+    }
+
+
+def window_stats(start, end, arduino_id, nodemcu_id, window_ms=None):
+    """
+    Latency distributions per IR channel (and both together) for [start, end),
+    plus each board's clock offset estimate from the end of the window.
+    """
+    window_ms = window_ms or pairing_window_ms()
+    a_edges, a_offsets = _scan(_rows("arduino", arduino_id, start, end))
+    n_edges, n_offsets = _scan(_rows("nodemcu", nodemcu_id, start, end))
+    channels, combined = {}, []
+    for channel in CHANNELS:
+        values = latencies(*a_edges[channel], *n_edges[channel], window_ms)
+        channels[channel] = summarize(values)
+        combined.append(values)
+    return {
+        "channels": channels,
+        "all": summarize(np.concatenate(combined)),
+        "offsets": {
+            arduino_id: _offset_summary(a_offsets),
+            nodemcu_id: _offset_summary(n_offsets),
+        },
+    }
+
+
+# ---------- incremental (live) engine ----------
+class _PairState:
+    __slots__ = ("pending", "ring", "count", "last")
+
+    def __init__(self):
+        # (channel, source) -> deque of unmatched edges (receive ms, capture ms or None)
+        self.pending = {}
+        self.ring = np.full(LIVE_SIZE, np.nan)
+        self.count = 0
+        self.last = None
+
+
+class Tracker:
+    def __init__(self, window_ms=2000):
+        self.window_ms = window_ms
+        self._lock = threading.Lock()
+        self._levels = {}                 # (source, sensor_id) -> (ir1, ir2)
+        self._pairs = {}                  # pair key -> _PairState
+        self._offsets = {}                # sensor_id -> deque of receive - capture (ms)
+        self.version = 0
+        self._summary = {}                # pair key -> (version, summary)
+
+    def observe(self, batches):
+        """Detect edges in newly arrived samples and pair them across sources."""
+        with self._lock:
+            for source, instances in batches.items():
+                for instance in instances:
+                    self._sample(source, instance)
+
+    def _sample(self, source, instance):
+        received = _ms(instance.server_receive_time)
+        captured = _ms(instance.device_capture_at) if instance.device_capture_at else None
+        if captured is not None:
+            offsets = self._offsets.get(instance.sensor_id)
+            if offsets is None:
+                offsets = self._offsets[instance.sensor_id] = deque(maxlen=OFFSET_WINDOW)
+            offsets.append(received - captured)
+
+        levels = (instance.ir1, instance.ir2)
+        previous = self._levels.get((source, instance.sensor_id))
+        self._levels[(source, instance.sensor_id)] = levels
+        if previous is None:
+            return
+        for channel, before, now in zip(CHANNELS, previous, levels):
+            if before <= 0 < now:
+                self._edge(pair_key(instance.sensor_id), channel, source, (received, captured))
+
+    def _edge(self, key, channel, source, edge):
+        state = self._pairs.get(key)
+        if state is None:
+            state = self._pairs[key] = _PairState()
+        other = state.pending.get((channel, "nodemcu" if source == "arduino" else "arduino"))
+        while other and edge[0] - other[0][0] > self.window_ms:
+            other.popleft()
+        if not other:
+            mine = state.pending.setdefault((channel, source), deque(maxlen=64))
+            mine.append(edge)
+            return
+        match = other.popleft()
+        a, n = (edge, match) if source == "arduino" else (match, edge)
+        if a[1] is not None and n[1] is not None:
+            value = a[1] - n[1]
+        else:
+            value = a[0] - n[0]
+        state.ring[state.count % LIVE_SIZE] = value
+        state.count += 1
+        state.last = value
+        self.version += 1
+
+    def pair_summary(self, key):
+        """Live figures for one board pair: last latency, distribution of the last LIVE_SIZE."""
+        with self._lock:
+            state = self._pairs.get(key)
+            if state is None or not state.count:
+                return {"pairs": 0, "last_ms": None}
+            cached = self._summary.get(key)
+            if cached and cached[0] == state.count:
+                return cached[1]
+            values = state.ring[:min(state.count, LIVE_SIZE)]
+            if state.count > LIVE_SIZE:     # oldest first, for jitter
+                values = np.roll(state.ring, -(state.count % LIVE_SIZE))
+            summary = {**summarize(values), "total_pairs": state.count,
+                       "last_ms": round(float(state.last), 3)}
+            self._summary[key] = (state.count, summary)
+            return summary
+
+    def offsets(self, sensor_id):
+        with self._lock:
+            return _offset_summary(list(self._offsets.get(sensor_id, ())))
+
+    def reset(self):
+        with self._lock:
+            self._levels.clear()
+            self._pairs.clear()
+            self._offsets.clear()
+            self._summary.clear()
+            self.version = 0
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_tracker():
+    """Process-wide tracker, created on first use from settings."""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = Tracker(window_ms=pairing_window_ms())
+    return _tracker
+
+
+def observe(batches):
+    get_tracker().observe(batches)
+
+
+def live_fields(nodemcu_id):
+    """latency_diff (newest pair) and latency (live p50), ms, for the dashboard payload."""
+    summary = get_tracker().pair_summary(pair_key(nodemcu_id)) if nodemcu_id else {}
+    last, p50 = summary.get("last_ms"), summary.get("p50_ms")
+    return {
+        "latency_diff": round(last, 1) if last is not None else None,
+        "latency": round(p50, 1) if p50 is not None else None,
+    }
@@ -0,0 +1,302 @@
+# iotdata/lineproto.py
+"""
+Line-protocol ingest over persistent TCP connections and UDP datagrams.
+
+The Arduino already prints a compact frame on its serial port; a board (or
+a NodeMCU relaying it) can send those frames to the listener as-is instead
+of wrapping every sample in JSON and a new HTTP request. Frames are ASCII
+and end with "Z"; whitespace and newlines between frames are ignored:
+
+    A<ir1>,<ir2>,<piezo>,<arduino_relay>,<piezo_relay>,<speed>Z   Arduino sample
+    N<ir1>,<ir2>,<nodemcu_relay>Z                               NodeMCU sample
+    I<nodemcu_id>,<arduino_id>Z     boards on this connection (default NMCU_01 / ARDU_01)
+    T<HH:MM:SS[.mmm]>Z              capture time for the samples that follow
+
+e.g. ``INMCU_01,ARDU_01Z T11:08:47Z A0,1,12,1,0,23.5Z N0,1,1Z``. Relays are
+0/1; IDs may not contain "Z". I and T apply per TCP connection or per UDP
+sender address; a UDP sender's state is forgotten after UDP_SENDER_IDLE
+seconds without a datagram, or when more than MAX_UDP_SENDERS addresses
+are known (least recently heard first). A malformed frame is counted and skipped; a run of more than
+MAX_FRAME bytes without a "Z" is dropped to resynchronise.
+
+Samples are buffered per sender and handed to ingest.accept() (the same
+storage, device registry, live cache, WebSocket push and relay-ack path as
+the upload views) every flush interval, one call per sender, on a worker
+thread. While a flush is behind by more than MAX_PENDING samples, TCP
+connections stop being read and UDP datagrams are dropped. close() stops
+the flush task and stores what is still buffered (line_server calls it on
+exit).
+"""
+import asyncio
+import math
+import time as clock
+from collections import OrderedDict
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+
+from . import ingest
+from .models import ArduinoData, NodeMCUData
+
+# Longest frame accepted (the NodeMCU's serial buffer is 120 bytes)
+MAX_FRAME = 128
+# Samples waiting for a flush before senders are throttled
+MAX_PENDING = 20000
+# UDP sender addresses whose I/T state is kept, and for how long (s) after
+# their last datagram; source ports change, so the table would otherwise
+# only grow
+MAX_UDP_SENDERS = 1024
+UDP_SENDER_IDLE = 600.0
+
+INT_RANGE = range(-2147483648, 2147483648)
+FLAGS = {b'0': False, b'1': True}
+
+
+class FrameError(ValueError):
+    pass
+
+
+class Sender:
+    """Per-connection (TCP) or per-address (UDP) parser state."""
+    __slots__ = ("ip", "nodemcu_id", "arduino_id", "capture", "tail", "seen")
+
+    def __init__(self, ip):
+        self.ip = ip
+        self.nodemcu_id = "NMCU_01"
+        self.arduino_id = "ARDU_01"
+        self.capture = None
+        self.tail = b''
+        self.seen = 0.0                   # monotonic time of the last UDP datagram
+
+
+def _int(field):
+    value = int(field)
+    if value not in INT_RANGE:
+        raise FrameError("integer out of range")
+    return value
+
+
+def _float(field):
+    value = float(field)
+    if not math.isfinite(value):
+        raise FrameError("not a finite number")
+    return value
+
+
+def _flag(field):
+    try:
+        return FLAGS[field]
+    except KeyError:
+        raise FrameError("relay must be 0 or 1") from None
+
+
+def _sensor_id(field):
+    value = field.decode('ascii')
+    if not value or len(value) > 10 or not value.isprintable():
+        raise FrameError("bad sensor id")
+    return value
+
+
+def parse_frame(frame, sender):
+    """
+    One frame without its "Z" -> (source, instance), or None for I/T frames
+    (which update ``sender``). Raises ValueError for malformed frames.
+    """
+    kind, fields = frame[:1], frame[1:].split(b',')
+    if kind == b'A':
+        if len(fields) != 6:
+            raise FrameError("A frame needs 6 fields")
+        return "arduino", ArduinoData(
+            sensor_id=sender.arduino_id, device_capture_time=sender.capture,
+            ir1=_int(fields[0]), ir2=_int(fields[1]), piezo=_float(fields[2]),
+            arduino_relay=_flag(fields[3]), piezo_relay=_flag(fields[4]),
+            speed=_float(fields[5]),
+        )
+    if kind == b'N':
+        if len(fields) != 3:
+            raise FrameError("N frame needs 3 fields")
+        return "nodemcu", NodeMCUData(
+            sensor_id=sender.nodemcu_id, device_capture_time=sender.capture,
+            ir1=_int(fields[0]), ir2=_int(fields[1]), nodemcu_relay=_flag(fields[2]),
+        )
+    if kind == b'I':
+        if len(fields) != 2:
+            raise FrameError("I frame needs 2 ids")
+        sender.nodemcu_id, sender.arduino_id = _sensor_id(fields[0]), _sensor_id(fields[1])
+        return None
+    if kind == b'T':
+        value = frame[1:].decode('ascii')
+        sender.capture = datetime.strptime(value, '%H:%M:%S.%f' if '.' in value else '%H:%M:%S').time()
+        return None
+    raise FrameError(f"unknown frame type {kind!r}")
+
+
+class LineServer:
+    def __init__(self, flush_interval=0.05):
+        self.flush_interval = flush_interval
+        self._pending = {}                # ip -> {source: [instances]}
+        self._pending_count = 0
+        self._paused = set()              # TCP transports waiting for a flush
+        self._flusher = None              # flush_forever() task, from start() until close()
+
+        # Counters (read via stats())
+        self.connections = 0
+        self.frames = 0
+        self.samples = 0
+        self.bad_frames = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    # ---------- parsing ----------
+    def feed(self, sender, data):
+        """Parse every complete frame in ``sender.tail + data``; keep the rest."""
+        buffer = sender.tail + data if sender.tail else data
+        start, size = 0, len(buffer)
+        batches = None
+        while start < size:
+            end = buffer.find(b'Z', start)
+            if end < 0:
+                break
+            frame = buffer[start:end].strip()
+            start = end + 1
+            if not frame:
+                continue
+            self.frames += 1
+            try:
+                parsed = parse_frame(frame, sender)
+            except ValueError as e:   # FrameError, int()/float()/strptime/decode failures
+                self._bad(sender, frame, e)
+                continue
+            if parsed is not None:
+                if batches is None:
+                    batches = self._pending.setdefault(sender.ip, {})
+                batches.setdefault(parsed[0], []).append(parsed[1])
+                self.samples += 1
+                self._pending_count += 1
+
+        sender.tail = buffer[start:]
+        if len(sender.tail) > MAX_FRAME:
+            self._bad(sender, sender.tail[:32], FrameError("no frame end"))
+            sender.tail = b''
+
+    def _bad(self, sender, frame, error):
+        self.bad_frames += 1
+        if self.bad_frames <= 10 or self.bad_frames % 1000 == 0:
+            print(f"[LINE] bad frame from {sender.ip} ({self.bad_frames} so far): {frame[:32]!r}: {error}")
+
+    @property
+    def backlogged(self):
+        return self._pending_count >= MAX_PENDING
+
+    # ---------- flushing ----------
+    def _store(self, pending):
+        for ip, batches in pending.items():
+            try:
+                ingest.accept(batches, client_ip=ip)
+            except Exception as e:
+                n = sum(len(instances) for instances in batches.values())
+                print(f"[LINE] storing {n} samples from {ip} failed: {e}")
+
+    async def flush(self):
+        pending, self._pending, self._pending_count = self._pending, {}, 0
+        if pending:
+            # Through sync_to_async so the WebSocket push in live.publish()
+            # runs on this event loop
+            await sync_to_async(self._store, thread_sensitive=False)(pending)
+            self.flushes += 1
+        for transport in self._paused:
+            if not transport.is_closing():
+                transport.resume_reading()
+        self._paused.clear()
+
+    async def flush_forever(self):
+        while True:
+            started = clock.monotonic()
+            await self.flush()
+            await asyncio.sleep(max(0.0, self.flush_interval - (clock.monotonic() - started)))
+
+    # ---------- listeners ----------
+    async def start(self, host, tcp_port=None, udp_port=None):
+        """Open the listeners and the flush task; returns what to close on exit."""
+        loop = asyncio.get_running_loop()
+        opened = []
+        if tcp_port is not None:
+            opened.append(await loop.create_server(lambda: _TCPProtocol(self), host, tcp_port))
+        if udp_port is not None:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(self), local_addr=(host, udp_port))
+            opened.append(transport)
+        self._flusher = loop.create_task(self.flush_forever())
+        return opened
+
+    async def close(self):
+        """Stop the flush task and store what is still buffered."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "connections": self.connections,
+            "frames": self.frames,
+            "samples": self.samples,
+            "bad_frames": self.bad_frames,
+            "dropped": self.dropped,
+            "pending": self._pending_count,
+            "flushes": self.flushes,
+        }
+
+
+class _TCPProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.sender = Sender(transport.get_extra_info('peername')[0])
+        self.server.connections += 1
+
+    def data_received(self, data):
+        self.server.feed(self.sender, data)
+        if self.server.backlogged:
+            self.transport.pause_reading()
+            self.server._paused.add(self.transport)
+
+    def connection_lost(self, exc):
+        self.server._paused.discard(self.transport)
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        self.senders = OrderedDict()      # (ip, port) -> Sender, least recently heard first
+
+    def datagram_received(self, data, addr):
+        if self.server.backlogged:
+            self.server.dropped += 1
+            return
+        sender = self._sender(addr)
+        self.server.feed(sender, data)
+        if sender.tail:                   # frames never span datagrams
+            self.server._bad(sender, sender.tail, FrameError("unterminated frame"))
+            sender.tail = b''
+
+    def _sender(self, addr):
+        now = clock.monotonic()
+        sender = self.senders.get(addr)
+        if sender is None:
+            sender = self.senders[addr] = Sender(addr[0])
+        else:
+            self.senders.move_to_end(addr)
+        sender.seen = now
+        # The newest sender is last, so this never empties the table
+        while True:
+            oldest = next(iter(self.senders.values()))
+            if len(self.senders) <= MAX_UDP_SENDERS and oldest.seen >= now - UDP_SENDER_IDLE:
+                return sender
+            self.senders.popitem(last=False)
@@ -0,0 +1,252 @@
+# iotdata/live.py
+"""
+Live dashboard state and WebSocket fan-out.
+
+The newest sample per source and per sensor_id is kept in memory. Ingest
+updates it through publish_samples(), which also pushes one update to the
+"dashboard" group that every DashboardConsumer has joined. /api/latest/,
+the consumer's initial snapshot and relay broadcasts all read from here, so
+the database is only touched once per sensor to warm the cache (a sensor_id
+with no rows is only remembered as empty if the device registry knows it,
+so polling made-up ids costs a query each but no memory). Board IP and
+connectivity come from the shared device registry (devices.py), latency_diff
+and latency from the live latency tracker (latency.py).
+
+Each sample is serialized to JSON once when it arrives; a /api/latest/ body
+is those fragments plus the few time-dependent fields, and its ETag changes
+only when one of those inputs does.
+
+The cache is per process: run one ASGI worker, or accept that each worker
+only sees the uploads it handled itself.
+"""
+import json
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+from . import devices, latency
+from .models import ArduinoData, NodeMCUData
+
+DASHBOARD_GROUP = "dashboard"
+
+# Seconds without NodeMCU data before a board is shown as disconnected
+CONNECTED_WINDOW = 5
+
+EMPTY_SAMPLE = {
+    "ir1": 0, "ir2": 0, "piezo": 0.0, "speed": 0.0,
+    "arduino_relay": False, "piezo_relay": False, "nodemcu_relay": False
+}
+EMPTY_FRAGMENT = json.dumps(EMPTY_SAMPLE, separators=(',', ':'))
+
+MODELS = {"arduino": ArduinoData, "nodemcu": NodeMCUData}
+
+
+class _Entry:
+    """Newest sample of one sensor, with its pre-serialized JSON."""
+    __slots__ = ("instance", "fragment", "version")
+
+    def __init__(self, instance, version):
+        self.instance = instance
+        self.fragment = json.dumps(format_sample(instance), separators=(',', ':'))
+        self.version = version
+
+
+_lock = threading.Lock()
+_version = 0
+# source -> {sensor_id: _Entry or None (known to have no rows)}
+_entries = {"arduino": {}, "nodemcu": {}}
+# source -> sensor_id of the most recently updated sensor
+_current = {"arduino": None, "nodemcu": None}
+_warmed = set()
+
+
+def format_sample(data):
+    if not data:
+        return dict(EMPTY_SAMPLE)
+    return {
+        "sensor_id": data.sensor_id,
+        "capture_time": str(data.device_capture_time) if data.device_capture_time else "N/A",
+        "receive_time": str(data.server_receive_time),
+        "ir1": getattr(data, 'ir1', 0),
+        "ir2": getattr(data, 'ir2', 0),
+        "piezo": float(getattr(data, 'piezo', 0.0)),
+        "speed": float(getattr(data, 'speed', 0.0)),
+        "arduino_relay": getattr(data, 'arduino_relay', False),
+        "piezo_relay": getattr(data, 'piezo_relay', False),
+        "nodemcu_relay": getattr(data, 'nodemcu_relay', False),
+    }
+
+
+# ---------- cache maintenance ----------
+def update(source, instance):
+    """Record ``instance`` as the newest sample of its sensor."""
+    global _version
+    with _lock:
+        _version += 1
+        _entries[source][instance.sensor_id] = _Entry(instance, _version)
+        _current[source] = instance.sensor_id
+
+
+def _warm(source, sensor_id=None):
+    """
+    Load the newest row from the DB the first time a source/sensor is asked
+    for; a sensor_id without rows is remembered only if a board reported it.
+    """
+    global _version
+    key = (source, sensor_id)
+    if key in _warmed:
+        return
+    model = MODELS[source]
+    qs = model.objects.all() if sensor_id is None else model.objects.filter(sensor_id=sensor_id)
+    try:
+        instance = qs.latest('server_receive_time')
+    except model.DoesNotExist:
+        instance = None
+
+    if instance is None and sensor_id is not None and devices.get(sensor_id) is None:
+        return
+    with _lock:
+        _warmed.add(key)
+        if instance is None:
+            if sensor_id is not None:
+                _entries[source].setdefault(sensor_id, None)
+            return
+        # Don't clobber anything ingest stored while we were querying
+        if instance.sensor_id not in _entries[source] or _entries[source][instance.sensor_id] is None:
+            _version += 1
+            _entries[source][instance.sensor_id] = _Entry(instance, _version)
+        if sensor_id is None and _current[source] is None:
+            _current[source] = instance.sensor_id
+
+
+def _entry(source, sensor_id=None):
+    if sensor_id is None:
+        if _current[source] is None:
+            _warm(source)
+        sensor_id = _current[source]
+        if sensor_id is None:
+            return None
+    elif sensor_id not in _entries[source]:
+        _warm(source, sensor_id)
+    return _entries[source].get(sensor_id)
+
+
+def reset():
+    """Forget everything (next read re-warms from the DB)."""
+    global _version
+    with _lock:
+        _version = 0
+        for source in _entries:
+            _entries[source].clear()
+            _current[source] = None
+        _warmed.clear()
+
+
+# ---------- payloads ----------
+def _status(nodemcu_entry):
+    """Connectivity of the shown NodeMCU, from the device registry (devices.py)."""
+    if nodemcu_entry:
+        device = devices.get(nodemcu_entry.instance.sensor_id)
+    else:
+        device = devices.newest("nodemcu")
+
+    if device:
+        seconds_ago = time.time() - device["last_seen"]
+    elif nodemcu_entry:
+        seconds_ago = (timezone.now() - nodemcu_entry.instance.server_receive_time).total_seconds()
+    else:
+        seconds_ago = None
+    return {
+        "nodemcu_ip": device["ip"] if device and device["ip"] else "Unknown",
+        "last_seen": seconds_ago,
+        "is_connected": seconds_ago is not None and seconds_ago < CONNECTED_WINDOW
+    }
+
+
+def latest_payload(arduino_id=None, nodemcu_id=None):
+    """The /api/latest/ response as a dict (for broadcasts)."""
+    arduino, nodemcu = _entry("arduino", arduino_id), _entry("nodemcu", nodemcu_id)
+    return {
+        "arduino": format_sample(arduino.instance if arduino else None),
+        "nodemcu": format_sample(nodemcu.instance if nodemcu else None),
+        **_status(nodemcu),
+        **latency.live_fields(nodemcu.instance.sensor_id if nodemcu else None),
+    }
+
+
+def latest_body(arduino_id=None, nodemcu_id=None):
+    """
+    The /api/latest/ response as (etag, JSON bytes), assembled from the
+    pre-serialized sample fragments.
+    """
+    arduino, nodemcu = _entry("arduino", arduino_id), _entry("nodemcu", nodemcu_id)
+    status = _status(nodemcu)
+    status.update(latency.live_fields(nodemcu.instance.sensor_id if nodemcu else None))
+    etag = 'W/"{}-{}-{}-{}-{}-{}"'.format(
+        arduino.version if arduino else 0,
+        nodemcu.version if nodemcu else 0,
+        int(status["is_connected"]),
+        status["nodemcu_ip"],
+        status["latency_diff"],
+        status["latency"],
+    )
+    body = '{"arduino":%s,"nodemcu":%s,%s' % (
+        arduino.fragment if arduino else EMPTY_FRAGMENT,
+        nodemcu.fragment if nodemcu else EMPTY_FRAGMENT,
+        json.dumps(status, separators=(',', ':'))[1:],
+    )
+    return etag, body.encode()
+
+
+# ---------- long-poll wake-ups ----------
+_stored = threading.Condition()
+
+
+def notify_stored():
+    """Wake long-polls; called once rows are committed (direct or write-behind)."""
+    with _stored:
+        _stored.notify_all()
+
+
+def wait_for_data(check, timeout, recheck=1.0):
+    """
+    Block until ``check()`` is true or ``timeout`` seconds pass. Wakes on
+    notify_stored() and re-checks every ``recheck`` seconds anyway, so rows
+    written by other processes are noticed too. Returns the last check().
+    """
+    deadline = time.monotonic() + timeout
+    while not check():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        with _stored:
+            _stored.wait(min(remaining, recheck))
+    return True
+
+
+# ---------- fan-out ----------
+def publish(payload):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        DASHBOARD_GROUP,
+        {"type": "dashboard_update", "data": payload}
+    )
+
+
+def publish_samples(batches):
+    """Cache the newest sample per sensor and push one update to the group."""
+    changed = False
+    for source, instances in batches.items():
+        newest = {}
+        for instance in instances:
+            newest[instance.sensor_id] = instance
+        for instance in newest.values():
+            update(source, instance)
+            changed = True
+    if changed:
+        publish(latest_payload())
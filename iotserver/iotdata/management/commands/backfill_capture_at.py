@@ -0,0 +1,21 @@
+# iotdata/management/commands/backfill_capture_at.py
+from django.core.management.base import BaseCommand
+
+from iotdata import latency, readings
+
+
+class Command(BaseCommand):
+    help = (
+        "Set device_capture_at on raw rows stored before it existed, from "
+        "device_capture_time and server_receive_time (see iotdata/latency.py). "
+        "Only rows still missing it are touched, so re-running is safe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=latency.BACKFILL_CHUNK)
+
+    def handle(self, *args, **opts):
+        updated = latency.backfill(chunk=opts['chunk'])
+        self.stdout.write(f"Stamped {updated['arduino']} arduino and {updated['nodemcu']} nodemcu rows")
+        if readings.is_enabled() and any(updated.values()):
+            self.stdout.write("Run sync_readings to copy the new capture times into readings")
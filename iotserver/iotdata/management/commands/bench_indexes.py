@@ -0,0 +1,89 @@
+# iotdata/management/commands/bench_indexes.py
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from iotdata.bench import scratch_database, seed_history, timed
+from iotdata.models import ArduinoData, NodeMCUData
+
+MODELS = (ArduinoData, NodeMCUData)
+
+
+def view_querysets(end):
+    """The querysets latest_data / recent_data_api run, keyed by a short label."""
+    qs = {}
+    for model in MODELS:
+        name = model.__name__
+        qs[f"{name}.latest"] = lambda m=model: m.objects.latest('server_receive_time')
+        qs[f"{name}.latest[sensor]"] = (
+            lambda m=model: m.objects.filter(sensor_id=m._meta.get_field('sensor_id').default)
+            .latest('server_receive_time')
+        )
+        for minutes in (5, 30, 60):
+            cutoff = end - timedelta(minutes=minutes)
+            qs[f"{name}.recent[{minutes}m]"] = (
+                lambda m=model, c=cutoff: list(
+                    m.objects.filter(server_receive_time__gte=c).order_by('server_receive_time')
+                )
+            )
+    return qs
+
+
+def set_indexes(enabled):
+    with connection.schema_editor() as editor:
+        for model in MODELS:
+            for index in model._meta.indexes:
+                if enabled:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with 1M/5M/10M rows per table and time the "
+        "querysets used by latest_data and recent_data_api with and without "
+        "the server_receive_time indexes. Never touches the real database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000000,5000000,10000000',
+                            help='Comma-separated row counts per table (ascending).')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--db-path', help='SQLite file for the scratch DB (default: temp dir).')
+        parser.add_argument('--json', dest='json_path', help='Write results to this JSON file.')
+
+    def handle(self, *args, **opts):
+        sizes = sorted(int(s) for s in opts['sizes'].split(','))
+        results = []
+
+        with scratch_database(opts['db_path']):
+            seeded, end = 0, None
+            for size in sizes:
+                # Seed without indexes (faster), time, then build them and time again
+                set_indexes(False)
+                self.stdout.write(f"Seeding {size:,} rows per table...")
+                for model in MODELS:
+                    end = seed_history(model, seeded, size, end=end)
+                seeded = size
+
+                for indexed in (False, True):
+                    if indexed:
+                        set_indexes(True)
+                    label = "indexed" if indexed else "no index"
+                    for name, fn in view_querysets(end).items():
+                        median_ms, min_ms, _ = timed(fn, opts['repeat'])
+                        results.append({
+                            "rows": size, "indexed": indexed, "query": name,
+                            "median_ms": round(median_ms, 3), "min_ms": round(min_ms, 3),
+                        })
+                        self.stdout.write(
+                            f"  {size:>11,}  {label:<8}  {name:<28} {median_ms:10.2f} ms"
+                        )
+
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as f:
+                json.dump({"vendor": connection.vendor, "results": results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {opts['json_path']}"))
@@ -0,0 +1,89 @@
+# iotdata/management/commands/bench_ingest.py
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+
+from iotdata import ingest, schema, views, writebehind
+from iotdata.bench import firmware_payload, scratch_database
+
+# label -> (upload view, validate_samples)
+PATHS = {
+    "drf": (views.upload_data, ingest.validate_samples),
+    "fast": (views.upload_fast, schema.validate_samples),
+}
+
+
+def cpu_per_call(calls, clock=time.thread_time):
+    """CPU microseconds of this thread per call, over every call in ``calls``."""
+    t0 = clock()
+    for call in calls:
+        call()
+    return (clock() - t0) * 1e6 / len(calls)
+
+
+class Command(BaseCommand):
+    help = (
+        "CPU per upload for the DRF upload view (api_view + serializers) and "
+        "the fast view (json.loads + compiled schema), on firmware bodies: "
+        "validation alone, the view with writes on the write-behind thread "
+        "(so only request-thread work is counted) and the view writing "
+        "directly to a scratch SQLite database. The WebSocket fan-out is left "
+        "out: it is the same code on both paths, and outside an ASGI server "
+        "async_to_sync() starts a thread per call that would dominate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--batch', type=int, default=1,
+                            help='Samples per source in each body (1 = firmware default).')
+        parser.add_argument('--json', dest='json_path', help='Write results to this JSON file.')
+
+    def handle(self, *args, **opts):
+        n = opts['requests']
+        rnd = random.Random(1)
+        bodies = []
+        for _ in range(n):
+            payloads = [firmware_payload(rnd) for _ in range(opts['batch'])]
+            bodies.append(payloads[0] if opts['batch'] == 1 else
+                          {s: [p[s] for p in payloads] for s in ("arduino", "nodemcu")})
+        raw = [json.dumps(body) for body in bodies]
+        factory = RequestFactory()
+        results = {}
+
+        def record(stage, label, us):
+            results.setdefault(stage, {})[label] = round(us, 2)
+
+        for label, (view, validate) in PATHS.items():
+            record("validate", label, cpu_per_call(
+                [lambda b=b: [validate(s, b[s]) for s in ("arduino", "nodemcu")] for b in bodies]))
+
+        with scratch_database():
+            for stage, settings_ in (("view, write-behind", {"IOTDATA_WRITE_BEHIND": True}),
+                                     ("view, direct write", {"IOTDATA_WRITE_BEHIND": False,
+                                                             "IOTDATA_SERIAL_WRITER": False})):
+                with override_settings(CHANNEL_LAYERS={}, **settings_):
+                    for label, (view, _) in PATHS.items():
+                        requests = [factory.post('/api/upload/', body, content_type='application/json')
+                                    for body in raw]
+                        statuses = set()
+                        calls = [lambda r=r: statuses.add(view(r).status_code) for r in requests]
+                        calls[0]()                     # warm-up (schema compile, first query)
+                        record(stage, label, cpu_per_call(calls[1:]))
+                        if statuses != {201}:
+                            self.stderr.write(f"{stage} {label}: unexpected statuses {statuses}")
+                        if writebehind.is_enabled():
+                            writebehind.get_buffer(ingest.write_samples).flush()
+
+        self.stdout.write(f"{n} uploads, {opts['batch']} sample(s) per source, CPU us per upload:")
+        for stage, by_path in results.items():
+            ratio = by_path["drf"] / by_path["fast"]
+            self.stdout.write(f"  {stage:<20} drf {by_path['drf']:9.1f}   fast {by_path['fast']:9.1f}"
+                              f"   x{ratio:5.2f}")
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as f:
+                json.dump({"options": {k: opts[k] for k in ('requests', 'batch')},
+                           "results": results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {opts['json_path']}"))
@@ -0,0 +1,72 @@
+# iotdata/management/commands/bench_metrics.py
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from iotdata import metrics, views
+from iotdata.bench import scratch_database
+
+
+def per_call_us(calls, *fns, repeats=5):
+    """
+    Best-of-``repeats`` wall time per call of each fn(), in microseconds.
+    The functions are timed in turn within each repeat so drift hits all alike.
+    """
+    best = [float('inf')] * len(fns)
+    for _ in range(repeats):
+        for i, fn in enumerate(fns):
+            t0 = time.perf_counter()
+            for _ in range(calls):
+                fn()
+            best[i] = min(best[i], time.perf_counter() - t0)
+    return [b * 1e6 / calls for b in best]
+
+
+class Command(BaseCommand):
+    help = (
+        "Overhead of the metrics layer (iotdata/metrics.py): counter and "
+        "histogram updates, the view wrapper around a no-op view, and "
+        "latest_data with and without its wrapper."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=100000)
+        parser.add_argument('--json', dest='json_path', help='Write results to this JSON file.')
+
+    def handle(self, *args, **opts):
+        n = opts['calls']
+        counter = metrics.Counter('bench_total', 'bench', ('view', 'status'))
+        histogram = metrics.Histogram('bench_seconds', 'bench', ('view',))
+        request = RequestFactory().get('/api/latest/')
+
+        def noop(request):
+            return HttpResponse()
+        wrapped = metrics.instrumented('bench')(noop)
+        latest = views.latest_data
+
+        results = {}
+        results["counter_inc"], results["histogram_observe"] = per_call_us(
+            n, lambda: counter.inc(('bench', 200)), lambda: histogram.observe(0.0123, ('bench',)))
+        results["noop_view"], results["noop_view_instrumented"] = per_call_us(
+            n, lambda: noop(request), lambda: wrapped(request))
+        with scratch_database():
+            latest(request)                   # warm the live cache
+            results["latest_data"], results["latest_data_instrumented"] = per_call_us(
+                n // 10, lambda: latest.__wrapped__(request), lambda: latest(request), repeats=10)
+        metrics.REGISTRY[:] = [m for m in metrics.REGISTRY if m not in (counter, histogram)]
+
+        self.stdout.write(f"{n} calls, wall us per call (best of several runs):")
+        for name, us in results.items():
+            self.stdout.write(f"  {name:<26} {us:8.3f}")
+        self.stdout.write(
+            f"  wrapper overhead: {results['noop_view_instrumented'] - results['noop_view']:.3f} us "
+            f"(no-op view), "
+            f"{results['latest_data_instrumented'] - results['latest_data']:.3f} us (latest_data)")
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as f:
+                json.dump({"options": {"calls": n},
+                           "results": {k: round(v, 3) for k, v in results.items()}}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {opts['json_path']}"))
@@ -0,0 +1,156 @@
+# iotdata/management/commands/bench_reads.py
+import json
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from iotdata import live
+from iotdata.bench import SAMPLE_INTERVAL_MS, scratch_database, seed_history
+from iotdata.models import ArduinoData, NodeMCUData
+from iotdata.rollups import update_rollups
+
+# analytics_full.html "timeRange" options, in minutes
+UI_WINDOWS = (5, 10, 30, 60, 360, 1440, 10080)
+
+# label -> (query string template, reads every raw row in the window)
+RECENT_VARIANTS = {
+    "recent.json": ("minutes={w}", True),
+    "recent.columnar": ("minutes={w}&format=columnar", True),
+    "recent.rollup": ("minutes={w}&max_points=1500", False),
+    "recent.lttb": ("minutes={w}&max_points=1500&downsample=lttb", True),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(client, url, repeat, before=None):
+    """
+    Request ``url`` ``repeat`` times (consuming streamed bodies) and return
+    median/min wall time, DB queries and body size of one request.
+    """
+    samples, queries, size, code = [], 0, 0, None
+    for _ in range(repeat):
+        if before:
+            before()
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            response = client.get(url)
+            body = (b''.join(response.streaming_content) if response.streaming
+                    else response.content)
+            samples.append((time.perf_counter() - t0) * 1000)
+        queries, size, code = len(ctx.captured_queries), len(body), response.status_code
+    return {
+        "status": code,
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "queries": queries,
+        "bytes": size,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a scratch database with synthetic ArduinoData/NodeMCUData "
+        "histories at several sizes and time /api/latest/ and /api/recent/ "
+        "(raw, columnar, rollup, LTTB) for every analytics window the UI "
+        "offers, counting DB queries per request. Never touches the real "
+        "database; --json output can be compared between commits with --baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100000,1000000',
+                            help='Comma-separated row counts per table (ascending).')
+        parser.add_argument('--windows', default=','.join(map(str, UI_WINDOWS)),
+                            help='Comma-separated window sizes in minutes.')
+        parser.add_argument('--sensors', type=int, default=1, help='Boards per source.')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--raw-limit', type=int, default=2000000,
+                            help='Skip raw-row variants for windows holding more rows than this.')
+        parser.add_argument('--db-path', help='SQLite file for the scratch DB (default: temp dir).')
+        parser.add_argument('--json', dest='json_path', help='Write results to this JSON file.')
+        parser.add_argument('--baseline', help='Earlier --json file to compare against.')
+
+    def handle(self, *args, **opts):
+        sizes = sorted(int(s) for s in opts['sizes'].split(','))
+        windows = [int(w) for w in opts['windows'].split(',')]
+        repeat = opts['repeat']
+        client = Client()
+        results = []
+
+        with scratch_database(opts['db_path']):
+            seeded, end = 0, None
+            for size in sizes:
+                self.stdout.write(f"Seeding {size:,} rows per table...")
+                for model in (ArduinoData, NodeMCUData):
+                    end = seed_history(model, seeded, size, end=end, sensors=opts['sensors'])
+                seeded = size
+                t0 = time.perf_counter()
+                update_rollups(since=end - timedelta(milliseconds=size * SAMPLE_INTERVAL_MS))
+                self.stdout.write(f"  rollups built in {time.perf_counter() - t0:.1f} s")
+
+                def record(endpoint, window, result):
+                    results.append({"rows": size, "endpoint": endpoint, "window_min": window,
+                                    **result})
+                    if result.get("skipped"):
+                        line = "skipped"
+                    else:
+                        line = (f"{result['median_ms']:10.2f} ms  {result['queries']:3d} queries  "
+                                f"{result['bytes']:>12,} B")
+                    self.stdout.write(f"  {size:>11,}  {endpoint:<16} {str(window or ''):>6}  {line}")
+
+                live.reset()
+                record("latest.cold", None, measure(client, '/api/latest/', repeat, before=live.reset))
+                record("latest.warm", None, measure(client, '/api/latest/', repeat))
+
+                for window in windows:
+                    window_rows = min(size, window * 60000 // SAMPLE_INTERVAL_MS)
+                    for endpoint, (query, reads_raw) in RECENT_VARIANTS.items():
+                        if reads_raw and window_rows > opts['raw_limit']:
+                            record(endpoint, window, {"skipped": True, "window_rows": window_rows})
+                            continue
+                        url = '/api/recent/?' + query.format(w=window)
+                        record(endpoint, window, measure(client, url, repeat))
+
+        report = {
+            "commit": _git_commit(),
+            "vendor": connection.vendor,
+            "created": timezone.now().isoformat(),
+            "options": {k: opts[k] for k in ('sizes', 'windows', 'sensors', 'repeat', 'raw_limit')},
+            "results": results,
+        }
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {opts['json_path']}"))
+        if opts['baseline']:
+            self.compare(opts['baseline'], report)
+
+    def compare(self, path, report):
+        with open(path) as f:
+            baseline = json.load(f)
+        key = lambda r: (r["rows"], r["endpoint"], r["window_min"])
+        before = {key(r): r for r in baseline["results"] if not r.get("skipped")}
+        self.stdout.write(f"\nCompared with {baseline.get('commit') or path}:")
+        for r in report["results"]:
+            old = before.get(key(r))
+            if old is None or r.get("skipped"):
+                continue
+            ratio = r["median_ms"] / old["median_ms"] if old["median_ms"] else float('inf')
+            self.stdout.write(
+                f"  {r['rows']:>11,}  {r['endpoint']:<16} {str(r['window_min'] or ''):>6}  "
+                f"{old['median_ms']:9.2f} -> {r['median_ms']:9.2f} ms  x{ratio:5.2f}  "
+                f"queries {old['queries']} -> {r['queries']}"
+            )
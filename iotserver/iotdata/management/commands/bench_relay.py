@@ -0,0 +1,77 @@
+# iotdata/management/commands/bench_relay.py
+import asyncio
+import json
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from iotdata import relay
+from iotdata.bench import RelayStub, percentiles
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark a \"common\" relay toggle against the local firmware stub: "
+        "the old sequential new-connection requests.get calls vs the pooled "
+        "concurrent dispatcher vs the asyncio dispatcher."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--latency-ms', type=float, default=20.0)
+        parser.add_argument('--hang-rate', type=float, default=0.0)
+        parser.add_argument('--timeout', type=float, default=0.5,
+                            help='Per-command timeout for every variant.')
+        parser.add_argument('--concurrent-stub', action='store_true',
+                            help='Let the stub serve requests in parallel.')
+        parser.add_argument('--json', dest='json_path')
+
+    def handle(self, *args, **opts):
+        stub = RelayStub(latency_ms=opts['latency_ms'], hang_rate=opts['hang_rate'],
+                         serial=not opts['concurrent_stub'])
+        device = f"127.0.0.1:{stub.start_in_thread()}"
+        n, timeout = opts['iterations'], opts['timeout']
+
+        def sequential(action):
+            # What control_relay did before: two blocking GETs, new connection each
+            for path in ("/relay/{}", "/relay/arduino/{}"):
+                try:
+                    requests.get(f"http://{device}{path.format(action)}", timeout=timeout)
+                except requests.RequestException:
+                    pass
+
+        def pooled(action):
+            relay.send_commands(device, "common", action, timeout=timeout)
+
+        def measure(fn):
+            samples = []
+            for i in range(n):
+                t0 = time.perf_counter()
+                fn("on" if i % 2 else "off")
+                samples.append((time.perf_counter() - t0) * 1000)
+            return samples
+
+        async def measure_async():
+            samples = []
+            for i in range(n):
+                t0 = time.perf_counter()
+                await relay.send_commands_async(device, "common", "on" if i % 2 else "off",
+                                                timeout=timeout)
+                samples.append((time.perf_counter() - t0) * 1000)
+            return samples
+
+        results = {
+            "sequential": percentiles(measure(sequential)),
+            "pooled_concurrent": percentiles(measure(pooled)),
+            "async": percentiles(asyncio.run(measure_async())),
+        }
+        for name, r in results.items():
+            self.stdout.write(f"{name:<18} p50 {r['p50_ms']:8.2f} ms   p95 {r['p95_ms']:8.2f} ms   "
+                              f"max {r['max_ms']:8.2f} ms")
+
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as f:
+                json.dump({"options": {k: opts[k] for k in ('iterations', 'latency_ms', 'hang_rate',
+                                                            'timeout', 'concurrent_stub')},
+                           "results": results}, f, indent=2)
@@ -0,0 +1,131 @@
+# iotdata/management/commands/bench_sqlite.py
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from iotdata import writer
+from iotdata.bench import firmware_payload, percentiles, scratch_database, seed_history
+from iotdata.models import ArduinoData, NodeMCUData
+
+# (label, SQLITE_PROFILES key, serialized writer)
+SCENARIOS = (
+    ("default journal, direct writes", "default", False),
+    ("production profile, direct writes", "production", False),
+    ("production profile, serial writer", "production", True),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent read/write throughput on a scratch SQLite file: writer "
+        "threads post firmware upload bodies to upload_data while reader "
+        "threads stream /api/recent/, once with the default journal and "
+        "direct writes, then with the production profile (WAL + pragmas) "
+        "with and without the serialized writer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per scenario.')
+        parser.add_argument('--history', type=int, default=50000,
+                            help='Rows per table seeded before each scenario.')
+        parser.add_argument('--read-minutes', type=int, default=5,
+                            help='Window the readers request from /api/recent/.')
+        parser.add_argument('--json', dest='json_path', help='Write results to this JSON file.')
+
+    def handle(self, *args, **opts):
+        results = []
+        options = connection.settings_dict['OPTIONS']
+        saved = dict(options)
+        try:
+            for label, profile, serial in SCENARIOS:
+                options.clear()
+                options.update(settings.SQLITE_PROFILES[profile])
+                connection.close()
+                with scratch_database(), override_settings(IOTDATA_SERIAL_WRITER=serial):
+                    for model in (ArduinoData, NodeMCUData):
+                        seed_history(model, 0, opts['history'])
+                    result = self.run_scenario(opts)
+                    writer.shutdown()
+                result = {"scenario": label, "profile": profile, "serial_writer": serial, **result}
+                results.append(result)
+                self.report(result)
+        finally:
+            options.clear()
+            options.update(saved)
+            connection.close()
+
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as f:
+                json.dump({"options": {k: opts[k] for k in ('writers', 'readers', 'duration',
+                                                            'history', 'read_minutes')},
+                           "results": results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {opts['json_path']}"))
+
+    def report(self, r):
+        self.stdout.write(r["scenario"])
+        for kind in ("writes", "reads"):
+            side = r[kind]
+            self.stdout.write(
+                f"  {kind:<6} {side['per_s']:8.1f}/s  errors {side['errors']:<5} "
+                f"p50 {side['latency']['p50_ms']} ms  p95 {side['latency']['p95_ms']} ms  "
+                f"p99 {side['latency']['p99_ms']} ms"
+            )
+
+    def run_scenario(self, opts):
+        stop_at = time.monotonic() + opts['duration']
+        read_url = f"/api/recent/?minutes={opts['read_minutes']}"
+        results = {"writes": [], "reads": []}
+        lock = threading.Lock()
+
+        def loop(kind, index):
+            client = Client(raise_request_exception=False)
+            rnd = random.Random(index)
+            latencies, outcomes = [], Counter()
+            try:
+                while time.monotonic() < stop_at:
+                    t0 = time.perf_counter()
+                    if kind == "writes":
+                        response = client.post('/api/upload/', firmware_payload(rnd, index + 1),
+                                               content_type='application/json')
+                    else:
+                        response = client.get(read_url)
+                        if response.streaming:
+                            b''.join(response.streaming_content)
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    outcomes[response.status_code] += 1
+            finally:
+                connection.close()
+            with lock:
+                results[kind].append((latencies, outcomes))
+
+        threads = [threading.Thread(target=loop, args=("writes", i)) for i in range(opts['writers'])]
+        threads += [threading.Thread(target=loop, args=("reads", i)) for i in range(opts['readers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        summary = {}
+        for kind, parts in results.items():
+            latencies = [ms for part, _ in parts for ms in part]
+            outcomes = sum((o for _, o in parts), Counter())
+            ok = sum(n for code, n in outcomes.items() if 200 <= code < 300)
+            summary[kind] = {
+                "ok": ok,
+                "errors": sum(outcomes.values()) - ok,
+                "per_s": round(ok / elapsed, 1),
+                "latency": percentiles(latencies),
+            }
+        summary["writer"] = writer.stats()
+        return summary
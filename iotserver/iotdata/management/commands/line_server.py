@@ -0,0 +1,96 @@
+# iotdata/management/commands/line_server.py
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from iotdata.lineproto import LineServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Listen for line-protocol sample frames (A...Z / N...Z, see "
+        "iotdata/lineproto.py) on TCP and UDP and store them through the "
+        "same pipeline as /api/upload/. The live cache and in-memory "
+        "channel layer are per process, so use --asgi to serve the Django "
+        "app from this process too (or configure a shared channel layer)."
+    )
+
+    def add_arguments(self, parser):
+        port = getattr(settings, 'IOTDATA_LINE_PORT', 9000)
+        parser.add_argument('--host', default='0.0.0.0')
+        parser.add_argument('--tcp-port', type=int, default=port)
+        parser.add_argument('--udp-port', type=int, default=port)
+        parser.add_argument('--no-tcp', action='store_true')
+        parser.add_argument('--no-udp', action='store_true')
+        parser.add_argument('--flush-ms', type=float,
+                            default=getattr(settings, 'IOTDATA_LINE_FLUSH_INTERVAL', 0.05) * 1000)
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help='Seconds between [LINE] counter lines (0 = off).')
+        parser.add_argument('--asgi', metavar='HOST:PORT',
+                            help='Also serve iotserver.asgi:application with daphne here.')
+
+    def handle(self, *args, **opts):
+        if opts['no_tcp'] and opts['no_udp']:
+            raise CommandError("Nothing to listen on (--no-tcp and --no-udp).")
+        server = LineServer(flush_interval=opts['flush_ms'] / 1000)
+
+        async def start():
+            await server.start(
+                opts['host'],
+                tcp_port=None if opts['no_tcp'] else opts['tcp_port'],
+                udp_port=None if opts['no_udp'] else opts['udp_port'],
+            )
+            listening = [f"tcp {opts['tcp_port']}"] * (not opts['no_tcp'])
+            listening += [f"udp {opts['udp_port']}"] * (not opts['no_udp'])
+            self.stdout.write(f"Line protocol on {opts['host']} ({', '.join(listening)}), "
+                              f"flushing every {opts['flush_ms']:g} ms")
+            if opts['stats_interval']:
+                asyncio.get_running_loop().create_task(report())
+
+        async def report():
+            while True:
+                await asyncio.sleep(opts['stats_interval'])
+                print("[LINE]", server.stats())
+
+        try:
+            if opts['asgi']:
+                self.serve_with_daphne(opts['asgi'], start)
+                # The reactor has stopped its event loop; run it once more
+                # to store what is still buffered
+                asyncio.get_event_loop().run_until_complete(server.close())
+            else:
+                asyncio.run(self.serve_forever(server, start))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Line protocol: {server.stats()}")
+
+    async def serve_forever(self, server, start):
+        try:
+            await start()
+            await asyncio.Event().wait()
+        finally:
+            # Ctrl-C cancels this task: store what is still buffered
+            await server.close()
+
+    def serve_with_daphne(self, address, start):
+        # Daphne runs Twisted on the asyncio reactor; the listeners are
+        # started on that same event loop once it is set up.
+        from daphne.endpoints import build_endpoint_description_strings
+        from daphne.server import Server
+
+        from iotserver.asgi import application
+
+        host, _, port = address.rpartition(':')
+        if not host or not port.isdigit():
+            raise CommandError("--asgi expects HOST:PORT")
+
+        def ready():
+            asyncio.get_event_loop().create_task(start())
+            self.stdout.write(f"Django (ASGI) on http://{address}/")
+
+        Server(
+            application=application,
+            endpoints=build_endpoint_description_strings(host=host, port=int(port)),
+            ready_callable=ready,
+        ).run()
@@ -0,0 +1,46 @@
+# iotdata/management/commands/prune_raw.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from iotdata import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive raw ArduinoData/NodeMCUData rows older than the retention "
+        "period (IOTDATA_RAW_RETENTION_DAYS or --days) to per-day, per-sensor "
+        "compressed .npz files and delete them in small chunks. Analytics reads "
+        "fall back to the archives for windows past the retention period."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float,
+                            help='Keep this many days of raw rows (overrides the setting).')
+        parser.add_argument('--chunk', type=int, help='Rows deleted per transaction.')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to sleep between delete chunks.')
+        parser.add_argument('--no-archive', action='store_true',
+                            help='Delete expired rows without exporting them.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the days that would be processed.')
+
+    def handle(self, *args, **opts):
+        days = opts['days'] if opts['days'] is not None else archive.retention_days()
+        if days is None:
+            raise CommandError("No retention period: set IOTDATA_RAW_RETENTION_DAYS or pass --days.")
+
+        if opts['dry_run']:
+            for day in archive.expired_days(days=days):
+                self.stdout.write(f"{day:%Y-%m-%d}")
+            return
+
+        t0 = time.perf_counter()
+        totals = archive.run_retention(
+            days=days, archive=not opts['no_archive'], chunk=opts['chunk'],
+            pause=opts['pause'], log=self.stdout.write,
+        )
+        self.stdout.write(
+            f"[RETENTION] {totals['days']} day(s), archived {totals['archived']} rows, "
+            f"deleted {totals['deleted']} rows in {time.perf_counter() - t0:.1f} s"
+        )
@@ -0,0 +1,45 @@
+# iotdata/management/commands/relay_stub.py
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from iotdata.bench import RelayStub
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the NodeMCU relay web server (/relay/on, "
+        "/relay/off, /relay/arduino/on|off) with configurable latency and "
+        "hangs. Point control_relay at it by posting from 127.0.0.1 or by "
+        "setting the device IP to host:port."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8080)
+        parser.add_argument('--latency-ms', type=float, default=20.0)
+        parser.add_argument('--jitter-ms', type=float, default=0.0)
+        parser.add_argument('--hang-rate', type=float, default=0.0,
+                            help='Fraction of requests that never get an answer.')
+        parser.add_argument('--concurrent', action='store_true',
+                            help='Serve requests concurrently (the ESP8266 serves one at a time).')
+        parser.add_argument('--no-keep-alive', action='store_true',
+                            help='Close the connection after every response.')
+
+    def handle(self, *args, **opts):
+        stub = RelayStub(
+            latency_ms=opts['latency_ms'], jitter_ms=opts['jitter_ms'],
+            hang_rate=opts['hang_rate'], serial=not opts['concurrent'],
+            keep_alive=not opts['no_keep_alive'],
+        )
+
+        async def main():
+            server = await stub.serve(opts['host'], opts['port'])
+            self.stdout.write(f"Relay stub listening on http://{opts['host']}:{opts['port']}/")
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            self.stdout.write(f"Served {stub.requests} requests")
@@ -0,0 +1,39 @@
+# iotdata/management/commands/rollup_catchup.py
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from iotdata.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring the 1 s / 1 min / 1 h SensorRollup tables up to date with the raw "
+        "sample tables. Use --follow to keep them current as data arrives."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep running and catch up every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=5.0)
+        parser.add_argument('--rebuild-hours', type=float,
+                            help='Rebuild the last N hours instead of resuming.')
+
+    def handle(self, *args, **opts):
+        since = None
+        if opts['rebuild_hours']:
+            since = timezone.now() - timedelta(hours=opts['rebuild_hours'])
+
+        while True:
+            t0 = time.perf_counter()
+            written = update_rollups(since=since)
+            elapsed = (time.perf_counter() - t0) * 1000
+            self.stdout.write(f"[ROLLUP] {written} buckets in {elapsed:.1f} ms")
+            if not opts['follow']:
+                break
+            since = None
+            close_old_connections()
+            time.sleep(opts['interval'])
@@ -0,0 +1,144 @@
+# iotdata/management/commands/simulate_devices.py
+import json
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from iotdata.bench import SAMPLE_INTERVAL_MS, firmware_payload, percentiles, scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate N NodeMCU+Arduino pairs posting sendCombinedData() bodies to "
+        "/api/upload/fast/ and report throughput, ingest latency percentiles and "
+        "error rates. Runs against a live server (--url) or in-process against "
+        "a scratch database (--in-process)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/upload/fast/')
+        parser.add_argument('--pairs', type=int, default=10, help='Simulated board pairs.')
+        parser.add_argument('--interval-ms', type=float, default=SAMPLE_INTERVAL_MS,
+                            help='Pause after each POST returns, like the firmware loop.')
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run.')
+        parser.add_argument('--timeout', type=float, default=10.0,
+                            help='HTTP timeout per POST (the firmware uses 10 s).')
+        parser.add_argument('--keep-alive', action='store_true',
+                            help='Reuse connections (the firmware opens one per POST).')
+        parser.add_argument('--in-process', action='store_true',
+                            help='Call upload_data through the test client on a scratch DB.')
+        parser.add_argument('--db-path', help='SQLite file for --in-process (default: temp dir).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help='Write the report to this JSON file.')
+
+    def handle(self, *args, **opts):
+        database = scratch_database(opts['db_path']) if opts['in_process'] else nullcontext()
+        with database:
+            report = self.simulate(opts)
+
+        self.stdout.write(
+            f"{report['pairs']} pairs @ {report['interval_ms']} ms for {report['duration_s']} s"
+            f" -> {report['requests']} POSTs, {report['throughput_rps']} req/s "
+            f"(target {report['target_rps']}), {report['samples_per_s']} samples/s"
+        )
+        latency = report['latency']
+        self.stdout.write(
+            f"latency p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms  "
+            f"p99 {latency['p99_ms']} ms  max {latency['max_ms']} ms"
+        )
+        self.stdout.write(
+            f"errors {report['errors']} ({report['error_rate'] * 100:.2f}%) "
+            f"{json.dumps(report['error_breakdown'])}"
+        )
+        if opts['json_path']:
+            with open(opts['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def simulate(self, opts):
+        interval = opts['interval_ms'] / 1000
+        results = [None] * opts['pairs']
+        started = time.monotonic()
+        stop_at = started + opts['duration']
+
+        def poster():
+            if opts['in_process']:
+                client = Client(raise_request_exception=False)
+                path = opts['url'] if opts['url'].startswith('/') else '/api/upload/fast/'
+                return lambda body: client.post(path, body, content_type='application/json').status_code
+            session = requests.Session() if opts['keep_alive'] else requests
+            headers = {'Content-Type': 'application/json'}
+
+            def post(body):
+                return session.post(opts['url'], data=body, headers=headers,
+                                    timeout=opts['timeout']).status_code
+            return post
+
+        def run(index):
+            pair = index + 1
+            rnd = random.Random(opts['seed'] * 1000 + pair)
+            post = poster()
+            latencies, outcomes = [], Counter()
+            next_send = started + rnd.uniform(0, interval)   # boards don't boot in lockstep
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now >= stop_at:
+                        break
+                    if next_send > now:
+                        time.sleep(next_send - now)
+                    body = json.dumps(firmware_payload(rnd, pair))
+                    t0 = time.perf_counter()
+                    try:
+                        outcome = post(body)
+                    except Exception as e:
+                        outcome = e.__class__.__name__
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    outcomes[outcome] += 1
+                    # Firmware: lastSend = millis() once the POST has returned
+                    next_send = time.monotonic() + interval
+            finally:
+                if opts['in_process']:
+                    connection.close()
+            results[index] = (latencies, outcomes)
+
+        threads = [threading.Thread(target=run, args=(i,), name=f"sim-pair-{i + 1}")
+                   for i in range(opts['pairs'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        latencies, outcomes = [], Counter()
+        for pair_latencies, pair_outcomes in results:
+            latencies.extend(pair_latencies)
+            outcomes.update(pair_outcomes)
+        total = sum(outcomes.values())
+        ok = sum(n for outcome, n in outcomes.items()
+                 if isinstance(outcome, int) and 200 <= outcome < 300)
+        errors = {str(outcome): n for outcome, n in outcomes.items()
+                  if not (isinstance(outcome, int) and 200 <= outcome < 300)}
+
+        return {
+            "target": "in-process" if opts['in_process'] else opts['url'],
+            "pairs": opts['pairs'],
+            "interval_ms": opts['interval_ms'],
+            "keep_alive": opts['keep_alive'],
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "ok": ok,
+            "errors": total - ok,
+            "error_rate": round((total - ok) / total, 4) if total else 0.0,
+            "error_breakdown": errors,
+            "target_rps": round(opts['pairs'] * 1000 / opts['interval_ms'], 1),
+            "throughput_rps": round(total / elapsed, 1),
+            "samples_per_s": round(ok * 2 / elapsed, 1),     # one arduino + one nodemcu sample
+            "latency": percentiles(latencies),
+        }
@@ -0,0 +1,28 @@
+# iotdata/management/commands/sync_readings.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from iotdata import readings
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy raw sample rows into the unified readings table (see "
+        "iotdata/readings.py): once after turning IOTDATA_UNIFIED_READINGS on, "
+        "or again after running with it off. Readings in the range are "
+        "replaced, so re-running is safe."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float,
+                            help='Only rows received in the last N hours (default: everything).')
+        parser.add_argument('--chunk', type=int, default=readings.CHUNK_SIZE)
+
+    def handle(self, *args, **opts):
+        since = None
+        if opts['hours']:
+            since = timezone.now() - timedelta(hours=opts['hours'])
+        copied = readings.resync(since, chunk=opts['chunk'])
+        self.stdout.write(f"Copied {sum(copied.values())} rows into readings")
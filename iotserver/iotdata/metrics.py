@@ -0,0 +1,282 @@
+# iotdata/metrics.py
+"""
+In-process counters and latency histograms, exported in the Prometheus text
+format (version 0.0.4) at /metrics.
+
+Hot-path updates are a dict lookup and an add under the metric's own lock
+(a bisect for histograms); label tuples are built by the caller and series
+appear on first use. Gauges are callbacks read at scrape time from the
+existing stats() functions. Values are per process: with several worker
+processes, scrape each one (or run one).
+
+/metrics answers only clients in IOTDATA_METRICS_ALLOWED_IPS (addresses or
+networks; localhost by default) and staff users. sensor_id comes from the
+boards, so at most IOTDATA_METRICS_MAX_SENSORS distinct values get their own
+series; samples of any further sensor are counted as OTHER_SENSOR.
+
+`manage.py bench_metrics` measures the per-request overhead of the view
+instrumentation.
+"""
+import functools
+import inspect
+import ipaddress
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; fits request handling, DB commits and relay round trips alike
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+# A client counts as polling /api/latest/ for this long after a request (s)
+POLLER_WINDOW = 60.0
+
+# sensor_id label of the samples of sensors past IOTDATA_METRICS_MAX_SENSORS
+OTHER_SENSOR = '[other]'
+
+REGISTRY = []
+
+
+def is_enabled():
+    return getattr(settings, 'IOTDATA_METRICS', True)
+
+
+def allowed_networks():
+    return [ipaddress.ip_network(value.strip(), strict=False)
+            for value in getattr(settings, 'IOTDATA_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+            if value.strip()]
+
+
+def may_scrape(client_ip):
+    """True if ``client_ip`` is in IOTDATA_METRICS_ALLOWED_IPS."""
+    try:
+        address = ipaddress.ip_address(client_ip)
+    except ValueError:
+        return False
+    return any(address in network for network in allowed_networks())
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _series(name, labels, values, extra=''):
+    pairs = [f'{label}="{_escape(value)}"' for label, value in zip(labels, values)]
+    if extra:
+        pairs.append(extra)
+    return f"{name}{{{','.join(pairs)}}}" if pairs else name
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, self._copy(value)) for key, value in self._values.items())
+        for key, value in items:
+            lines.extend(self._lines(key, value))
+        return lines
+
+    def _copy(self, value):
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def _lines(self, key, value):
+        return [f"{_series(self.name, self.labels, key)} {_number(value)}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.bounds = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [count per bucket (+Inf last), sum]
+                state = self._values[labels] = [[0] * (len(self.bounds) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def _copy(self, value):
+        return [list(value[0]), value[1]]
+
+    def _lines(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            lines.append(f"{_series(self.name + '_bucket', self.labels, key, le)} {cumulative}")
+        lines.append(f"{_series(self.name + '_sum', self.labels, key)} {_number(total)}")
+        lines.append(f"{_series(self.name + '_count', self.labels, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value(s) read at scrape time: ``callback`` returns a number or {labels: number}."""
+    kind = 'gauge'
+
+    def __init__(self, name, help, callback, labels=()):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def render(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"[METRICS] gauge {self.name} failed: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        lines += [f"{_series(self.name, self.labels, key)} {_number(value)}"
+                  for key, value in sorted(values.items()) if value is not None]
+        return lines
+
+
+def render():
+    """Every registered metric in the Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ---------- the metrics ----------
+REQUESTS = Counter('iotdata_http_requests_total', 'Requests handled, by view and status code.',
+                   ('view', 'status'))
+REQUEST_SECONDS = Histogram('iotdata_http_request_duration_seconds',
+                            'Time from view entry to response (streamed bodies excluded).',
+                            ('view',))
+SAMPLES = Counter('iotdata_samples_accepted_total', 'Samples accepted, by source and sensor.',
+                  ('source', 'sensor_id'))
+REJECTED = Counter('iotdata_samples_rejected_total', 'Samples that failed validation, by source.',
+                   ('source',))
+DB_WRITE_SECONDS = Histogram('iotdata_db_write_seconds',
+                             'Duration of one ingest write transaction (all sources).')
+DB_WRITE_ROWS = Counter('iotdata_db_write_rows_total', 'Rows written by ingest, by source.',
+                        ('source',))
+RELAY_SECONDS = Histogram('iotdata_relay_command_seconds',
+                          'Relay command round trip to the NodeMCU, by target and outcome.',
+                          ('target', 'outcome'))
+
+_sensor_labels = set()
+_sensor_labels_lock = threading.Lock()
+
+
+def sensor_label(sensor_id):
+    """``sensor_id``, or OTHER_SENSOR once IOTDATA_METRICS_MAX_SENSORS others have a series."""
+    if sensor_id in _sensor_labels:
+        return sensor_id
+    with _sensor_labels_lock:
+        if len(_sensor_labels) >= getattr(settings, 'IOTDATA_METRICS_MAX_SENSORS', 200):
+            return OTHER_SENSOR
+        _sensor_labels.add(sensor_id)
+    return sensor_id
+
+
+_pollers = {}                             # client IP -> last /api/latest/ request (monotonic)
+
+
+def note_poller(client_ip):
+    _pollers[client_ip] = time.monotonic()
+
+
+def _active_pollers():
+    cutoff = time.monotonic() - POLLER_WINDOW
+    for ip, seen in list(_pollers.items()):
+        if seen < cutoff:
+            _pollers.pop(ip, None)
+    return len(_pollers)
+
+
+def _stat(module_name, key):
+    def read():
+        from importlib import import_module
+        return import_module(f'iotdata.{module_name}').stats().get(key)
+    return read
+
+
+Gauge('iotdata_latest_pollers', f'Clients that requested /api/latest/ in the last {POLLER_WINDOW:g} s.',
+      _active_pollers)
+Gauge('iotdata_writebehind_queue_rows', 'Rows waiting in the write-behind queue.',
+      _stat('writebehind', 'queue_depth'))
+Gauge('iotdata_writer_queued_requests', 'Writes waiting for the serialized writer thread.',
+      _stat('writer', 'queued'))
+Gauge('iotdata_relay_pending_commands', 'Relay commands queued and not yet sent.',
+      _stat('relayqueue', 'pending'))
+Gauge('iotdata_relay_awaiting_ack', 'Relay commands sent and not yet confirmed by a sample.',
+      _stat('relayqueue', 'awaiting_ack'))
+
+
+# ---------- view instrumentation ----------
+def instrumented(name):
+    """Count and time a view (sync or async) as ``view=name``."""
+    def decorate(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if not is_enabled():
+                    return await view(request, *args, **kwargs)
+                started, code = time.perf_counter(), 500
+                try:
+                    response = await view(request, *args, **kwargs)
+                    code = response.status_code
+                    return response
+                finally:
+                    REQUEST_SECONDS.observe(time.perf_counter() - started, (name,))
+                    REQUESTS.inc((name, code))
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_enabled():
+                return view(request, *args, **kwargs)
+            started, code = time.perf_counter(), 500
+            try:
+                response = view(request, *args, **kwargs)
+                code = response.status_code
+                return response
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - started, (name,))
+                REQUESTS.inc((name, code))
+        return wrapper
+    return decorate
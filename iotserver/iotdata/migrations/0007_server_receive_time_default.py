@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iotdata', '0006_rename_timestamp_arduinodata_server_receive_time_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='arduinodata',
+            name='server_receive_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='nodemcudata',
+            name='server_receive_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
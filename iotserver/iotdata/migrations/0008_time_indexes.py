@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iotdata', '0007_server_receive_time_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='arduinodata',
+            index=models.Index(fields=['server_receive_time'], name='arduino_recv_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='arduinodata',
+            index=models.Index(fields=['sensor_id', 'server_receive_time'], name='arduino_sensor_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodemcudata',
+            index=models.Index(fields=['server_receive_time'], name='nodemcu_recv_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nodemcudata',
+            index=models.Index(fields=['sensor_id', 'server_receive_time'], name='nodemcu_sensor_time_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iotdata', '0008_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=10)),
+                ('sensor_id', models.CharField(max_length=10)),
+                ('resolution', models.PositiveIntegerField()),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('speed_min', models.FloatField(default=0.0)),
+                ('speed_max', models.FloatField(default=0.0)),
+                ('speed_sum', models.FloatField(default=0.0)),
+                ('piezo_min', models.FloatField(default=0.0)),
+                ('piezo_max', models.FloatField(default=0.0)),
+                ('piezo_sum', models.FloatField(default=0.0)),
+                ('ir1_on', models.PositiveIntegerField(default=0)),
+                ('ir2_on', models.PositiveIntegerField(default=0)),
+                ('relay_on', models.PositiveIntegerField(default=0)),
+                ('piezo_relay_on', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resolution', 'source', 'bucket_start'], name='rollup_window_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'sensor_id', 'resolution', 'bucket_start'), name='rollup_bucket_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iotdata', '0009_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arduinodata',
+            name='repeats',
+            field=models.PositiveIntegerField(db_default=1, default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='arduinodata',
+            name='run_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='nodemcudata',
+            name='repeats',
+            field=models.PositiveIntegerField(db_default=1, default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='nodemcudata',
+            name='run_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iotdata', '0010_delta_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='arduinodata',
+            name='device_capture_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='nodemcudata',
+            name='device_capture_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('iotdata', '0011_device_capture_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=10)),
+                ('sensor_id', models.CharField(max_length=10)),
+                ('time', models.BigIntegerField()),
+                ('values', models.BinaryField()),
+                ('repeats', models.PositiveIntegerField(db_default=1, default=1)),
+                ('run_until', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['time'], name='reading_time_idx'), models.Index(fields=['sensor_id', 'time'], name='reading_sensor_time_idx')],
+            },
+        ),
+    ]
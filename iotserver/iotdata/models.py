@@ -1,6 +1,7 @@
 # app_name/models.py
 
 from django.db import models
+from django.utils import timezone
 
 # --- ARDUINO DATA MODEL ---
 class ArduinoData(models.Model):
@@ -21,8 +22,26 @@ class ArduinoData(models.Model):
     arduino_relay = models.BooleanField(default=False)
     piezo_relay = models.BooleanField(default=False)
     
-    # Server Receive Time (Automatically set)
-    server_receive_time = models.DateTimeField(auto_now_add=True)
+    # Server Receive Time (set when the sample is accepted, not when it is
+    # written, so write-behind/batched inserts keep the real arrival time)
+    server_receive_time = models.DateTimeField(default=timezone.now, editable=False)
+
+    # device_capture_time placed on the calendar next to server_receive_time
+    # (full date, millisecond precision when the firmware sends it; see latency.py)
+    device_capture_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Change-only storage (see delta.py): identical consecutive samples this
+    # row stands for, and when the last of them arrived (null for 1)
+    repeats = models.PositiveIntegerField(default=1, db_default=1, editable=False)
+    run_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # latest('server_receive_time') and the minutes= range scans in the
+        # views, plus per-board lookups (live cache warm-up, multi-device)
+        indexes = [
+            models.Index(fields=['server_receive_time'], name='arduino_recv_time_idx'),
+            models.Index(fields=['sensor_id', 'server_receive_time'], name='arduino_sensor_time_idx'),
+        ]
 
     def __str__(self):
         return f"Arduino Data | Speed: {self.speed} km/h"
@@ -42,8 +61,84 @@ class NodeMCUData(models.Model):
     # Relay State
     nodemcu_relay = models.BooleanField(default=False)
     
-    # Server Receive Time (Automatically set)
-    server_receive_time = models.DateTimeField(auto_now_add=True)
+    # Server Receive Time (set when the sample is accepted, not when it is
+    # written, so write-behind/batched inserts keep the real arrival time)
+    server_receive_time = models.DateTimeField(default=timezone.now, editable=False)
+
+    # device_capture_time placed on the calendar next to server_receive_time
+    # (full date, millisecond precision when the firmware sends it; see latency.py)
+    device_capture_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Change-only storage (see delta.py): identical consecutive samples this
+    # row stands for, and when the last of them arrived (null for 1)
+    repeats = models.PositiveIntegerField(default=1, db_default=1, editable=False)
+    run_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['server_receive_time'], name='nodemcu_recv_time_idx'),
+            models.Index(fields=['sensor_id', 'server_receive_time'], name='nodemcu_sensor_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"NodeMCU Data | IR1: {self.ir1}"
+
+# --- PRE-AGGREGATED ROLLUPS (see rollups.py) ---
+class SensorRollup(models.Model):
+    # Bucket widths kept for every sensor, in seconds
+    RESOLUTIONS = (1, 60, 3600)
+
+    source = models.CharField(max_length=10)          # "arduino" / "nodemcu"
+    sensor_id = models.CharField(max_length=10)
+    resolution = models.PositiveIntegerField()         # bucket width in seconds
+    bucket_start = models.DateTimeField()
+
+    # Sums rather than means so coarser buckets can be built from finer ones
+    samples = models.PositiveIntegerField(default=0)
+    speed_min = models.FloatField(default=0.0)
+    speed_max = models.FloatField(default=0.0)
+    speed_sum = models.FloatField(default=0.0)
+    piezo_min = models.FloatField(default=0.0)
+    piezo_max = models.FloatField(default=0.0)
+    piezo_sum = models.FloatField(default=0.0)
+    ir1_on = models.PositiveIntegerField(default=0)     # samples with the beam blocked
+    ir2_on = models.PositiveIntegerField(default=0)
+    relay_on = models.PositiveIntegerField(default=0)   # arduino_relay / nodemcu_relay
+    piezo_relay_on = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['source', 'sensor_id', 'resolution', 'bucket_start'],
+                name='rollup_bucket_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['resolution', 'source', 'bucket_start'], name='rollup_window_idx'),
+        ]
+
+    def __str__(self):
+        return f"Rollup {self.source}/{self.sensor_id} {self.resolution}s @ {self.bucket_start}"
+
+# --- UNIFIED NARROW READINGS (see readings.py) ---
+class Reading(models.Model):
+    # One row per stored sample of any board type; the per-source readings
+    # are packed into ``values`` with the layout in readings.LAYOUTS, so a
+    # new board type needs a layout, not a table (or another query).
+    source = models.CharField(max_length=10)          # "arduino" / "nodemcu"
+    sensor_id = models.CharField(max_length=10)
+    time = models.BigIntegerField()                    # server receive time, us since the epoch
+    values = models.BinaryField()
+
+    # Change-only storage runs, as on the raw tables (run_until in us)
+    repeats = models.PositiveIntegerField(default=1, db_default=1)
+    run_until = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['time'], name='reading_time_idx'),
+            models.Index(fields=['sensor_id', 'time'], name='reading_sensor_time_idx'),
+        ]
 
     def __str__(self):
-        return f"NodeMCU Data | IR1: {self.ir1}"
\ No newline at end of file
+        return f"Reading {self.source}/{self.sensor_id} @ {self.time}"
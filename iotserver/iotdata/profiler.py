@@ -0,0 +1,305 @@
+# iotdata/profiler.py
+"""
+Opt-in sampling profiler for views.
+
+ProfilingMiddleware picks a fraction of the requests of each URL name
+(IOTDATA_PROFILE_RATES, e.g. {"upload_data": 0.01}) and runs their view
+with the request's thread registered here. One background thread reads the
+stack of every registered thread each IOTDATA_PROFILE_INTERVAL seconds
+(sys._current_frames(); no tracing hooks, so the profiled code runs at full
+speed) and counts it for the view. A request that is not picked costs a
+dict lookup and a random number, which keeps 1% sampling cheap enough to
+leave on in production.
+
+DRF responses are rendered and (under WSGI) streamed bodies are produced
+while the thread is registered, so JSON rendering and encoding are in the
+profile. Under ASGI streamed bodies are async iterators (see streaming.py)
+and only the view itself is profiled.
+Async views are not profiled: their time is spent on the event loop,
+shared with every other coroutine.
+
+Stacks are kept in memory per view, collapsed ("view;a;b;c count", the
+input of flamegraph.pl and speedscope), at most MAX_STACKS distinct ones
+per view. /api/profile/ (staff only) serves them and the top functions by
+self and total samples. Profiles are per process.
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from inspect import iscoroutinefunction
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# Distinct stacks kept per view; later new stacks are counted as OVERFLOW
+MAX_STACKS = 5000
+OVERFLOW = '[other stacks]'
+# Frames kept per stack, counted from the view down
+MAX_DEPTH = 200
+
+
+def rates():
+    """{url name: fraction of requests profiled}; "*" applies to the other views."""
+    return {name: float(rate) for name, rate in getattr(settings, 'IOTDATA_PROFILE_RATES', {}).items()
+            if rate and float(rate) > 0}
+
+
+def is_enabled():
+    return bool(rates())
+
+
+_labels = {}                              # code object -> "module:qualname"
+
+
+def _label(frame):
+    code = frame.f_code
+    label = _labels.get(code)
+    if label is None:
+        module = frame.f_globals.get('__name__', '?')
+        label = _labels[code] = f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+    return label
+
+
+class _ViewProfile:
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.requests = 0
+        self.seconds = 0.0                # time spent registered (view + rendering + streaming)
+
+
+class Profiler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.ticks = 0
+        self._active = {}                 # thread ident -> (view name, code of the frame stacks stop at)
+        self._views = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # ---------- registering request threads ----------
+    def _enter(self, name, marker):
+        self._active[threading.get_ident()] = (name, marker)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="view-profiler", daemon=True)
+                    self._thread.start()
+        self._wake.set()
+
+    def _leave(self, name, started):
+        self._active.pop(threading.get_ident(), None)
+        with self._lock:
+            self._view(name).seconds += time.perf_counter() - started
+
+    def call(self, name, view, request, args, kwargs):
+        """Run ``view`` (rendering its response) with this thread profiled as ``name``."""
+        with self._lock:
+            self._view(name).requests += 1
+        started = time.perf_counter()
+        self._enter(name, _CALL_CODE)
+        try:
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+        finally:
+            self._leave(name, started)
+        if getattr(response, 'streaming', False) and not response.is_async:
+            response.streaming_content = self._stream(name, response.streaming_content)
+        return response
+
+    def _stream(self, name, chunks):
+        # Registered only while producing a chunk: the server may send each
+        # one from a different thread, and waits on the client in between
+        chunks = iter(chunks)
+        while True:
+            started = time.perf_counter()
+            self._enter(name, _STREAM_CODE)
+            try:
+                chunk = next(chunks, None)
+            finally:
+                self._leave(name, started)
+            if chunk is None:
+                return
+            yield chunk
+
+    # ---------- sampling ----------
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            # Random phase, so requests shorter than the interval are still
+            # sampled in proportion to their duration
+            time.sleep(random.uniform(0, self.interval))
+            while self._active:
+                try:
+                    self._sample()
+                except Exception as e:
+                    print(f"[PROFILER] sample failed: {e}")
+                time.sleep(self.interval)
+
+    def _sample(self):
+        frames = sys._current_frames()
+        taken = []
+        for ident, (name, marker) in list(self._active.items()):
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None and frame.f_code is not marker and len(stack) < MAX_DEPTH:
+                stack.append(_label(frame))
+                frame = frame.f_back
+            if stack:
+                taken.append((name, ';'.join(reversed(stack))))
+        del frames
+        with self._lock:
+            self.ticks += 1
+            for name, stack in taken:
+                view = self._view(name)
+                if stack not in view.stacks and len(view.stacks) >= MAX_STACKS:
+                    stack = OVERFLOW
+                view.stacks[stack] += 1
+                view.samples += 1
+
+    def _view(self, name):
+        view = self._views.get(name)
+        if view is None:
+            view = self._views[name] = _ViewProfile()
+        return view
+
+    # ---------- reports ----------
+    def _snapshot(self, name=None):
+        with self._lock:
+            return {view_name: (view.requests, view.samples, view.seconds, Counter(view.stacks))
+                    for view_name, view in self._views.items() if name is None or view_name == name}
+
+    def collapsed(self, name=None):
+        """Collapsed stacks ("view;outer;...;inner count" lines) for one view or all."""
+        lines = []
+        for view_name, (_, _, _, stacks) in sorted(self._snapshot(name).items()):
+            lines += [f"{view_name};{stack} {count}" for stack, count in stacks.most_common()]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def report(self, name=None, top=20, sort='self'):
+        """Per view: requests and samples taken, plus the ``top`` functions by self (or total) samples."""
+        report = {}
+        for view_name, (requests, samples, seconds, stacks) in sorted(self._snapshot(name).items()):
+            report[view_name] = {
+                "requests": requests,
+                "samples": samples,
+                "seconds": round(seconds, 6),
+                "distinct_stacks": len(stacks),
+                "top": top_functions(stacks, top, sort),
+            }
+        return report
+
+    def reset(self, name=None):
+        with self._lock:
+            if name is None:
+                self._views.clear()
+            else:
+                self._views.pop(name, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "ticks": self.ticks,
+                "active": len(self._active),
+                "views": {name: {"requests": view.requests, "samples": view.samples}
+                          for name, view in self._views.items()},
+            }
+
+
+_CALL_CODE = Profiler.call.__code__
+_STREAM_CODE = Profiler._stream.__code__
+
+
+def top_functions(stacks, n=20, sort='self'):
+    """Functions of collapsed ``stacks`` ranked by samples in them (self) or under them (total)."""
+    own, under = Counter(), Counter()
+    total = sum(stacks.values()) or 1
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            under[frame] += count
+    if sort == 'total':
+        ranked = sorted(under, key=lambda f: (-under[f], -own[f], f))
+    else:
+        ranked = sorted(under, key=lambda f: (-own[f], -under[f], f))
+    return [{"function": f, "self": own[f], "total": under[f],
+             "self_pct": round(100.0 * own[f] / total, 1),
+             "total_pct": round(100.0 * under[f] / total, 1)} for f in ranked[:n]]
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = Profiler(getattr(settings, 'IOTDATA_PROFILE_INTERVAL', 0.001))
+    return _profiler
+
+
+def stats():
+    """Sampler counters, or {"enabled": False} when no view is profiled."""
+    if not is_enabled():
+        return {"enabled": False}
+    return {"enabled": True, "rates": rates(), **get_profiler().stats()}
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a sample of requests per URL name (see the module docstring).
+    Keep it last in MIDDLEWARE: its process_view runs the view itself, so
+    the process_view of every other middleware (CSRF checks) must come first.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.rates = rates()
+        if not self.rates:
+            raise MiddlewareNotUsed
+        self.default = self.rates.pop('*', 0.0)
+        self.get_response = get_response
+        self.profiler = get_profiler()
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            self.process_view = self._process_view_async
+        else:
+            self.process_view = self._process_view
+
+    def __call__(self, request):
+        # Async: returns get_response's coroutine, awaited by the caller
+        return self.get_response(request)
+
+    def _pick(self, request, view):
+        match = request.resolver_match
+        name = match.url_name or match.route
+        rate = self.rates.get(name, self.default)
+        if rate and random.random() < rate and not iscoroutinefunction(view):
+            return name
+        return None
+
+    def _process_view(self, request, view, args, kwargs):
+        name = self._pick(request, view)
+        if name is None:
+            return None
+        return self.profiler.call(name, view, request, args, kwargs)
+
+    async def _process_view_async(self, request, view, args, kwargs):
+        name = self._pick(request, view)
+        if name is None:
+            return None
+        # The thread Django would run the sync view in
+        return await sync_to_async(self.profiler.call, thread_sensitive=True)(
+            name, view, request, args, kwargs)
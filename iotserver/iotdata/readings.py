@@ -0,0 +1,256 @@
+# iotdata/readings.py
+"""
+Unified narrow readings table (models.Reading).
+
+With IOTDATA_UNIFIED_READINGS on, write_samples() also writes every stored
+row of every board type into one table: source, sensor_id, receive time as
+int64 microseconds and the readings packed with the source's struct layout
+in LAYOUTS. stream() then returns all sources as one time-ordered stream
+from a single indexed query (the time index, or (sensor_id, time) when
+filtering by board), with no padding for fields a source does not have.
+A new board type is one more LAYOUTS entry.
+
+The store is off by default. After turning it on, run `manage.py
+sync_readings` to copy the existing raw rows in id chunks; it also re-copies
+a time range (e.g. after running with the store off for a while). Retention
+prunes readings together with the raw rows. Rows folded by delta storage
+keep their repeats/run_until and are expanded on read like the raw tables.
+"""
+import heapq
+import struct
+import time as clock
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+
+from . import delta
+from .models import ArduinoData, NodeMCUData, Reading
+
+# source -> (raw model, ((field, struct code), ...)). Times are packed as
+# int64 microseconds (of the day / since the epoch), -1 for null.
+LAYOUTS = {
+    "arduino": (ArduinoData, (('device_capture_time', 'q'), ('device_capture_at', 'q'),
+                              ('ir1', 'i'), ('ir2', 'i'), ('piezo', 'd'), ('speed', 'd'),
+                              ('arduino_relay', '?'), ('piezo_relay', '?'))),
+    "nodemcu": (NodeMCUData, (('device_capture_time', 'q'), ('device_capture_at', 'q'),
+                              ('ir1', 'i'), ('ir2', 'i'), ('nodemcu_relay', '?'))),
+}
+
+# Rows per INSERT / per DELETE transaction when copying and pruning
+CHUNK_SIZE = 5000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+US = timedelta(microseconds=1)
+
+
+def is_enabled():
+    return getattr(settings, 'IOTDATA_UNIFIED_READINGS', False)
+
+
+def to_us(dt):
+    return (dt - EPOCH) // US
+
+
+def from_us(us):
+    return EPOCH + timedelta(microseconds=us)
+
+
+def _time_to_us(value):
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+
+def _time_from_us(us):
+    seconds, micro = divmod(us, 1000000)
+    minutes, second = divmod(seconds, 60)
+    return time(minutes // 60, minutes % 60, second, micro)
+
+
+# field -> (encode, decode) for values that are not stored as-is
+CONVERSIONS = {
+    'device_capture_time': (_time_to_us, _time_from_us),
+    'device_capture_at': (to_us, from_us),
+}
+
+
+class _Layout:
+    def __init__(self, fields):
+        self.names = tuple(name for name, _ in fields)
+        self.struct = struct.Struct('<' + ''.join(code for _, code in fields))
+        self.encoders = [CONVERSIONS[name][0] if name in CONVERSIONS else None for name in self.names]
+        self.decoders = [CONVERSIONS[name][1] if name in CONVERSIONS else None for name in self.names]
+
+    def pack(self, values):
+        packed = []
+        for value, encode in zip(values, self.encoders):
+            if encode is not None:
+                value = -1 if value is None else encode(value)
+            packed.append(value)
+        return self.struct.pack(*packed)
+
+    def unpack(self, data):
+        values = []
+        for value, decode in zip(self.struct.unpack(data), self.decoders):
+            if decode is not None:
+                value = None if value == -1 else decode(value)
+            values.append(value)
+        return values
+
+
+_layouts = {source: _Layout(fields) for source, (_, fields) in LAYOUTS.items()}
+
+
+def field_names(source):
+    return _layouts[source].names
+
+
+# ---------- writing ----------
+def from_rows(source, rows):
+    """Readings for raw rows given as (sensor_id, server_receive_time, *fields, repeats, run_until)."""
+    layout = _layouts[source]
+    return [
+        Reading(
+            source=source, sensor_id=row[0], time=to_us(row[1]),
+            values=layout.pack(row[2:-2]),
+            repeats=row[-2], run_until=to_us(row[-1]) if row[-1] is not None else None,
+        )
+        for row in rows
+    ]
+
+
+def write(batches):
+    """Mirror {source: [instances]} being written by ingest.write_samples()."""
+    readings = []
+    for source, instances in batches.items():
+        names = ('sensor_id', 'server_receive_time', *field_names(source), *delta.RUN_COLUMNS)
+        readings += from_rows(source, ([getattr(i, n) for n in names] for i in instances))
+    if readings:
+        Reading.objects.bulk_create(readings)
+
+
+def copy_rows(source, model, since=None, max_id=None, chunk=CHUNK_SIZE):
+    """
+    Copy raw ``model`` rows (received at/after ``since``, ids up to
+    ``max_id``) into readings in id order, one transaction per chunk;
+    returns rows copied.
+    """
+    names = ('id', 'sensor_id', 'server_receive_time', *field_names(source), *delta.RUN_COLUMNS)
+    qs = model.objects.all()
+    if since is not None:
+        qs = qs.filter(server_receive_time__gte=since)
+    if max_id is not None:
+        qs = qs.filter(id__lte=max_id)
+    copied, last_id = 0, 0
+    while True:
+        rows = list(qs.filter(id__gt=last_id).order_by('id').values_list(*names)[:chunk])
+        if not rows:
+            return copied
+        with transaction.atomic():
+            Reading.objects.bulk_create(from_rows(source, [row[1:] for row in rows]))
+        copied += len(rows)
+        last_id = rows[-1][0]
+
+
+def resync(since=None, chunk=CHUNK_SIZE, log=print):
+    """
+    Replace the readings received at/after ``since`` (all when None) with
+    fresh copies of the raw rows. Returns {source: rows copied}.
+    """
+    with transaction.atomic():
+        # One transaction: rows written from here on are mirrored by ingest
+        # and have ids above the ones recorded, so none is copied twice
+        stale = Reading.objects.all()
+        if since is not None:
+            stale = stale.filter(time__gte=to_us(since))
+        stale.delete()
+        max_ids = {source: model.objects.order_by('-id').values_list('id', flat=True).first()
+                   for source, (model, _) in LAYOUTS.items()}
+    copied = {}
+    for source, (model, _) in LAYOUTS.items():
+        copied[source] = 0
+        if max_ids[source] is not None:
+            copied[source] = copy_rows(source, model, since=since, max_id=max_ids[source], chunk=chunk)
+        log(f"[READINGS] {source}: copied {copied[source]}")
+    return copied
+
+
+def prune(start, end, chunk=None, pause=0.0):
+    """Delete readings received in [start, end) in id chunks; returns rows deleted."""
+    chunk = chunk or CHUNK_SIZE
+    expired = Reading.objects.filter(time__gte=to_us(start), time__lt=to_us(end))
+    deleted = 0
+    while True:
+        ids = list(expired.order_by().values_list('id', flat=True)[:chunk])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted += Reading.objects.filter(id__in=ids).delete()[0]
+        if pause:
+            clock.sleep(pause)
+
+
+# ---------- reading ----------
+def stream(start, end=None, sensor_ids=None, sources=None, after_id=0, cursor=None):
+    """
+    Samples of every source received in [start, end) as one time-ordered
+    stream of row dicts, from a single query. With ``after_id`` only
+    readings stored after that id are read; ``cursor`` (a one-item list)
+    is advanced to the highest id stored when the query started, so a
+    window with nothing new still moves it (see streaming.newest_id()).
+    """
+    newest = None
+    if cursor is not None:
+        newest = Reading.objects.order_by('-id').values_list('id', flat=True).first()
+    qs = Reading.objects.filter(time__gte=to_us(start))
+    if end is not None:
+        qs = qs.filter(time__lt=to_us(end))
+    if sensor_ids:
+        qs = qs.filter(sensor_id__in=sensor_ids)
+    if sources:
+        qs = qs.filter(source__in=sources)
+    if after_id:
+        qs = qs.filter(id__gt=after_id)
+    rows = (qs.order_by('time', 'id')
+            .values_list('id', 'source', 'sensor_id', 'time', 'values', 'repeats', 'run_until')
+            .iterator(chunk_size=CHUNK_SIZE))
+    for pk, source, sensor_id, ts, values in _in_time_order(rows):
+        if cursor is not None and pk > cursor[0]:
+            cursor[0] = pk
+        layout = _layouts.get(source)
+        if layout is None:
+            continue                      # rows of a board type this process has no layout for
+        row = {"source": source, "sensor_id": sensor_id}
+        for name, value in zip(layout.names, layout.unpack(values)):
+            if name == 'device_capture_time':
+                row["capture_time"] = str(value) if value is not None else None
+            elif name != 'device_capture_at':
+                row[name] = value
+        row["timestamp"] = ts.isoformat()
+        yield row
+    if newest is not None and newest > cursor[0]:
+        cursor[0] = newest
+
+
+def _in_time_order(rows):
+    """
+    Expand delta runs of rows ordered by start time, keeping the output in
+    time order: a run's later samples wait in a heap until no row still to
+    come can start before them (so it holds at most the open runs).
+    """
+    pending, seq = [], 0
+    for pk, source, sensor_id, t, values, repeats, until in rows:
+        start = from_us(t)
+        while pending and pending[0][0] <= start:
+            yield heapq.heappop(pending)[2]
+        if repeats == 1 or until is None:
+            if not pending:
+                yield pk, source, sensor_id, start, values
+                continue
+            samples = [(pk, source, sensor_id, start, values)]
+        else:
+            samples = delta.expand([(pk, source, sensor_id, start, values, repeats, from_us(until))], 3)
+        for sample in samples:
+            heapq.heappush(pending, (sample[3], seq, sample))
+            seq += 1
+    while pending:
+        yield heapq.heappop(pending)[2]
@@ -0,0 +1,228 @@
+# iotdata/relay.py
+"""
+Relay command dispatch to the NodeMCU's web server.
+
+Commands for one request are sent in parallel, each with its own deadline
+(IOTDATA_RELAY_TIMEOUT), so a "common" toggle costs one device round trip
+instead of two and a dead board costs one timeout instead of two.
+
+send_commands() is the blocking version used by control_relay: it keeps one
+requests.Session (keep-alive connection pool) per device and fans the
+commands out on a small shared thread pool.
+
+send_commands_async() is the coroutine version used by control_relay_async:
+a minimal HTTP/1.1 GET over asyncio streams with idle keep-alive
+connections pooled per device, so waiting on a board holds no thread.
+"""
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+# Firmware endpoints (see NodeMcuCode/nodemcu_received_data.ino)
+RELAY_PATHS = {
+    "nodemcu": "/relay/{action}",
+    "arduino": "/relay/arduino/{action}",
+}
+
+# control_relay "type" -> relays it drives
+TARGETS = {
+    "common": ("nodemcu", "arduino"),
+    "nodemcu": ("nodemcu",),
+    "arduino": ("arduino",),
+}
+
+DEVICE_PORT = 80
+
+
+def command_timeout():
+    return getattr(settings, 'IOTDATA_RELAY_TIMEOUT', 2.0)
+
+
+def _result(target, ok, started, error=None, status=None):
+    elapsed = time.perf_counter() - started
+    metrics.RELAY_SECONDS.observe(elapsed, (target, "ok" if ok else "error" if status else "failed"))
+    return {
+        "ok": ok,
+        "status": status,
+        "latency_ms": round(elapsed * 1000, 2),
+        "error": error,
+    }
+
+
+def _split(device):
+    host, _, port = device.partition(':')
+    return host, int(port) if port else DEVICE_PORT
+
+
+# ===================== blocking (thread pool + session pool) =====================
+_sessions = {}
+_sessions_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="relay")
+
+
+def _session(device):
+    with _sessions_lock:
+        session = _sessions.get(device)
+        if session is None:
+            session = requests.Session()
+            # ESP8266WebServer serves one client at a time; a couple of
+            # pooled connections per board is plenty.
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=0)
+            session.mount("http://", adapter)
+            _sessions[device] = session
+        return session
+
+
+def _send(device, target, action, timeout):
+    started = time.perf_counter()
+    url = f"http://{device}{RELAY_PATHS[target].format(action=action)}"
+    try:
+        response = _session(device).get(url, timeout=timeout)
+    except requests.RequestException as e:
+        return _result(target, False, started, error=str(e))
+    return _result(target, response.ok, started, status=response.status_code,
+                   error=None if response.ok else response.text[:100])
+
+
+def send_commands(device, relay_type, action, timeout=None):
+    """
+    Send ``action`` ("on"/"off") to every relay behind ``relay_type`` at
+    ``device`` ("host" or "host:port") concurrently. Returns
+    {target: {"ok", "status", "latency_ms", "error"}}.
+    """
+    return send_targets(device, {target: action for target in TARGETS[relay_type]}, timeout)
+
+
+def send_targets(device, actions, timeout=None):
+    """send_commands() for an explicit {target: action} mapping."""
+    timeout = timeout or command_timeout()
+    started = time.perf_counter()
+    futures = {
+        target: _executor.submit(_send, device, target, action, timeout)
+        for target, action in actions.items()
+    }
+    # requests enforces the per-command timeout; this is the overall backstop
+    wait(futures.values(), timeout=timeout * 2)
+    return {
+        target: future.result() if future.done()
+        else _result(target, False, started, error="deadline exceeded")
+        for target, future in futures.items()
+    }
+
+
+# ===================== async (asyncio streams + idle connection pool) =====================
+# event loop -> {(host, port): [(reader, writer), ...]} idle keep-alive
+# connections (streams belong to the loop that opened them)
+_idle = weakref.WeakKeyDictionary()
+
+
+def _pool(host, port):
+    return _idle.setdefault(asyncio.get_running_loop(), {}).setdefault((host, port), [])
+
+
+async def _read_chunked(reader):
+    """Read a chunked body to its end (trailers included)."""
+    while True:
+        size = int((await reader.readline()).split(b";")[0], 16)
+        if size:
+            await reader.readexactly(size + 2)      # chunk and its CRLF
+            continue
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        return
+
+
+async def _request(reader, writer, host, path, pool):
+    """
+    Send one GET on an open connection; returns the status code. The
+    connection goes back to ``pool`` only when the end of the body was known
+    (Content-Length, a chunked body read to its end, or a status without a
+    body); otherwise leftover bytes would be read as the next response.
+    """
+    try:
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode()
+        )
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by device")
+        status = int(status_line.split()[1])
+
+        length, chunked = None, False
+        keep_alive = status_line.startswith(b"HTTP/1.1")
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding":
+                chunked = value.endswith("chunked")
+            elif name == "connection":
+                keep_alive = value == "keep-alive" or (keep_alive and value != "close")
+        if chunked:
+            await _read_chunked(reader)
+        elif length is not None:
+            await reader.readexactly(length)
+        elif not (100 <= status < 200 or status in (204, 304)):
+            keep_alive = False            # body ends when the device closes
+    except BaseException:
+        writer.close()
+        raise
+
+    if keep_alive:
+        pool.append((reader, writer))
+    else:
+        writer.close()
+    return status
+
+
+async def _get(host, port, path):
+    """GET ``path``, reusing an idle connection to the device when there is one."""
+    pool = _pool(host, port)
+    while pool:
+        reader, writer = pool.pop()
+        if writer.is_closing() or reader.at_eof():
+            writer.close()
+            continue
+        try:
+            return await _request(reader, writer, host, path, pool)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            continue    # the device dropped this keep-alive connection
+    reader, writer = await asyncio.open_connection(host, port)
+    return await _request(reader, writer, host, path, pool)
+
+
+async def _send_async(device, target, action, timeout):
+    started = time.perf_counter()
+    host, port = _split(device)
+    path = RELAY_PATHS[target].format(action=action)
+    try:
+        status = await asyncio.wait_for(_get(host, port, path), timeout)
+    except asyncio.TimeoutError:
+        return _result(target, False, started, error=f"timed out after {timeout}s")
+    except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+        return _result(target, False, started, error=str(e) or e.__class__.__name__)
+    return _result(target, 200 <= status < 400, started, status=status)
+
+
+async def send_commands_async(device, relay_type, action, timeout=None):
+    """Coroutine version of send_commands()."""
+    timeout = timeout or command_timeout()
+    targets = TARGETS[relay_type]
+    results = await asyncio.gather(
+        *(_send_async(device, target, action, timeout) for target in targets)
+    )
+    return dict(zip(targets, results))
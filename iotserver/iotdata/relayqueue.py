@@ -0,0 +1,264 @@
+# iotdata/relayqueue.py
+"""
+Per-device relay command queue.
+
+control_relay no longer talks to the board itself: it records the requested
+state and returns a command ID straight away. One worker thread per device
+sends whatever is pending, so the ESP8266's single-threaded web server sees
+at most one round of requests at a time. A command that is still waiting
+when a newer one for the same relay arrives is marked "superseded" and never
+sent: ten quick clicks cost one request carrying the final state.
+
+A sent command stays "sent" until the next ArduinoData.arduino_relay /
+NodeMCUData.nodemcu_relay sample from that same board reports the requested
+state ("acked"), or until IOTDATA_RELAY_ACK_TIMEOUT passes without that
+("unconfirmed").
+
+Statuses: queued -> sending -> sent -> acked | unconfirmed, or queued ->
+superseded, or queued -> sending -> failed (the board did not answer).
+control_relay_async submits to the same queue when it is on.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import devices, relay
+
+# relay target -> (sample source, field that reports its state)
+ACK_FIELDS = {
+    "arduino": ("arduino", "arduino_relay"),
+    "nodemcu": ("nodemcu", "nodemcu_relay"),
+}
+
+# Finished commands kept around for status lookups
+HISTORY_SIZE = 1000
+
+# Worker threads exit after this long without work
+WORKER_IDLE = 30.0
+
+
+def is_enabled():
+    return getattr(settings, 'IOTDATA_RELAY_QUEUE', True)
+
+
+def ack_timeout():
+    return getattr(settings, 'IOTDATA_RELAY_ACK_TIMEOUT', 10.0)
+
+
+class Command:
+    __slots__ = ("id", "device", "target", "state", "status", "created", "sent_at",
+                 "acked_at", "result", "superseded_by")
+
+    def __init__(self, id, device, target, state):
+        self.id = id
+        self.device = device
+        self.target = target
+        self.state = state
+        self.status = "queued"
+        self.created = timezone.now()
+        self.sent_at = None          # time.monotonic() once sent
+        self.acked_at = None
+        self.result = None           # relay.send_targets() result
+        self.superseded_by = None
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "device": self.device,
+            "target": self.target,
+            "state": self.state,
+            "status": self.status,
+            "created": self.created.isoformat(),
+            "ack_ms": round((self.acked_at - self.sent_at) * 1000, 1) if self.acked_at else None,
+            "result": self.result,
+            "superseded_by": self.superseded_by,
+        }
+
+
+class RelayQueue:
+    def __init__(self, sender=relay.send_targets):
+        self.sender = sender              # callable(device, {target: action})
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._pending = {}                # device -> {target: Command}
+        self._awaiting = {}               # (device, target) -> sent Command
+        self._commands = OrderedDict()    # id -> Command
+        self._workers = {}                # device -> Thread
+
+        # Counters (read via stats())
+        self.submitted = 0
+        self.sent = 0
+        self.superseded = 0
+        self.acked = 0
+        self.failed = 0
+        self.unconfirmed = 0
+
+    # ---------- producer side ----------
+    def submit(self, device, relay_type, state):
+        """Queue ``state`` for every relay behind ``relay_type``; returns the Commands."""
+        commands = []
+        with self._cond:
+            pending = self._pending.setdefault(device, {})
+            for target in relay.TARGETS[relay_type]:
+                command = Command(next(self._ids), device, target, bool(state))
+                previous = pending.get(target)
+                if previous is not None:
+                    previous.status = "superseded"
+                    previous.superseded_by = command.id
+                    self.superseded += 1
+                pending[target] = command
+                self._remember(command)
+                commands.append(command)
+            self.submitted += len(commands)
+            self._ensure_worker(device)
+            self._cond.notify_all()
+        return commands
+
+    def _remember(self, command):
+        self._commands[command.id] = command
+        while len(self._commands) > HISTORY_SIZE:
+            self._commands.popitem(last=False)
+
+    # ---------- worker side ----------
+    def _ensure_worker(self, device):
+        worker = self._workers.get(device)
+        if worker is None or not worker.is_alive():
+            worker = threading.Thread(target=self._run, args=(device,),
+                                      name=f"relay-queue-{device}", daemon=True)
+            self._workers[device] = worker
+            worker.start()
+
+    def _run(self, device):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + WORKER_IDLE
+                while not self._pending.get(device):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        del self._workers[device]
+                        return
+                    self._cond.wait(remaining)
+                batch = self._pending.pop(device)
+                for command in batch.values():
+                    command.status = "sending"
+
+            results = self.sender(device, {
+                target: "on" if command.state else "off" for target, command in batch.items()
+            })
+
+            with self._cond:
+                now = time.monotonic()
+                for target, command in batch.items():
+                    command.result = results[target]
+                    if not command.result["ok"]:
+                        command.status = "failed"
+                        self.failed += 1
+                        print(f"[RELAY QUEUE] command {command.id} ({target} -> {command.state}) "
+                              f"failed: {command.result['error'] or command.result['status']}")
+                        continue
+                    command.status = "sent"
+                    command.sent_at = now
+                    self.sent += 1
+                    previous = self._awaiting.get((device, target))
+                    if previous is not None and previous.status == "sent":
+                        previous.status = "superseded"
+                        previous.superseded_by = command.id
+                        self.superseded += 1
+                    self._awaiting[(device, target)] = command
+
+    # ---------- acknowledgement ----------
+    def _expire(self, now):
+        timeout = ack_timeout()
+        for key, command in list(self._awaiting.items()):
+            if command.status != "sent":
+                del self._awaiting[key]
+            elif now - command.sent_at > timeout:
+                command.status = "unconfirmed"
+                self.unconfirmed += 1
+                del self._awaiting[key]
+
+    def observe(self, batches, client_ip=None):
+        """
+        Ack sent commands whose relay state shows up in newly ingested
+        samples from the board they were sent to: the upload's client_ip,
+        or (when unknown) the registered IP of the sample's sensor_id.
+        """
+        if not self._awaiting:
+            return
+        with self._cond:
+            now = time.monotonic()
+            self._expire(now)
+            for (device, target), command in list(self._awaiting.items()):
+                source, field = ACK_FIELDS[target]
+                sample = _last_from(device, batches.get(source), client_ip)
+                if sample is None:
+                    continue
+                if bool(getattr(sample, field)) == command.state:
+                    command.status = "acked"
+                    command.acked_at = now
+                    self.acked += 1
+                    del self._awaiting[(device, target)]
+
+    # ---------- lookups ----------
+    def get(self, command_id):
+        with self._cond:
+            self._expire(time.monotonic())
+            command = self._commands.get(command_id)
+            return command.as_dict() if command else None
+
+    def stats(self):
+        with self._cond:
+            self._expire(time.monotonic())
+            return {
+                "enabled": True,
+                "pending": sum(len(p) for p in self._pending.values()),
+                "awaiting_ack": len(self._awaiting),
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "superseded": self.superseded,
+                "acked": self.acked,
+                "failed": self.failed,
+                "unconfirmed": self.unconfirmed,
+            }
+
+
+def _last_from(device, instances, client_ip):
+    """Newest of ``instances`` that came from ``device`` (an IP), or None."""
+    if not instances:
+        return None
+    if client_ip is not None:
+        return instances[-1] if client_ip == device else None
+    for instance in reversed(instances):
+        record = devices.get(instance.sensor_id)
+        if record is not None and record["ip"] == device:
+            return instance
+    return None
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Process-wide queue, created on first use."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = RelayQueue()
+    return _queue
+
+
+def observe(batches, client_ip=None):
+    if _queue is not None:
+        _queue.observe(batches, client_ip)
+
+
+def stats():
+    if _queue is None:
+        return {"enabled": is_enabled(), "pending": 0, "awaiting_ack": 0}
+    return _queue.stats()
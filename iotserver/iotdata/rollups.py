@@ -0,0 +1,326 @@
+# iotdata/rollups.py
+"""
+Incremental 1 s / 1 min / 1 h rollups of the raw sample tables.
+
+update_rollups() is the catch-up job (run it from the ``rollup_catchup``
+management command, once or with --follow). For every source it re-aggregates
+raw rows from late_margin() before the newest 1 s bucket it already has
+(rows are committed after their receive time: write-behind flushes, delta
+runs, serial-writer groups, uploads waiting for the database lock), then builds
+the 1 min buckets from the 1 s ones and the 1 h buckets from the 1 min ones
+over the same range, one CATCH_UP_STEP slice at a time; empty slices are
+skipped by jumping to the next raw row. Buckets are upserted, so re-running is idempotent and
+the still-open bucket at the head is simply rewritten next time.
+
+recent_data_api uses pick_resolution() / rollup_rows() when a client passes
+?max_points= and the raw window would not fit in it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (Case, DateTimeField, ExpressionWrapper, F, FloatField, IntegerField,
+                              Max, Min, Q, Sum, When)
+from django.db.models.functions import TruncHour, TruncMinute, TruncSecond
+from django.utils import timezone
+
+from . import archive, delta, writebehind, writer
+from .models import ArduinoData, NodeMCUData, SensorRollup
+
+RAW_SOURCES = {
+    "arduino": (ArduinoData, "arduino_relay", "piezo_relay"),
+    "nodemcu": (NodeMCUData, "nodemcu_relay", None),
+}
+
+TRUNC = {1: TruncSecond, 60: TruncMinute, 3600: TruncHour}
+
+# Raw data is aggregated in slices of this size to bound memory
+CATCH_UP_STEP = timedelta(hours=1)
+# Longest a direct write may wait for the SQLite lock (busy timeout)
+LOCK_WAIT = timedelta(seconds=10)
+
+VALUE_FIELDS = [
+    'samples', 'speed_min', 'speed_max', 'speed_sum', 'piezo_min', 'piezo_max',
+    'piezo_sum', 'ir1_on', 'ir2_on', 'relay_on', 'piezo_relay_on',
+]
+
+
+# Raw rows are weighted by ``repeats`` (>1 for runs written by delta storage)
+def _flag(field):
+    return Sum(Case(When(**{field: True}, then=F('repeats')), default=0, output_field=IntegerField()))
+
+
+def _weighted(field, output_field):
+    return Sum(ExpressionWrapper(F(field) * F('repeats'), output_field=output_field))
+
+
+def _floor(dt, resolution):
+    """Start of the ``resolution``-second bucket containing ``dt`` (UTC aligned)."""
+    epoch = int(dt.timestamp())
+    return dt.fromtimestamp(epoch - epoch % resolution, tz=dt.tzinfo)
+
+
+def _upsert(rows):
+    if not rows:
+        return
+    SensorRollup.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['source', 'sensor_id', 'resolution', 'bucket_start'],
+        update_fields=VALUE_FIELDS,
+        batch_size=500,
+    )
+
+
+# ---------- building buckets ----------
+def _spans_seconds():
+    """Delta runs whose samples fall in more than one 1 s bucket."""
+    next_second = ExpressionWrapper(TruncSecond('server_receive_time') + timedelta(seconds=1),
+                                    output_field=DateTimeField())
+    return Q(repeats__gt=1, run_until__gte=next_second)
+
+
+def _spread_runs(model, names, start, end):
+    """
+    {(sensor_id, bucket): [samples, {field: value}...]} for the samples of
+    runs spanning several seconds that fall in [start, end), each run's
+    samples spread evenly between its first and last receive time as
+    delta.expand() does.
+    """
+    # A run never outlasts its heartbeat window, which bounds the index range
+    earliest = start - timedelta(seconds=delta.heartbeat())
+    runs = (model.objects
+            .filter(_spans_seconds(), server_receive_time__gte=earliest, server_receive_time__lt=end,
+                    run_until__gte=start)
+            .values_list('sensor_id', *names, 'server_receive_time', *delta.RUN_COLUMNS))
+    shares = {}
+    for sensor_id, *values, ts in delta.expand(runs, len(names) + 1):
+        if start <= ts < end:
+            key = (sensor_id, _floor(ts, 1))
+            share = shares.get(key)
+            if share is None:
+                share = shares[key] = []
+            share.append(dict(zip(names, values)))
+    return shares
+
+
+def _add_samples(bucket, samples, relay_field, piezo_relay_field, has_analog):
+    """Fold a run's ``samples`` (value dicts) into an aggregated 1 s ``bucket``."""
+    bucket["samples"] = (bucket.get("samples") or 0) + len(samples)
+    for s in samples:
+        bucket["ir1_on"] = (bucket.get("ir1_on") or 0) + s['ir1']
+        bucket["ir2_on"] = (bucket.get("ir2_on") or 0) + s['ir2']
+        bucket["relay_on"] = (bucket.get("relay_on") or 0) + bool(s[relay_field])
+        if piezo_relay_field:
+            bucket["piezo_relay_on"] = (bucket.get("piezo_relay_on") or 0) + bool(s[piezo_relay_field])
+        if has_analog:
+            for field in ('speed', 'piezo'):
+                low, high = bucket.get(f"{field}_min"), bucket.get(f"{field}_max")
+                bucket[f"{field}_min"] = s[field] if low is None else min(low, s[field])
+                bucket[f"{field}_max"] = s[field] if high is None else max(high, s[field])
+                bucket[f"{field}_sum"] = (bucket.get(f"{field}_sum") or 0.0) + s[field]
+
+
+def rollup_raw(source, start, end):
+    """
+    (Re)build the 1 s buckets of ``source`` for raw rows in [start, end).
+    Delta runs that span several seconds are split across the buckets their
+    samples fall in (see _spread_runs); every other row is aggregated in SQL.
+    """
+    model, relay_field, piezo_relay_field = RAW_SOURCES[source]
+    has_analog = source == "arduino"
+
+    aggregates = {
+        "samples": Sum('repeats'),
+        "ir1_on": _weighted('ir1', IntegerField()),
+        "ir2_on": _weighted('ir2', IntegerField()),
+        "relay_on": _flag(relay_field),
+    }
+    names = ['ir1', 'ir2', relay_field]
+    if has_analog:
+        aggregates.update(
+            speed_min=Min('speed'), speed_max=Max('speed'),
+            speed_sum=_weighted('speed', FloatField()),
+            piezo_min=Min('piezo'), piezo_max=Max('piezo'),
+            piezo_sum=_weighted('piezo', FloatField()),
+        )
+        names += ['speed', 'piezo']
+    if piezo_relay_field:
+        aggregates["piezo_relay_on"] = _flag(piezo_relay_field)
+        names.append(piezo_relay_field)
+
+    buckets = (
+        model.objects
+        .filter(server_receive_time__gte=start, server_receive_time__lt=end)
+        .exclude(_spans_seconds())
+        .annotate(bucket=TruncSecond('server_receive_time'))
+        .values('sensor_id', 'bucket')
+        .annotate(**aggregates)
+        .order_by()
+    )
+    merged = {}
+    for b in buckets:
+        merged[(b.pop('sensor_id'), b.pop('bucket'))] = b
+    for key, samples in _spread_runs(model, names, start, end).items():
+        _add_samples(merged.setdefault(key, {}), samples, relay_field, piezo_relay_field, has_analog)
+
+    rows = [
+        SensorRollup(
+            source=source, sensor_id=sensor_id, resolution=1, bucket_start=bucket,
+            **{k: v or 0 for k, v in b.items()},
+        )
+        for (sensor_id, bucket), b in merged.items()
+    ]
+    _upsert(rows)
+    return len(rows)
+
+
+def rollup_coarser(source, resolution, start, end):
+    """(Re)build ``resolution`` buckets from the next finer rollup level."""
+    finer = SensorRollup.RESOLUTIONS[SensorRollup.RESOLUTIONS.index(resolution) - 1]
+    buckets = (
+        SensorRollup.objects
+        .filter(source=source, resolution=finer,
+                bucket_start__gte=_floor(start, resolution), bucket_start__lt=end)
+        .annotate(bucket=TRUNC[resolution]('bucket_start'))
+        .values('sensor_id', 'bucket')
+        .annotate(
+            n=Sum('samples'),
+            s_min=Min('speed_min'), s_max=Max('speed_max'), s_sum=Sum('speed_sum'),
+            p_min=Min('piezo_min'), p_max=Max('piezo_max'), p_sum=Sum('piezo_sum'),
+            i1=Sum('ir1_on'), i2=Sum('ir2_on'), r=Sum('relay_on'), pr=Sum('piezo_relay_on'),
+        )
+        .order_by()
+    )
+    rows = [
+        SensorRollup(
+            source=source, sensor_id=b['sensor_id'], resolution=resolution,
+            bucket_start=b['bucket'], samples=b['n'],
+            speed_min=b['s_min'], speed_max=b['s_max'], speed_sum=b['s_sum'],
+            piezo_min=b['p_min'], piezo_max=b['p_max'], piezo_sum=b['p_sum'],
+            ir1_on=b['i1'], ir2_on=b['i2'], relay_on=b['r'], piezo_relay_on=b['pr'],
+        )
+        for b in buckets
+    ]
+    _upsert(rows)
+    return len(rows)
+
+
+def late_margin():
+    """How long after its receive time a raw row may still be committed."""
+    margin = LOCK_WAIT
+    if writer.is_enabled():
+        margin = max(margin, timedelta(seconds=getattr(settings, 'IOTDATA_SERIAL_WRITER_TIMEOUT', 10.0)))
+    if writebehind.is_enabled():
+        margin += timedelta(seconds=getattr(settings, 'IOTDATA_WRITE_BEHIND_FLUSH_INTERVAL', 0.5))
+    if delta.is_enabled():
+        margin += timedelta(seconds=delta.heartbeat())
+    return margin
+
+
+def _catch_up_start(source):
+    newest = (SensorRollup.objects.filter(source=source, resolution=1)
+              .order_by('-bucket_start').values_list('bucket_start', flat=True).first())
+    if newest is not None:
+        return _floor(newest - late_margin(), 1)
+    model = RAW_SOURCES[source][0]
+    oldest = (model.objects.order_by('server_receive_time')
+              .values_list('server_receive_time', flat=True).first())
+    return _floor(oldest, 1) if oldest else None
+
+
+def _next_row_time(source, after):
+    """Start of the 1 s bucket of the first raw row at/after ``after``, or None."""
+    model = RAW_SOURCES[source][0]
+    first = (model.objects.filter(server_receive_time__gte=after).order_by('server_receive_time')
+             .values_list('server_receive_time', flat=True).first())
+    return _floor(first, 1) if first else None
+
+
+def update_rollups(now=None, since=None):
+    """
+    Bring every rollup level up to date. ``since`` forces a rebuild from that
+    time; by default each source resumes late_margin() before its newest
+    1 s bucket, so rows committed after that bucket was built are counted.
+    Returns {source: buckets_written}.
+    """
+    now = now or timezone.now()
+    written = {}
+    for source in RAW_SOURCES:
+        start = since or _catch_up_start(source)
+        if start is None:
+            continue
+        total = 0
+        step_start = start
+        while step_start < now:
+            step_end = min(step_start + CATCH_UP_STEP, now + timedelta(seconds=1))
+            with transaction.atomic():
+                raw = rollup_raw(source, step_start, step_end)
+                if raw:
+                    total += raw
+                    for resolution in SensorRollup.RESOLUTIONS[1:]:
+                        total += rollup_coarser(source, resolution, step_start, step_end)
+            if not raw:
+                # Nothing in this slice: skip the gap to the next raw row
+                step_end = _next_row_time(source, step_end)
+                if step_end is None:
+                    break
+            step_start = step_end
+        written[source] = total
+    return written
+
+
+# ---------- reading ----------
+def pick_resolution(cutoff, now, max_points):
+    """
+    Finest level (None = raw rows) whose point count fits within
+    ``max_points``. Raw samples are counted per source, all its sensors
+    together, as one raw response carries them (rows, then repeats when the
+    rows alone fit, since delta runs expand; archived days included).
+    Rollup levels are estimated per sensor from the window length: buckets
+    are per sensor, like the LTTB series.
+    """
+    fits = True
+    edge = archive.horizon()
+    for source, (model, _, _) in RAW_SOURCES.items():
+        archived = 0
+        if edge and cutoff < edge:
+            archived = archive.count(source, cutoff, edge)
+        window = model.objects.filter(server_receive_time__gte=max(cutoff, edge or cutoff))
+        if (archived + window.count() > max_points
+                or archived + (window.aggregate(n=Sum('repeats'))['n'] or 0) > max_points):
+            fits = False
+            break
+    if fits:
+        return None
+    window = max((now - cutoff).total_seconds(), 1)
+    for resolution in SensorRollup.RESOLUTIONS:
+        if window / resolution <= max_points:
+            return resolution
+    return SensorRollup.RESOLUTIONS[-1]
+
+
+def rollup_rows(resolution, cutoff):
+    """Rollup buckets since ``cutoff`` shaped like recent_data_api's table_rows."""
+    rows = []
+    buckets = (SensorRollup.objects
+               .filter(resolution=resolution, bucket_start__gte=_floor(cutoff, resolution))
+               .order_by('bucket_start', 'source'))
+    for b in buckets:
+        n = b.samples or 1
+        relay_duty = b.relay_on / n
+        rows.append({
+            "source": b.source,
+            "sensor_id": b.sensor_id,
+            "timestamp": b.bucket_start.isoformat(),
+            "samples": b.samples,
+            "speed": b.speed_sum / n, "speed_min": b.speed_min, "speed_max": b.speed_max,
+            "piezo": b.piezo_sum / n, "piezo_min": b.piezo_min, "piezo_max": b.piezo_max,
+            # occupancy ratio / duty cycle in 0..1
+            "ir1": b.ir1_on / n,
+            "ir2": b.ir2_on / n,
+            "arduino_relay": relay_duty if b.source == "arduino" else 0.0,
+            "nodemcu_relay": relay_duty if b.source == "nodemcu" else 0.0,
+            "piezo_relay": b.piezo_relay_on / n,
+        })
+    return rows
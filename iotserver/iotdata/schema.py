@@ -0,0 +1,192 @@
+# iotdata/schema.py
+"""
+Precompiled sample validators for the fast upload path.
+
+The upload schema is fixed and tiny, so instead of running a serializer per
+sample, each source's serializer is read once and turned into a flat list
+of (field, check) pairs; a check converts a value the serializer would
+accept unchanged, or returns MISMATCH. Anything a check does not recognise
+(numbers sent as strings, unusual time formats, bad values...) is handed to
+the serializer itself, so the accepted inputs, converted values and error
+messages are exactly the serializer's; the compiled checks only short-cut
+the values the firmware actually sends.
+"""
+import math
+from datetime import time
+
+from django.core.validators import (MaxLengthValidator, MaxValueValidator, MinValueValidator,
+                                    ProhibitNullCharactersValidator)
+from rest_framework import fields
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import ProhibitSurrogateCharactersValidator
+
+from .ingest import MAX_BATCH_SIZE, SOURCES, BatchTooLarge
+
+MISMATCH = object()
+# Larger ints are left to the serializer (float() may overflow)
+MAX_EXACT_INT = 2 ** 53
+
+
+def _limit(field, validator_class, default):
+    for validator in field.validators:
+        if isinstance(validator, validator_class):
+            return validator.limit_value
+    return default
+
+
+def _char_check(field):
+    max_length = _limit(field, MaxLengthValidator, None)
+
+    def check(value):
+        if type(value) is not str:
+            return MISMATCH
+        value = value.strip() if field.trim_whitespace else value
+        # isascii/isprintable rule out NUL and surrogates (the other validators)
+        if not value or not value.isascii() or not value.isprintable():
+            return MISMATCH
+        if max_length is not None and len(value) > max_length:
+            return MISMATCH
+        return value
+    return check
+
+
+def _int_check(field):
+    low = _limit(field, MinValueValidator, -math.inf)
+    high = _limit(field, MaxValueValidator, math.inf)
+
+    def check(value):
+        if type(value) is not int or not low <= value <= high:
+            return MISMATCH
+        return value
+    return check
+
+
+def _float_check(field):
+    def check(value):
+        if type(value) is float:
+            return value if math.isfinite(value) else MISMATCH
+        if type(value) is not int or not -MAX_EXACT_INT <= value <= MAX_EXACT_INT:
+            return MISMATCH               # huge ints overflow float(): the serializer's error
+        return float(value)
+    return check
+
+
+def _bool_check(field):
+    def check(value):
+        if value is True or value is False:
+            return value
+        return MISMATCH
+    return check
+
+
+def _time_check(field):
+    # Only "HH:MM:SS" and "HH:MM:SS.mmm" with two-digit parts are parsed
+    # here; other spellings strptime accepts ("9:5:3") go to the serializer
+    formats = set(getattr(field, 'input_formats', ()))
+    if not formats or not formats <= {'%H:%M:%S', '%H:%M:%S.%f'}:
+        return None
+    lengths = {8: '%H:%M:%S' in formats, 12: '%H:%M:%S.%f' in formats}
+
+    def check(value):
+        if type(value) is not str or not lengths.get(len(value)) or value[2] != ':' or value[5] != ':':
+            return MISMATCH
+        digits = value[:2] + value[3:5] + value[6:8]
+        if len(value) == 12:
+            if value[8] != '.':
+                return MISMATCH
+            digits += value[9:]
+        if not digits.isascii() or not digits.isdigit():
+            return MISMATCH
+        hh, mm, ss = int(digits[:2]), int(digits[2:4]), int(digits[4:6])
+        if hh > 23 or mm > 59 or ss > 59:
+            return MISMATCH
+        return time(hh, mm, ss, int(digits[6:] or 0) * 1000)
+    return check
+
+
+# serializer field class (exact type) -> check factory
+CHECKS = {
+    fields.CharField: _char_check,
+    fields.IntegerField: _int_check,
+    fields.FloatField: _float_check,
+    fields.BooleanField: _bool_check,
+    fields.TimeField: _time_check,
+}
+
+# Field validators the checks above enforce themselves
+KNOWN_VALIDATORS = (MaxLengthValidator, MaxValueValidator, MinValueValidator,
+                    ProhibitNullCharactersValidator, ProhibitSurrogateCharactersValidator)
+
+
+def _compile_field(field):
+    factory = CHECKS.get(type(field))
+    if factory is None or field.read_only:
+        return None
+    if not all(isinstance(v, KNOWN_VALIDATORS) for v in field.validators):
+        return None
+    return factory(field)
+
+
+class CompiledSchema:
+    """Fast validator for one serializer class; see the module docstring."""
+
+    def __init__(self, serializer_class):
+        self.serializer = serializer_class()
+        self.checks = []
+        for name, field in self.serializer.fields.items():
+            check = _compile_field(field)
+            if check is None:
+                # A field type the fast path does not know: always validate
+                # with the serializer rather than guess its rules
+                self.checks = None
+                break
+            self.checks.append((name, check, field.allow_null))
+
+    def validate(self, sample):
+        """Validated data for ``sample`` (raises ValidationError like the serializer)."""
+        if self.checks is not None and type(sample) is dict:
+            validated = {}
+            for name, check, allow_null in self.checks:
+                value = sample.get(name, MISMATCH)
+                if value is MISMATCH:
+                    continue                      # not sent: the model default applies
+                if value is None and allow_null:
+                    validated[name] = None
+                    continue
+                value = check(value) if value is not None else MISMATCH
+                if value is MISMATCH:
+                    break
+                validated[name] = value
+            else:
+                return validated
+        return self.serializer.run_validation(sample)
+
+
+_schemas = {}
+
+
+def get_schema(source):
+    schema = _schemas.get(source)
+    if schema is None:
+        schema = _schemas[source] = CompiledSchema(SOURCES[source][1])
+    return schema
+
+
+def validate_samples(source, samples):
+    """Drop-in for ingest.validate_samples() using the compiled schema."""
+    model = SOURCES[source][0]
+    if not isinstance(samples, list):
+        samples = [samples]
+    if len(samples) > MAX_BATCH_SIZE:
+        raise BatchTooLarge(f"{source}: {len(samples)} samples (max {MAX_BATCH_SIZE})")
+
+    schema = get_schema(source)
+    instances, errors = [], []
+    for index, sample in enumerate(samples):
+        try:
+            validated = schema.validate(sample)
+        except ValidationError as exc:
+            errors.append({"index": index, "errors": exc.detail})
+            continue
+        instances.append(model(**validated))
+    return instances, errors
@@ -4,7 +4,7 @@ from .models import ArduinoData, NodeMCUData
 
 class ArduinoDataSerializer(serializers.ModelSerializer):
     device_capture_time = serializers.TimeField(
-        input_formats=['%H:%M:%S'],  # Accepts "11:08:47" from NTP
+        input_formats=['%H:%M:%S', '%H:%M:%S.%f'],  # Accepts "11:08:47" / "11:08:47.250" from NTP
         required=False,
         allow_null=True
     )
@@ -19,7 +19,7 @@ class ArduinoDataSerializer(serializers.ModelSerializer):
 
 class NodeMCUDataSerializer(serializers.ModelSerializer):
     device_capture_time = serializers.TimeField(
-        input_formats=['%H:%M:%S'],
+        input_formats=['%H:%M:%S', '%H:%M:%S.%f'],
         required=False,
         allow_null=True
     )
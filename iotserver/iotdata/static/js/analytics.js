@@ -43,29 +43,42 @@ function createSkeletonPlots() {
     });
 }
 
+// Points per series; longer windows are downsampled on the server (LTTB)
+const MAX_POINTS = 1500;
+
 function loadAllData() {
     const minutes = document.getElementById("timeRange").value;
-    fetch(`/api/recent/?minutes=${minutes}`)
+    fetch(`/api/recent/?minutes=${minutes}&max_points=${MAX_POINTS}&downsample=lttb`)
         .then(r => r.json())
         .then(updatePlots)
         .catch(() => console.warn("No data"));
 }
 
-function updatePlots(data) {
-    if (!data || !data.table_rows || data.table_rows.length === 0) return;
+// Downsampled responses come as per-field series instead of table_rows
+function speedSeries(data) {
+    if (data.series) {
+        const board = Object.values(data.series.arduino || {})[0];
+        if (!board) return null;
+        return { x: board.speed.timestamp.map(t => new Date(t)), y: board.speed.values };
+    }
+    const arduino = (data.table_rows || []).filter(r => r.source === "arduino");
+    if (arduino.length === 0) return null;
+    return { x: arduino.map(d => new Date(d.timestamp)), y: arduino.map(d => d.speed) };
+}
 
-    const rows = data.table_rows;
-    const arduino = rows.filter(r => r.source === "arduino");
-    const nodemcu = rows.filter(r => r.source === "nodemcu");
+function updatePlots(data) {
+    if (!data) return;
+    const speed = speedSeries(data);
+    if (!speed) return;
 
     Plotly.react("speed-plot", [{
-        x: arduino.map(d => new Date(d.timestamp)),
-        y: arduino.map(d => d.speed),
+        x: speed.x,
+        y: speed.y,
         mode: "lines+markers",
         line: { color: "#00ff9d", width: 4 }
     }], { paper_bgcolor: 'rgba(0,0,0,0)', font: { color: "#e2e8f0" } });
 
-    const latest = arduino[arduino.length - 1] || { speed: 0 };
+    const latest = { speed: speed.y.length ? speed.y[speed.y.length - 1] : 0 };
 
     Plotly.react("speed-gauge", [{
         type: "indicator",
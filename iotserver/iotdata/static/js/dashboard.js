@@ -129,9 +129,8 @@ function updateGauges(speed, piezo) {
 }
 
 
-// POLLING LOOP
-setInterval(async () => {
-    const data = await fetchLatestData();
+// LIVE UPDATES (pushed over WebSocket, polled only as a fallback)
+function renderLatest(data) {
     if(data){
         // Connection
         const isConnected = data.is_connected;
@@ -158,7 +157,9 @@ setInterval(async () => {
 
         // Lights (sync code same as before)...
     }
-}, fetchInterval);
+}
+
+subscribeLatest(renderLatest, fetchInterval);
 
 window.onload = function(){
     initGauges();
@@ -0,0 +1,45 @@
+// Live feed for the dashboards: WebSocket pushes from /ws/dashboard/, with
+// polling of /api/latest/ only while the socket is down (e.g. when the
+// server runs under plain WSGI).
+function subscribeLatest(onData, pollInterval = 800) {
+    let pollTimer = null;
+    let retryDelay = 1000;
+
+    function poll() {
+        fetch('/api/latest/')
+            .then(r => r.ok ? r.json() : null)
+            .then(d => { if (d) onData(d); })
+            .catch(err => console.error("Fetch failed:", err));
+    }
+
+    function startPolling() {
+        if (pollTimer) return;
+        poll();
+        pollTimer = setInterval(poll, pollInterval);
+    }
+
+    function stopPolling() {
+        if (!pollTimer) return;
+        clearInterval(pollTimer);
+        pollTimer = null;
+    }
+
+    function connect() {
+        if (!("WebSocket" in window)) { startPolling(); return; }
+        const scheme = location.protocol === "https:" ? "wss" : "ws";
+        const socket = new WebSocket(`${scheme}://${location.host}/ws/dashboard/`);
+
+        socket.onopen = () => { retryDelay = 1000; stopPolling(); };
+        socket.onmessage = e => {
+            try { onData(JSON.parse(e.data)); }
+            catch (err) { console.error("Bad push message:", err); }
+        };
+        socket.onclose = () => {
+            startPolling();
+            setTimeout(connect, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, 30000);
+        };
+    }
+
+    connect();
+}
@@ -0,0 +1,194 @@
+# iotdata/streaming.py
+"""
+Streaming read path for recent_data_api.
+
+Both tables are read as tuples with values_list().iterator(), which fetches
+in chunks instead of building model instances for the whole window. Each
+stream is already ordered by server_receive_time, so heapq.merge interleaves
+them lazily (no global sort), and the JSON body is written a few hundred
+rows at a time through a StreamingHttpResponse. Peak memory is one chunk per
+table regardless of the window size.
+
+Under ASGI (daphne), Django collects a synchronous body iterator into a list
+before sending it, so stream_response() hands it an async iterator there
+that pulls each piece through sync_to_async instead.
+
+Incremental readers pass a Cursor: only rows with a primary key above the
+one it holds are read, and the cursor advances to the highest key streamed
+(or stored, when the window had nothing newer) so the next poll picks up
+exactly where this one stopped.
+"""
+import heapq
+import itertools
+import json
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from . import archive, delta
+from .models import ArduinoData, NodeMCUData
+
+# Rows fetched per DB round trip, per table
+CHUNK_SIZE = 2000
+# Rows encoded per yielded piece of the response body
+WRITE_BATCH = 500
+
+ARDUINO_COLUMNS = ('sensor_id', 'device_capture_time', 'ir1', 'ir2', 'piezo', 'speed',
+                   'arduino_relay', 'piezo_relay', 'server_receive_time')
+NODEMCU_COLUMNS = ('sensor_id', 'device_capture_time', 'ir1', 'ir2', 'nodemcu_relay',
+                   'server_receive_time')
+
+
+class Cursor:
+    """Highest primary key returned per table, serialized as "<arduino_id>-<nodemcu_id>"."""
+
+    def __init__(self, arduino=0, nodemcu=0):
+        self.ids = {"arduino": arduino, "nodemcu": nodemcu}
+
+    @classmethod
+    def parse(cls, value):
+        """Raises ValueError for anything that isn't two non-negative integers."""
+        arduino, nodemcu = (int(part) for part in value.split('-'))
+        if arduino < 0 or nodemcu < 0:
+            raise ValueError(value)
+        return cls(arduino, nodemcu)
+
+    def see(self, source, pk):
+        if pk is not None and pk > self.ids[source]:
+            self.ids[source] = pk
+
+    def __str__(self):
+        return f"{self.ids['arduino']}-{self.ids['nodemcu']}"
+
+
+MODELS = {"arduino": ArduinoData, "nodemcu": NodeMCUData}
+
+
+def newest_id(source):
+    """
+    Highest stored id of ``source`` (None when empty). Read before a window
+    and passed to Cursor.see() after it, so a window with no new rows still
+    moves the cursor to "now": every row up to that id was either returned
+    or is older than the window.
+    """
+    return MODELS[source].objects.order_by('-id').values_list('id', flat=True).first()
+
+
+def _window(source, cutoff, columns, cursor):
+    names = ('id', *columns, *delta.RUN_COLUMNS)
+    archived = ()
+    if cursor is None:
+        # Older than the retention horizon: read from the day archives
+        archived, cutoff = archive.split(source, cutoff, names)
+    qs = MODELS[source].objects.filter(server_receive_time__gte=cutoff)
+    newest = None
+    if cursor is not None:
+        newest = newest_id(source)
+        qs = qs.filter(id__gt=cursor.ids[source])
+    rows = itertools.chain(archived, (qs.order_by('server_receive_time')
+                                      .values_list(*names)
+                                      .iterator(chunk_size=CHUNK_SIZE)))
+    # server_receive_time is the last of ``columns``
+    for row in delta.expand(rows, len(columns)):
+        if cursor is not None:
+            cursor.see(source, row[0])
+        yield row[1:]
+    if cursor is not None:
+        cursor.see(source, newest)
+
+
+def has_rows_after(cursor, cutoff):
+    """True if either table has rows past ``cursor`` (used by long-polls)."""
+    return any(
+        model.objects.filter(server_receive_time__gte=cutoff, id__gt=cursor.ids[source]).exists()
+        for source, model in MODELS.items()
+    )
+
+
+def arduino_rows(cutoff, cursor=None):
+    """(server_receive_time, row dict) for Arduino samples since ``cutoff``."""
+    for sensor_id, capture, ir1, ir2, piezo, speed, relay, piezo_relay, ts in \
+            _window("arduino", cutoff, ARDUINO_COLUMNS, cursor):
+        yield ts, {
+            "source": "arduino",
+            "sensor_id": sensor_id,
+            "capture_time": str(capture),
+            "ir1": ir1,
+            "ir2": ir2,
+            "piezo": float(piezo),
+            "speed": float(speed),
+            "arduino_relay": relay,
+            "piezo_relay": piezo_relay,
+            "nodemcu_relay": False,
+            "timestamp": ts.isoformat()
+        }
+
+
+def nodemcu_rows(cutoff, cursor=None):
+    """(server_receive_time, row dict) for NodeMCU samples since ``cutoff``."""
+    for sensor_id, capture, ir1, ir2, relay, ts in \
+            _window("nodemcu", cutoff, NODEMCU_COLUMNS, cursor):
+        yield ts, {
+            "source": "nodemcu",
+            "sensor_id": sensor_id,
+            "capture_time": str(capture),
+            "ir1": ir1,
+            "ir2": ir2,
+            "piezo": 0.0,
+            "speed": 0.0,
+            "arduino_relay": False,
+            "piezo_relay": False,
+            "nodemcu_relay": relay,
+            "timestamp": ts.isoformat()
+        }
+
+
+def merged_rows(cutoff, cursor=None):
+    """Both sources as one time-ordered stream of row dicts (Arduino first on ties)."""
+    streams = (arduino_rows(cutoff, cursor), nodemcu_rows(cutoff, cursor))
+    for _, row in heapq.merge(*streams, key=itemgetter(0)):
+        yield row
+
+
+def json_table_rows(rows, trailer=None):
+    """
+    Encode ``rows`` as {"table_rows": [...]} in pieces. ``trailer`` is called
+    once the rows are exhausted and returns extra top-level keys (e.g. the
+    advanced cursor).
+    """
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    yield '{"table_rows":['
+    batch, first = [], True
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= WRITE_BATCH:
+            yield ('' if first else ',') + encode(batch)[1:-1]
+            batch, first = [], False
+    if batch:
+        yield ('' if first else ',') + encode(batch)[1:-1]
+    extra = trailer() if trailer else None
+    yield '],' + encode(extra)[1:] if extra else ']}'
+
+
+async def _pulled(pieces):
+    # thread_sensitive: the same thread (and DB connection) as the view,
+    # so chunked cursors opened by the generators stay usable
+    pull = sync_to_async(next, thread_sensitive=True)
+    pieces = iter(pieces)
+    while True:
+        piece = await pull(pieces, None)
+        if piece is None:
+            return
+        yield piece
+
+
+def stream_response(request, pieces, content_type='application/json'):
+    """
+    StreamingHttpResponse over the str/bytes generator ``pieces`` that stays
+    incremental under both WSGI and ASGI (see the module docstring).
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        pieces = _pulled(pieces)
+    return StreamingHttpResponse(pieces, content_type=content_type)
@@ -1,3 +1,680 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, time as clock_time, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import analytics, archive, delta, downsample, ingest, latency, lineproto, live, metrics, readings, relay, relayqueue, rollups, schema, writer
+from .models import ArduinoData, NodeMCUData, Reading, SensorRollup
+
+T0 = datetime(2026, 1, 5, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def wait_for(predicate, timeout=2.0):
+    """Poll ``predicate`` until it is true or ``timeout`` seconds pass."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+# ===================== UPLOADS =====================
+ARDUINO_SAMPLE = {"sensor_id": "ARDU_01", "device_capture_time": "11:08:47", "ir1": 1, "ir2": 0,
+                  "piezo": 12.5, "speed": 23, "arduino_relay": True, "piezo_relay": False}
+NODEMCU_SAMPLE = {"sensor_id": "NMCU_01", "device_capture_time": "11:08:47", "ir1": 0, "ir2": 1,
+                  "nodemcu_relay": False}
+# field -> values each validator must treat exactly like the serializer
+EDGE_VALUES = {
+    "sensor_id": ["ARDU_02", " ARDU_03 ", "", "X" * 11, "AB\x00", "é", 123, None],
+    "device_capture_time": ["11:08:47.250", "11:08:47.25", "9:5:3", "23:59:59.999", "24:00:00",
+                            "11:08", "11-08-47", None, 1108],
+    "ir1": [0, -1, 1.0, 1.5, "1", True, 2 ** 40, None, "x"],
+    "ir2": [None, [], {}],
+    "speed": [0, 12.5, "12.5", float("nan"), float("inf"), 10 ** 400, False, None],
+    "piezo": ["nan", "1e3", None],
+    "arduino_relay": [True, 1, 0, "true", "yes", "maybe", None],
+    "nodemcu_relay": [False, "false", 2, None],
+}
+
+
+def _described(result):
+    instances, errors = result
+    return [{f.attname: getattr(i, f.attname) for f in i._meta.concrete_fields
+             if f.attname not in ('id', 'server_receive_time')} for i in instances], errors
+
+
+class ValidatorParityTests(SimpleTestCase):
+    def samples(self, base):
+        yield from (base, {}, {**base, "unknown": 1}, "abc", None, [base], 5)
+        for field, values in EDGE_VALUES.items():
+            if field in base:
+                for value in values:
+                    yield {**base, field: value}
+        for field in base:
+            yield {k: v for k, v in base.items() if k != field}
+
+    def test_compiled_schema_matches_the_serializers(self):
+        for source, base in (("arduino", ARDUINO_SAMPLE), ("nodemcu", NODEMCU_SAMPLE)):
+            samples = list(self.samples(base))
+            for sample in samples:
+                self.assertEqual(_described(schema.validate_samples(source, sample)),
+                                 _described(ingest.validate_samples(source, sample)), (source, sample))
+            self.assertEqual(_described(schema.validate_samples(source, samples)),
+                             _described(ingest.validate_samples(source, samples)), source)
+
+    def test_batches_over_the_limit_are_refused_by_both(self):
+        for validate in (schema.validate_samples, ingest.validate_samples):
+            with self.assertRaises(ingest.BatchTooLarge):
+                validate("nodemcu", [NODEMCU_SAMPLE] * (ingest.MAX_BATCH_SIZE + 1))
+
+
+class UploadViewTests(TestCase):
+    URLS = ("/api/upload/", "/api/upload/fast/")
+
+    def setUp(self):
+        live.reset()
+        self.addCleanup(live.reset)
+
+    def post(self, url, body):
+        return self.client.post(url, json.dumps(body), content_type="application/json")
+
+    def test_batch_is_stored_and_reported(self):
+        body = {"arduino": [ARDUINO_SAMPLE, {**ARDUINO_SAMPLE, "ir1": "x"}], "nodemcu": NODEMCU_SAMPLE}
+        for url in self.URLS:
+            response = self.post(url, body)
+            self.assertEqual(response.status_code, 201, url)
+            report = response.json()
+            self.assertEqual((report["arduino"]["accepted"], report["arduino"]["rejected"]), (1, 1))
+            self.assertEqual(report["arduino"]["errors"][0]["index"], 1)
+            self.assertEqual(report["nodemcu"]["accepted"], 1)
+        self.assertEqual((ArduinoData.objects.count(), NodeMCUData.objects.count()), (2, 2))
+
+    def test_all_rejected_is_400_and_oversized_batch_is_413(self):
+        for url in self.URLS:
+            self.assertEqual(self.post(url, {"nodemcu": [{"ir1": "x"}]}).status_code, 400, url)
+            too_many = {"nodemcu": [NODEMCU_SAMPLE] * (ingest.MAX_BATCH_SIZE + 1)}
+            self.assertEqual(self.post(url, too_many).status_code, 413, url)
+        self.assertEqual(NodeMCUData.objects.count(), 0)
+
+    def test_both_views_answer_alike(self):
+        body = {"arduino": [{**ARDUINO_SAMPLE, "speed": "fast"}, {**ARDUINO_SAMPLE, "sensor_id": "X" * 11}]}
+        slow, fast = (self.post(url, body) for url in self.URLS)
+        self.assertEqual((slow.status_code, slow.json()), (fast.status_code, fast.json()))
+
+
+# ===================== RELAY QUEUE =====================
+class RelayQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        self.queue = relayqueue.RelayQueue(sender=self.send)
+
+    def send(self, device, actions):
+        self.sent.append((device, actions))
+        return {target: {"ok": True, "status": 200, "latency_ms": 1.0, "error": None}
+                for target in actions}
+
+    def submit_and_send(self, device, relay_type, state):
+        commands = self.queue.submit(device, relay_type, state)
+        self.assertTrue(wait_for(lambda: all(c.status == "sent" for c in commands)))
+        return commands
+
+    def test_ack_needs_a_sample_from_the_same_board(self):
+        command, = self.submit_and_send("10.0.0.1", "nodemcu", True)
+        sample = NodeMCUData(sensor_id="NMCU_02", nodemcu_relay=True)
+
+        self.queue.observe({"nodemcu": [sample]}, client_ip="10.0.0.2")
+        self.assertEqual(command.status, "sent")
+
+        self.queue.observe({"nodemcu": [sample]}, client_ip="10.0.0.1")
+        self.assertEqual(command.status, "acked")
+
+    def test_ack_needs_the_requested_state(self):
+        command, = self.submit_and_send("10.0.0.1", "arduino", True)
+        self.queue.observe({"arduino": [ArduinoData(arduino_relay=False)]}, client_ip="10.0.0.1")
+        self.assertEqual(command.status, "sent")
+        self.queue.observe({"arduino": [ArduinoData(arduino_relay=True)]}, client_ip="10.0.0.1")
+        self.assertEqual(command.status, "acked")
+
+    def test_other_source_does_not_ack(self):
+        command, = self.submit_and_send("10.0.0.1", "arduino", True)
+        self.queue.observe({"nodemcu": [NodeMCUData(nodemcu_relay=True)]}, client_ip="10.0.0.1")
+        self.assertEqual(command.status, "sent")
+
+    def test_waiting_command_is_superseded(self):
+        # Hold the queue so the worker cannot take the first command before the second arrives
+        with self.queue._cond:
+            first, = self.queue.submit("10.0.0.1", "nodemcu", True)
+            second, = self.queue.submit("10.0.0.1", "nodemcu", False)
+        self.assertTrue(wait_for(lambda: second.status == "sent"))
+        self.assertEqual(first.status, "superseded")
+        self.assertEqual(first.superseded_by, second.id)
+        self.assertEqual(self.sent, [("10.0.0.1", {"nodemcu": "off"})])
+
+
+# ===================== UNIFIED READINGS =====================
+class ReadingLayoutTests(SimpleTestCase):
+    def test_pack_unpack_round_trip(self):
+        layout = readings._layouts["arduino"]
+        values = [clock_time(12, 0, 1, 250000), T0 + timedelta(milliseconds=250),
+                  3, -4, 1.5, 72.25, True, False]
+        self.assertEqual(layout.unpack(layout.pack(values)), values)
+
+    def test_null_times_survive(self):
+        layout = readings._layouts["nodemcu"]
+        values = [None, None, 0, 1, True]
+        self.assertEqual(layout.unpack(layout.pack(values)), values)
+
+    def test_microsecond_clock(self):
+        moment = T0 + timedelta(microseconds=123457)
+        self.assertEqual(readings.from_us(readings.to_us(moment)), moment)
+
+
+class ReadingStreamTests(TestCase):
+    def test_copy_and_stream_in_time_order(self):
+        ArduinoData.objects.bulk_create([
+            # A folded run: 3 samples between T0 and T0 + 2 s
+            ArduinoData(sensor_id="A1", speed=10.0, server_receive_time=T0,
+                        repeats=3, run_until=T0 + timedelta(seconds=2)),
+            ArduinoData(sensor_id="A1", speed=20.0, server_receive_time=T0 + timedelta(seconds=3)),
+        ])
+        NodeMCUData.objects.create(sensor_id="N1", ir1=1, server_receive_time=T0 + timedelta(seconds=1.5))
+        readings.copy_rows("arduino", ArduinoData)
+        readings.copy_rows("nodemcu", NodeMCUData)
+        self.assertEqual(Reading.objects.count(), 3)
+
+        rows = list(readings.stream(T0))
+        self.assertEqual([(r["source"], r["timestamp"]) for r in rows], [
+            ("arduino", T0.isoformat()),
+            ("arduino", (T0 + timedelta(seconds=1)).isoformat()),
+            ("nodemcu", (T0 + timedelta(seconds=1.5)).isoformat()),
+            ("arduino", (T0 + timedelta(seconds=2)).isoformat()),
+            ("arduino", (T0 + timedelta(seconds=3)).isoformat()),
+        ])
+        self.assertNotIn("speed", rows[2])
+        self.assertEqual(rows[-1]["speed"], 20.0)
+
+    def test_cursor_returns_only_newer_readings(self):
+        NodeMCUData.objects.create(sensor_id="N1", server_receive_time=T0)
+        readings.copy_rows("nodemcu", NodeMCUData)
+        cursor = [0]
+        self.assertEqual(len(list(readings.stream(T0, cursor=cursor))), 1)
+        NodeMCUData.objects.create(sensor_id="N1", server_receive_time=T0 + timedelta(seconds=1))
+        readings.copy_rows("nodemcu", NodeMCUData, since=T0 + timedelta(seconds=1))
+        newer = list(readings.stream(T0, after_id=cursor[0]))
+        self.assertEqual([r["timestamp"] for r in newer], [(T0 + timedelta(seconds=1)).isoformat()])
+
+    def test_empty_window_moves_the_cursor_to_the_newest_reading(self):
+        NodeMCUData.objects.create(sensor_id="N1", server_receive_time=T0)
+        readings.copy_rows("nodemcu", NodeMCUData)
+        cursor = [0]
+        self.assertEqual(list(readings.stream(T0 + timedelta(hours=1), cursor=cursor)), [])
+        self.assertEqual(cursor, [Reading.objects.get().id])
+
+
+# ===================== RECENT DATA API =====================
+class CursorResumeTests(TestCase):
+    def recent(self, query):
+        response = self.client.get(f"/api/recent/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def sample(self, sensor_id, age=timedelta(0)):
+        return ArduinoData.objects.create(sensor_id=sensor_id, server_receive_time=timezone.now() - age)
+
+    def test_empty_window_cursor_resumes_at_now(self):
+        old = self.sample("A1", age=timedelta(hours=2))
+        node = NodeMCUData.objects.create(server_receive_time=timezone.now() - timedelta(hours=2))
+        first = self.recent("minutes=1")
+        self.assertEqual(first["table_rows"], [])
+        self.assertEqual(first["cursor"], f"{old.id}-{node.id}")
+
+        new = self.sample("A1")
+        resumed = self.recent(f"since={first['cursor']}")
+        self.assertEqual([row["sensor_id"] for row in resumed["table_rows"]], ["A1"])
+        self.assertEqual(resumed["cursor"], f"{new.id}-{node.id}")
+
+    def test_cursor_returns_each_row_once(self):
+        self.sample("A1")
+        first = self.recent("minutes=5")
+        self.assertEqual(len(first["table_rows"]), 1)
+        self.assertEqual(self.recent(f"since={first['cursor']}")["table_rows"], [])
+        self.sample("A2")
+        self.assertEqual([r["sensor_id"] for r in self.recent(f"since={first['cursor']}")["table_rows"]],
+                         ["A2"])
+
+    def test_columnar_cursor_resumes_at_now(self):
+        old = self.sample("A1", age=timedelta(hours=2))
+        response = self.client.get("/api/recent/?minutes=1&format=columnar")
+        self.assertEqual(response.json()["cursor"], f"{old.id}-0")
+
+    def test_bad_cursor_is_400(self):
+        self.assertEqual(self.client.get("/api/recent/?since=1-x").status_code, 400)
+
+
+class RecentDataParamTests(TestCase):
+    def test_bad_numbers_are_400(self):
+        for query in ("max_points=abc", "minutes=x", "minutes=-5", "minutes=99999999999"):
+            self.assertEqual(self.client.get(f"/api/recent/?{query}").status_code, 400, query)
+
+    def test_unusable_windows_are_400(self):
+        for url in ("/api/latency/", "/api/analytics/"):
+            for minutes in ("1e12", "nan", "inf", "-1"):
+                self.assertEqual(self.client.get(f"{url}?minutes={minutes}").status_code, 400, (url, minutes))
+
+    def test_out_of_range_max_points_is_clamped(self):
+        for query in ("max_points=0", "max_points=-5", "max_points=999999"):
+            self.assertEqual(self.client.get(f"/api/recent/?{query}").status_code, 200, query)
+
+
+# ===================== DOWNSAMPLING =====================
+class DownsampleTests(TestCase):
+    def setUp(self):
+        ArduinoData.objects.bulk_create([
+            ArduinoData(sensor_id=f"A{i % 2}", speed=float(i), server_receive_time=T0 + timedelta(seconds=0.4 * i))
+            for i in range(7)
+        ])
+
+    @mock.patch.object(downsample, 'CHUNK_SIZE', 2)
+    def test_series_are_assembled_across_chunks(self):
+        series, resolutions = downsample.downsampled_series(T0, 100, now=T0 + timedelta(seconds=3))
+        self.assertEqual(resolutions, {"arduino": None, "nodemcu": None})
+        self.assertEqual(series["arduino"]["A0"]["speed"]["values"], [0.0, 2.0, 4.0, 6.0])
+        self.assertEqual(series["arduino"]["A1"]["speed"]["timestamp"],
+                         [int(T0.timestamp() * 1000) + ms for ms in (400, 1200, 2000)])
+
+    @mock.patch.object(downsample, 'MAX_RAW_SAMPLES', 3)
+    def test_long_window_is_charted_from_rollups(self):
+        rollups.update_rollups(now=T0 + timedelta(seconds=3))
+        series, resolutions = downsample.downsampled_series(T0, 100, now=T0 + timedelta(seconds=3))
+        self.assertEqual(resolutions["arduino"], 1)
+        # A0 has speeds 0, 2 in second 0, 4 in second 1, 6 in second 2
+        self.assertEqual(series["arduino"]["A0"]["speed"]["values"], [1.0, 4.0, 6.0])
+
+
+# ===================== ROLLUPS =====================
+class RollupCatchUpTests(TestCase):
+    def test_sparse_history_is_caught_up_across_gaps(self):
+        bursts = [T0, T0 + timedelta(days=30, seconds=0.5), T0 + timedelta(days=90)]
+        ArduinoData.objects.bulk_create([
+            ArduinoData(sensor_id="A1", speed=10.0 * i, server_receive_time=start + timedelta(milliseconds=100 * i))
+            for start in bursts for i in range(5)
+        ])
+        rollups.update_rollups(now=T0 + timedelta(days=91))
+
+        hours = SensorRollup.objects.filter(resolution=3600).order_by('bucket_start')
+        self.assertEqual([h.bucket_start for h in hours], [
+            T0, T0 + timedelta(days=30), T0 + timedelta(days=90)])
+        self.assertEqual([h.samples for h in hours], [5, 5, 5])
+        self.assertEqual(hours[0].speed_max, 40.0)
+
+    def test_rows_committed_late_are_counted_on_the_next_run(self):
+        ArduinoData.objects.create(sensor_id="A1", server_receive_time=T0 + timedelta(seconds=5))
+        rollups.update_rollups(now=T0 + timedelta(seconds=6))
+        # Received before the newest bucket, committed after it was built
+        ArduinoData.objects.create(sensor_id="A1", server_receive_time=T0 + timedelta(seconds=2))
+        rollups.update_rollups(now=T0 + timedelta(seconds=7))
+        self.assertEqual(SensorRollup.objects.get(resolution=60).samples, 2)
+
+    @override_settings(IOTDATA_DELTA_HEARTBEAT=5.0)
+    def test_delta_run_is_spread_over_the_seconds_it_covers(self):
+        # 5 identical samples 0.5 s apart: 2 in second 0, 2 in second 1, 1 in second 2
+        ArduinoData.objects.bulk_create([
+            ArduinoData(sensor_id="A1", speed=30.0, ir1=1, arduino_relay=True,
+                        server_receive_time=T0, repeats=5, run_until=T0 + timedelta(seconds=2)),
+            ArduinoData(sensor_id="A1", speed=50.0, server_receive_time=T0 + timedelta(seconds=1.2)),
+        ])
+        rollups.rollup_raw("arduino", T0, T0 + timedelta(seconds=3))
+
+        seconds = {b.bucket_start: b for b in SensorRollup.objects.filter(resolution=1)}
+        self.assertEqual([seconds[T0 + timedelta(seconds=i)].samples for i in range(3)], [2, 3, 1])
+        second = seconds[T0 + timedelta(seconds=1)]
+        self.assertEqual((second.speed_min, second.speed_max, second.speed_sum), (30.0, 50.0, 110.0))
+        self.assertEqual((second.ir1_on, second.relay_on), (2, 2))
+
+    @override_settings(IOTDATA_DELTA_HEARTBEAT=5.0)
+    def test_spread_run_is_split_between_catch_up_slices(self):
+        ArduinoData.objects.create(sensor_id="A1", server_receive_time=T0, repeats=4,
+                                   run_until=T0 + timedelta(seconds=3))
+        rollups.rollup_raw("arduino", T0, T0 + timedelta(seconds=2))
+        rollups.rollup_raw("arduino", T0 + timedelta(seconds=2), T0 + timedelta(seconds=4))
+        self.assertEqual(sorted(SensorRollup.objects.filter(resolution=1)
+                                .values_list('samples', flat=True)), [1, 1, 1, 1])
+
+
+# ===================== ANALYTICS =====================
+class AnalyticsTests(TestCase):
+    START = int(T0.timestamp())
+
+    def setUp(self):
+        self.cache = analytics.BucketCache(settle=30.0)
+
+    def add(self, seconds, ir1, speed=0.0):
+        return ArduinoData.objects.create(sensor_id="A1", ir1=ir1, speed=speed,
+                                          server_receive_time=T0 + timedelta(seconds=seconds))
+
+    def read(self, cache, now):
+        bucket, = cache.buckets(60, self.START, self.START, now)
+        p = bucket.sensors[("arduino", "A1")]
+        return p.samples, p.edges.tolist()
+
+    def test_edges_and_speeds_across_bucket_boundaries_count_once(self):
+        # Rising edges at 65 s and 125 s each land on the first row of a bucket
+        for seconds, ir1, speed in [(10, 1, 0.0), (55, 0, 0.0), (65, 1, 40.0),
+                                    (70, 0, 40.0), (115, 0, 40.0), (125, 1, 40.0)]:
+            self.add(seconds, ir1, speed)
+        self.addCleanup(setattr, analytics, '_cache', analytics._cache)
+        analytics._cache = self.cache
+
+        result = analytics.window(T0, T0 + timedelta(minutes=3), 60, now=self.START + 3600)
+        sensor = result["sensors"]["A1"]
+        self.assertEqual(result["vehicle_counts"]["A1"], [0, 1, 1])
+        self.assertEqual((sensor["vehicles"], sensor["samples"]), (2, 6))
+        self.assertEqual((sensor["speed_measurements"], sensor["mean_speed"]), (1, 40.0))
+
+    def test_rows_in_order_are_merged_into_an_open_bucket(self):
+        self.add(10, 0)
+        self.add(20, 1)
+        self.assertEqual(self.read(self.cache, now=self.START + 30), (2, [1, 0]))
+        self.add(30, 0)
+        self.add(40, 1)
+        self.assertEqual(self.read(self.cache, now=self.START + 45), (4, [2, 0]))
+        self.assertEqual((self.cache.computed, self.cache.refreshed), (1, 1))
+
+    def test_row_stored_out_of_order_rebuilds_the_bucket(self):
+        self.add(10, 0)
+        self.add(20, 1)
+        self.read(self.cache, now=self.START + 30)
+        # Stored later, received earlier: 5 s on, 10 s off, 20 s on
+        self.add(5, 1)
+        self.assertEqual(self.read(self.cache, now=self.START + 35), (3, [1, 0]))
+        self.assertEqual((self.cache.computed, self.cache.refreshed), (2, 0))
+        self.assertEqual(self.read(analytics.BucketCache(), now=self.START + 35), (3, [1, 0]))
+
+
+# ===================== RELAY CONNECTIONS =====================
+class _FakeWriter:
+    def __init__(self):
+        self.closed = False
+
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class RelayKeepAliveTests(SimpleTestCase):
+    def request(self, response):
+        async def run():
+            reader, writer, pool = asyncio.StreamReader(), _FakeWriter(), []
+            reader.feed_data(response + b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+            status = await relay._request(reader, writer, "device", "/relay/on", pool)
+            if pool:       # the next response on the reused connection must parse
+                self.assertEqual(await relay._request(reader, writer, "device", "/relay/on", []), 200)
+            return status, bool(pool), writer.closed
+        return asyncio.run(run())
+
+    def test_connection_with_content_length_is_reused(self):
+        self.assertEqual(self.request(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nOK"),
+                         (200, True, False))
+
+    def test_chunked_body_is_read_before_reuse(self):
+        self.assertEqual(self.request(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+                                      b"2\r\nOK\r\n0\r\n\r\n"), (200, True, False))
+
+    def test_body_without_length_closes_the_connection(self):
+        self.assertEqual(self.request(b"HTTP/1.1 200 OK\r\n\r\nOK"), (200, False, True))
+
+    def test_http10_response_closes_the_connection(self):
+        self.assertEqual(self.request(b"HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\nOK"),
+                         (200, False, True))
+
+
+# ===================== LINE PROTOCOL =====================
+class UDPSenderTests(SimpleTestCase):
+    def setUp(self):
+        self.protocol = lineproto._UDPProtocol(lineproto.LineServer())
+
+    def hello(self, port):
+        self.protocol.datagram_received(b"INMCU_%02d,ARDU_01Z" % port, ("10.0.0.1", port))
+
+    @mock.patch.object(lineproto, 'MAX_UDP_SENDERS', 2)
+    def test_least_recently_heard_sender_is_forgotten(self):
+        for port in (1, 2, 1, 3):
+            self.hello(port)
+        self.assertEqual(list(self.protocol.senders), [("10.0.0.1", 1), ("10.0.0.1", 3)])
+        self.assertEqual(self.protocol.senders[("10.0.0.1", 1)].nodemcu_id, "NMCU_01")
+
+    @mock.patch.object(lineproto, 'UDP_SENDER_IDLE', 0.0)
+    def test_idle_senders_expire(self):
+        self.hello(1)
+        self.hello(2)
+        self.assertEqual(list(self.protocol.senders), [("10.0.0.1", 2)])
+
+
+class LineServerCloseTests(SimpleTestCase):
+    def test_close_stores_what_is_buffered(self):
+        server = lineproto.LineServer(flush_interval=60)
+
+        async def run():
+            transport, = await server.start("127.0.0.1", udp_port=0)
+            server.feed(lineproto.Sender("10.0.0.1"), b"A0,1,12,1,0,23.5ZN1,0,1Z")
+            await server.close()
+            transport.close()
+
+        with mock.patch.object(lineproto.ingest, 'accept') as accept:
+            asyncio.run(run())
+        (batches,), kwargs = accept.call_args
+        self.assertEqual({source: len(samples) for source, samples in batches.items()},
+                         {"arduino": 1, "nodemcu": 1})
+        self.assertEqual(kwargs, {"client_ip": "10.0.0.1"})
+        self.assertIsNone(server._flusher)
+
+
+# ===================== METRICS =====================
+class MetricsTests(TestCase):
+    @override_settings(IOTDATA_METRICS_ALLOWED_IPS=['127.0.0.1', '10.1.0.0/16'])
+    def test_only_listed_addresses_may_scrape(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.2.0.1').status_code, 403)
+
+    @override_settings(IOTDATA_METRICS_MAX_SENSORS=2)
+    def test_sensor_labels_are_capped(self):
+        self.addCleanup(setattr, metrics, '_sensor_labels', metrics._sensor_labels)
+        metrics._sensor_labels = set()
+        labels = [metrics.sensor_label(s) for s in ("A1", "A2", "A3", "A1", "A4")]
+        self.assertEqual(labels, ["A1", "A2", metrics.OTHER_SENSOR, "A1", metrics.OTHER_SENSOR])
+
+
+# ===================== LATENCY =====================
+class CaptureBackfillTests(TestCase):
+    @override_settings(IOTDATA_DEVICE_UTC_OFFSET=0)
+    def test_rows_without_capture_at_are_stamped(self):
+        old = NodeMCUData.objects.create(server_receive_time=T0, device_capture_time=clock_time(11, 59, 59, 250000))
+        NodeMCUData.objects.create(server_receive_time=T0)
+        ArduinoData.objects.create(server_receive_time=T0 + timedelta(hours=12),
+                                   device_capture_time=clock_time(0, 0, 1))
+
+        self.assertEqual(latency.backfill(chunk=1), {"arduino": 1, "nodemcu": 1})
+        old.refresh_from_db()
+        self.assertEqual(old.device_capture_at, T0 - timedelta(milliseconds=750))
+        self.assertEqual(ArduinoData.objects.get().device_capture_at, T0 + timedelta(hours=12, seconds=1))
+        self.assertEqual(latency.backfill(), {"arduino": 0, "nodemcu": 0})
+
+
+class LatencyWindowTests(TestCase):
+    def test_edges_are_found_across_chunks(self):
+        for model, sensor_id, delay in ((ArduinoData, "ARDU_01", 30), (NodeMCUData, "NMCU_01", 0)):
+            model.objects.bulk_create([
+                model(sensor_id=sensor_id, ir1=on, server_receive_time=T0 + timedelta(milliseconds=100 * i + delay))
+                for i, on in enumerate([0, 0, 1, 0, 1, 1, 0, 1])
+            ])
+        stats = latency.window_stats(T0, T0 + timedelta(seconds=1), "ARDU_01", "NMCU_01", 50)
+        with mock.patch.object(latency, 'SCAN_CHUNK', 2):
+            self.assertEqual(latency.window_stats(T0, T0 + timedelta(seconds=1), "ARDU_01", "NMCU_01", 50),
+                             stats)
+        self.assertEqual((stats["channels"]["ir1"]["pairs"], stats["channels"]["ir1"]["p50_ms"]), (3, 30.0))
+
+
+# ===================== SERIAL WRITER =====================
+class SerialWriterTests(SimpleTestCase):
+    def setUp(self):
+        self.release, self.writing = threading.Event(), threading.Event()
+        self.written = []
+        self.writer = writer.SerialWriter(self.write, timeout=0.05)
+        self.addCleanup(self.writer.stop)
+        self.addCleanup(self.release.set)
+
+    def write(self, batches):
+        self.writing.set()
+        self.release.wait(2)
+        self.written.append(batches)
+
+    def test_timed_out_batch_is_withdrawn(self):
+        first = threading.Thread(target=self.writer.write, args=({"arduino": [1]},))
+        first.start()
+        self.assertTrue(self.writing.wait(2))
+        with self.assertRaises(writer.WriterTimeout):
+            self.writer.write({"arduino": [2]})
+        self.release.set()
+        first.join(2)
+        self.writer.write({"arduino": [3]})
+        self.assertEqual(self.written, [{"arduino": [1]}, {"arduino": [3]}])
+        self.assertEqual(self.writer.stats()["timed_out"], 1)
+
+
+# ===================== LIVE CACHE =====================
+class LiveCacheTests(TestCase):
+    def setUp(self):
+        live.reset()
+        self.addCleanup(live.reset)
+
+    def test_unknown_sensor_ids_are_not_remembered(self):
+        for n in range(20):
+            self.assertIsNone(live._entry("arduino", f"X{n}"))
+        self.assertEqual((live._entries["arduino"], live._warmed), ({}, set()))
+
+    def test_stored_sensor_is_warmed_once(self):
+        ArduinoData.objects.create(sensor_id="A1", speed=3.0, server_receive_time=T0)
+        self.assertEqual(live._entry("arduino", "A1").instance.speed, 3.0)
+        with self.assertNumQueries(0):
+            live._entry("arduino", "A1")
+
+
+# ===================== DELTA STORAGE =====================
+class DeltaTests(SimpleTestCase):
+    def setUp(self):
+        self.written = []
+        self.filter = delta.DeltaFilter(self.written.append, heartbeat=1.0)
+        self.addCleanup(self.filter.stop)
+
+    def samples(self, speeds, start=T0, step=0.1):
+        return [ArduinoData(sensor_id="A1", speed=speed,
+                            server_receive_time=start + timedelta(seconds=step * i))
+                for i, speed in enumerate(speeds)]
+
+    def test_unchanged_samples_fold_into_one_run(self):
+        closed = self.filter.fold({"arduino": self.samples([10.0, 10.0, 10.0, 20.0, 20.0])})
+        rows = closed["arduino"]
+        self.assertEqual([(r.speed, r.repeats) for r in rows], [(10.0, 3), (20.0, 2)])
+        self.assertEqual(rows[0].run_until, T0 + timedelta(seconds=0.2))
+        self.assertEqual(rows[1].run_until, T0 + timedelta(seconds=0.4))
+
+    def test_runs_end_with_the_heartbeat_window(self):
+        closed = self.filter.fold({"arduino": self.samples([10.0] * 4, start=T0 + timedelta(seconds=0.8))})
+        self.assertEqual([r.repeats for r in closed["arduino"]], [2, 2])
+
+    def test_expand_restores_one_sample_per_reading(self):
+        rows = [("A1", 10.0, T0, 3, T0 + timedelta(seconds=1)),
+                ("A1", 20.0, T0 + timedelta(seconds=2), 1, None)]
+        self.assertEqual(list(delta.expand(rows, 2)), [
+            ("A1", 10.0, T0),
+            ("A1", 10.0, T0 + timedelta(seconds=0.5)),
+            ("A1", 10.0, T0 + timedelta(seconds=1)),
+            ("A1", 20.0, T0 + timedelta(seconds=2)),
+        ])
+
+    def test_fold_then_expand_round_trip(self):
+        samples = self.samples([10.0, 10.0, 10.0, 20.0, 10.0])
+        expected = [(s.speed, s.server_receive_time) for s in samples]
+        rows = self.filter.fold({"arduino": samples})["arduino"]
+        expanded = delta.expand([(r.speed, r.server_receive_time, r.repeats, r.run_until) for r in rows], 1)
+        self.assertEqual(list(expanded), expected)
+
+
+# ===================== ARCHIVE =====================
+class ArchiveTests(TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+        settings = override_settings(IOTDATA_ARCHIVE_DIR=self.folder)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_sensor_id_cannot_escape_the_archive_folder(self):
+        ArduinoData.objects.create(sensor_id="../../x", server_receive_time=T0)
+        archive.archive_day("arduino", T0)
+
+        day_folder = os.path.join(self.folder, "arduino", "2026-01-05")
+        self.assertEqual(os.listdir(day_folder), ["..%2F..%2Fx.npz"])
+        rows = list(archive.rows("arduino", T0, T0 + archive.DAY, ('sensor_id', 'server_receive_time')))
+        self.assertEqual(rows, [("../../x", T0)])
+
+    def archived_rows(self, columns=('id', 'sensor_id', 'server_receive_time', 'speed', 'repeats')):
+        return list(archive.rows("arduino", T0, T0 + archive.DAY, columns))
+
+    def test_round_trip_in_chunks(self):
+        ArduinoData.objects.bulk_create([
+            ArduinoData(sensor_id=f"A{i % 2}", speed=float(i), device_capture_time=clock_time(12, 0, i),
+                        server_receive_time=T0 + timedelta(seconds=i))
+            for i in range(7)
+        ])
+        expected = list(ArduinoData.objects.order_by('server_receive_time').values_list(
+            'id', 'sensor_id', 'server_receive_time', 'speed', 'repeats', 'device_capture_time',
+            'device_capture_at', 'run_until'))
+
+        self.assertEqual(archive.archive_day("arduino", T0, chunk=2), 7)
+        self.assertEqual(self.archived_rows(('id', 'sensor_id', 'server_receive_time', 'speed', 'repeats',
+                                             'device_capture_time', 'device_capture_at', 'run_until')),
+                         expected)
+        self.assertEqual(archive.count("arduino", T0, T0 + archive.DAY), 7)
+
+    def test_rerun_merges_with_the_earlier_file(self):
+        first = ArduinoData.objects.create(sensor_id="A1", speed=1.0, server_receive_time=T0)
+        archive.archive_day("arduino", T0)
+        # Interrupted after pruning the first row; one more arrived before the re-run
+        first.delete()
+        ArduinoData.objects.create(sensor_id="A1", speed=2.0, server_receive_time=T0 + timedelta(hours=1))
+        archive.archive_day("arduino", T0)
+        self.assertEqual([row[3] for row in self.archived_rows()], [1.0, 2.0])
+
+    def test_split_reads_the_archive_below_the_horizon(self):
+        ArduinoData.objects.bulk_create([
+            ArduinoData(sensor_id="A1", speed=1.0, server_receive_time=T0 + timedelta(hours=1)),
+            ArduinoData(sensor_id="A1", speed=2.0, server_receive_time=T0 + timedelta(days=1, hours=1)),
+        ])
+        totals = archive.run_retention(now=T0 + timedelta(days=2, hours=5), days=1, log=lambda _: None)
+        self.assertEqual(totals, {"days": 1, "archived": 1, "deleted": 1})
+        midnight = T0.replace(hour=0)
+        self.assertEqual(archive.horizon(), midnight + archive.DAY)
+
+        archived, cutoff = archive.split("arduino", T0, ('speed', 'server_receive_time'))
+        self.assertEqual(list(archived), [(1.0, T0 + timedelta(hours=1))])
+        self.assertEqual(cutoff, midnight + archive.DAY)
+        self.assertEqual(list(ArduinoData.objects.values_list('speed', flat=True)), [2.0])
+
+        archived, cutoff = archive.split("arduino", T0 + timedelta(days=1), ('speed',))
+        self.assertEqual((list(archived), cutoff), ([], T0 + timedelta(days=1)))
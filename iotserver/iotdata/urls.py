@@ -15,7 +15,18 @@ urlpatterns = [
 
     # ---- API ----
     path('api/upload/', views.upload_data, name='upload_data'),
+    path('api/upload/fast/', views.upload_fast, name='upload_fast'),
+    path('api/ingest/stats/', views.ingest_stats, name='ingest_stats'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('api/profile/', views.profile_report, name='profile_report'),
     path('api/latest/', views.latest_data, name='latest_data'),
+    path('api/devices/', views.device_list, name='device_list'),
     path('api/control/relay/', views.control_relay, name='control_relay'),
+    path('api/control/relay/async/', views.control_relay_async, name='control_relay_async'),
+    path('api/control/relay/commands/<int:command_id>/', views.relay_command_status, name='relay_command_status'),
+    path('api/control/relay/stats/', views.relay_queue_stats, name='relay_queue_stats'),
     path('api/recent/', views.recent_data_api, name='recent_data_api'),
+    path('api/readings/', views.readings_api, name='readings_api'),
+    path('api/latency/', views.latency_api, name='latency_api'),
+    path('api/analytics/', views.analytics_api, name='analytics_api'),
 ]
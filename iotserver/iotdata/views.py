@@ -1,66 +1,157 @@
 # iotdata/views.py
 from django.shortcuts import render
-from django.http import JsonResponse, HttpRequest
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from datetime import timedelta
-import requests
+from datetime import datetime, timedelta
+import json
+import math
+import time
 
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 
 from .models import ArduinoData, NodeMCUData
-from .serializers import ArduinoDataSerializer, NodeMCUDataSerializer
+from .ingest import ingest, validate_samples, BatchTooLarge
+from . import (analytics, delta, devices, downsample, latency, live, metrics, profiler, readings,
+               relay, relayqueue, rollups, schema, streaming, wire, writebehind, writer)
 
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-
+from asgiref.sync import sync_to_async
 
 
-# Global cache for NodeMCU IP
-LATEST_IP_INFO = {
-    'nodemcu_ip': 'Unknown',
-    'last_seen': timezone.now()
-}
 
 # ===================== 1. UPLOAD DATA =====================
+@metrics.instrumented('upload_data')
 @csrf_exempt
 @api_view(['POST'])
 def upload_data(request):
-    body = request.data
-    client_ip = request.META.get('REMOTE_ADDR')
-    if client_ip:
-        LATEST_IP_INFO['nodemcu_ip'] = client_ip
-        LATEST_IP_INFO['last_seen'] = timezone.now()
-
-    # Arduino Data
-    arduino_data = body.get("arduino")
-    if arduino_data:
-        serializer = ArduinoDataSerializer(data=arduino_data)
-        if serializer.is_valid():
-            serializer.save()
-        else:
-            print("[UPLOAD] Arduino errors:", serializer.errors)
-
-    # NodeMCU Data
-    nodemcu_data = body.get("nodemcu")
-    if nodemcu_data:
-        serializer = NodeMCUDataSerializer(data=nodemcu_data)
-        if serializer.is_valid():
-            serializer.save()
-        else:
-            print("[UPLOAD] NodeMCU errors:", serializer.errors)
-
-    return Response({"status": "data_received"}, status=status.HTTP_201_CREATED)
+    """
+    Accepts either one object per source (firmware default):
+        {"arduino": {...}, "nodemcu": {...}}
+    or a buffered batch of samples per source:
+        {"arduino": [{...}, ...], "nodemcu": [{...}, ...]}
+    Valid samples are written with bulk_create in one transaction; the
+    response reports accepted/rejected counts and per-sample errors.
+    """
+    data, code, headers = _ingest_response(request.data, request.META.get('REMOTE_ADDR'))
+    return Response(data, status=code, headers=headers)
+
+
+@metrics.instrumented('upload_fast')
+@csrf_exempt
+def upload_fast(request):
+    """
+    Same contract as upload_data for JSON bodies, without DRF: the body is
+    parsed with json.loads and validated with the compiled schema
+    (schema.py), which keeps the serializers' rules and error messages.
+    This is the URL the firmware posts to.
+    """
+    if request.method != 'POST':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'},
+                            status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={"Allow": "POST"})
+    if request.content_type != 'application/json':
+        return JsonResponse({"detail": f'Unsupported media type "{request.content_type}" in request.'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    try:
+        body = json.loads(request.body)
+    except ValueError as e:
+        return JsonResponse({"detail": f"JSON parse error - {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(body, dict):
+        return JsonResponse({"detail": "Expected a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+
+    data, code, headers = _ingest_response(body, request.META.get('REMOTE_ADDR'),
+                                           schema.validate_samples)
+    return JsonResponse(data, status=code, headers=headers)
+
+
+def _ingest_response(body, client_ip, validate=validate_samples):
+    """(response body, status, headers) for an upload, shared by both upload views."""
+    try:
+        report = ingest(body, client_ip=client_ip, validate=validate)
+    except BatchTooLarge as e:
+        return {"error": str(e)}, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, None
+    except writebehind.BufferFull as e:
+        print("[UPLOAD] Backpressure:", e)
+        return ({"error": "Ingest queue full, retry later"},
+                status.HTTP_503_SERVICE_UNAVAILABLE, {"Retry-After": "1"})
+    except writer.WriterTimeout as e:
+        print("[UPLOAD] Writer behind:", e)
+        return ({"error": "Database busy, retry later"},
+                status.HTTP_503_SERVICE_UNAVAILABLE, {"Retry-After": "1"})
+
+    accepted = sum(r["accepted"] for r in report.values())
+    rejected = sum(r["rejected"] for r in report.values())
+    if rejected and not accepted:
+        return {"status": "rejected", **report}, status.HTTP_400_BAD_REQUEST, None
+
+    return {"status": "data_received", **report}, status.HTTP_201_CREATED, None
+
+@api_view(['GET'])
+def ingest_stats(request):
+    """Write-behind queue depth and flush latency counters, plus writer and delta storage counters."""
+    return Response({**writebehind.stats(), "writer": writer.stats(), "delta": delta.stats()})
+
+def metrics_view(request):
+    """
+    Counters and latency histograms in the Prometheus text format (see
+    metrics.py), for IOTDATA_METRICS_ALLOWED_IPS and staff users only.
+    """
+    if not (metrics.may_scrape(request.META.get('REMOTE_ADDR')) or request.user.is_staff):
+        return HttpResponse("forbidden\n", status=403, content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def profile_report(request):
+    """
+    Sampled view profiles (staff only; see profiler.py). GET: per view the
+    top functions (?view=, ?top=20, ?sort=self|total), or ?format=collapsed
+    for flame graph tools. DELETE clears them (?view= for one view).
+    """
+    name = request.GET.get("view") or None
+    prof = profiler.get_profiler()
+    if request.method == 'DELETE':
+        prof.reset(name)
+        return Response(status=204)
+    if request.GET.get("format") == "collapsed":
+        return HttpResponse(prof.collapsed(name), content_type='text/plain; charset=utf-8')
+    try:
+        top = min(max(int(request.GET.get("top", 20)), 1), 200)
+    except ValueError:
+        return Response({"error": "top must be an integer"}, status=400)
+    sort = "total" if request.GET.get("sort") == "total" else "self"
+    return Response({**profiler.stats(), "profiles": prof.report(name, top, sort)})
 
 # ===================== 2. RELAY CONTROL =====================
+def _relay_target(body):
+    """IP of the board named by "sensor_id" in the body, else the newest NodeMCU."""
+    return devices.relay_ip(body.get("sensor_id"))
+
+
+def _relay_outcome(relay_type, results):
+    """(body, status) for control_relay responses; logs failed commands."""
+    failed = {t: r for t, r in results.items() if not r["ok"]}
+    for target, r in failed.items():
+        print(f"[CONTROL FAIL] {target} ({relay_type}): {r['error'] or r['status']}")
+    if failed:
+        return {"error": "NodeMCU/Arduino unreachable", "commands": results}, 504
+    return {"status": "ok", "commands": results}, 200
+
+
+@metrics.instrumented('control_relay')
 @csrf_exempt
 @api_view(['POST'])
 def control_relay(request):
     """
     Handles common & individual relay control.
     NodeMCU forwards Arduino commands via TX/RX.
+    With IOTDATA_RELAY_QUEUE on, the command is queued for the device and
+    202 is returned with command IDs to poll (see relayqueue.py). Otherwise
+    commands go out in parallel over pooled keep-alive connections, each
+    bounded by IOTDATA_RELAY_TIMEOUT (see relay.py).
     """
     try:
         body = request.data
@@ -68,62 +159,89 @@ def control_relay(request):
         relay_type = body.get("type", "common")
         action = "on" if state else "off"
 
-        nodemcu_ip = LATEST_IP_INFO.get('nodemcu_ip', "192.168.1.100")  # fallback IP
-        success = True
-
-        # --- COMMON RELAY: Toggle both NodeMCU & Arduino ---
-        if relay_type == "common":
-            # NodeMCU relay
-            try:
-                requests.get(f"http://{nodemcu_ip}/relay/{action}", timeout=5)
-            except Exception as e:
-                print(f"[CONTROL FAIL] NodeMCU (common): {e}")
-                success = False
-
-            # Arduino via NodeMCU
-            try:
-                requests.get(f"http://{nodemcu_ip}/relay/arduino/{action}", timeout=5)
-            except Exception as e:
-                print(f"[CONTROL FAIL] Arduino via NodeMCU (common): {e}")
-                success = False
-
-        # --- INDIVIDUAL RELAYS ---
-        elif relay_type == "nodemcu":
-            try:
-                requests.get(f"http://{nodemcu_ip}/relay/{action}", timeout=5)
-            except Exception as e:
-                print(f"[CONTROL FAIL] NodeMCU (individual): {e}")
-                success = False
-
-        elif relay_type == "arduino":
-            try:
-                requests.get(f"http://{nodemcu_ip}/relay/arduino/{action}", timeout=5)
-            except Exception as e:
-                print(f"[CONTROL FAIL] Arduino via NodeMCU (individual): {e}")
-                success = False
-
-        else:
+        if relay_type not in relay.TARGETS:
             return Response({"error": "Unknown relay type"}, status=400)
 
+        if relayqueue.is_enabled():
+            commands = relayqueue.get_queue().submit(_relay_target(body), relay_type, state)
+            return Response({
+                "status": "queued",
+                "commands": [c.as_dict() for c in commands],
+            }, status=status.HTTP_202_ACCEPTED)
+
+        results = relay.send_commands(_relay_target(body), relay_type, action)
+        payload, code = _relay_outcome(relay_type, results)
+
         # --- Broadcast updated state ---
-        if success:
-            channel_layer = get_channel_layer()
-            if channel_layer:
-                fake_request = HttpRequest()
-                fake_request.method = "GET"
-                response = latest_data(fake_request)
-                async_to_sync(channel_layer.group_send)(
-                    "dashboard",
-                    {"type": "dashboard_update", "data": response.data}
-                )
-            return Response({"status": "ok"})
-        else:
-            return Response({"error": "NodeMCU/Arduino unreachable"}, status=504)
+        if code == 200:
+            live.publish(live.latest_payload())
+        return Response(payload, status=code)
 
     except Exception as e:
         print("[CONTROL CRASH]", e)
         return Response({"error": "Server error"}, status=500)
 
+
+@metrics.instrumented('control_relay_async')
+@csrf_exempt
+async def control_relay_async(request):
+    """
+    Same contract as control_relay, as a native async view: under an ASGI
+    server the wait for the device holds no worker thread. With
+    IOTDATA_RELAY_QUEUE on, commands go through the same per-device queue
+    (202 with command IDs), so both endpoints share its ordering.
+    """
+    if request.method != "POST":
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'}, status=405)
+    try:
+        body = json.loads(request.body or b"{}")
+        state = body.get("state", False)
+        relay_type = body.get("type", "common")
+        action = "on" if state else "off"
+
+        if relay_type not in relay.TARGETS:
+            return JsonResponse({"error": "Unknown relay type"}, status=400)
+
+        if relayqueue.is_enabled():
+            submit = sync_to_async(relayqueue.get_queue().submit)
+            commands = await submit(_relay_target(body), relay_type, state)
+            return JsonResponse({
+                "status": "queued",
+                "commands": [c.as_dict() for c in commands],
+            }, status=202)
+
+        results = await relay.send_commands_async(_relay_target(body), relay_type, action)
+        payload, code = _relay_outcome(relay_type, results)
+
+        if code == 200:
+            channel_layer = get_channel_layer()
+            if channel_layer is not None:
+                await channel_layer.group_send(live.DASHBOARD_GROUP, {
+                    "type": "dashboard_update",
+                    "data": await sync_to_async(live.latest_payload)(),
+                })
+        return JsonResponse(payload, status=code)
+
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    except Exception as e:
+        print("[CONTROL CRASH]", e)
+        return JsonResponse({"error": "Server error"}, status=500)
+
+@api_view(['GET'])
+def relay_command_status(request, command_id):
+    """State of one queued relay command: queued/sending/sent/acked/superseded/failed/unconfirmed."""
+    command = relayqueue.get_queue().get(command_id)
+    if command is None:
+        return Response({"error": "Unknown command"}, status=404)
+    return Response(command)
+
+
+@api_view(['GET'])
+def relay_queue_stats(request):
+    """Relay command queue counters."""
+    return Response(relayqueue.stats())
+
 # ===================== 3. LATEST DATA =====================
 from datetime import timedelta
 from rest_framework.decorators import api_view
@@ -131,101 +249,241 @@ from rest_framework.response import Response
 from django.utils import timezone
 from .models import ArduinoData, NodeMCUData
 
+# Longest a ?since=&wait= long-poll may hold a request (seconds)
+MAX_LONG_POLL_WAIT = 25
+# ?max_points= is clamped to this range (LTTB keeps at least 3 points)
+MIN_POINTS, MAX_POINTS = 3, 20000
+
+@metrics.instrumented('recent_data_api')
 @api_view(['GET'])
 def recent_data_api(request):
-    minutes = int(request.GET.get('minutes', 30))
-    cutoff = timezone.now() - timedelta(minutes=minutes)
-
-    arduino_data = ArduinoData.objects.filter(server_receive_time__gte=cutoff).order_by('server_receive_time')
-    nodemcu_data = NodeMCUData.objects.filter(server_receive_time__gte=cutoff).order_by('server_receive_time')
-
-    combined = []
-
-    # Arduino
-    for d in arduino_data:
-        combined.append({
-            "source": "arduino",
-            "sensor_id": d.sensor_id,
-            "capture_time": str(d.device_capture_time),
-            "ir1": d.ir1,
-            "ir2": d.ir2,
-            "piezo": float(d.piezo),
-            "speed": float(d.speed),
-            "arduino_relay": d.arduino_relay,
-            "piezo_relay": d.piezo_relay,
-            "nodemcu_relay": False,
-            "timestamp": d.server_receive_time.isoformat()
-        })
-
-    # NodeMCU
-    for d in nodemcu_data:
-        combined.append({
-            "source": "nodemcu",
-            "sensor_id": d.sensor_id,
-            "capture_time": str(d.device_capture_time),
-            "ir1": d.ir1,
-            "ir2": d.ir2,
-            "piezo": 0.0,
-            "speed": 0.0,
-            "arduino_relay": False,
-            "piezo_relay": False,
-            "nodemcu_relay": d.nodemcu_relay,
-            "timestamp": d.server_receive_time.isoformat()
-        })
-
-    # Sort by timestamp
-    combined.sort(key=lambda x: x["timestamp"])
-    return Response({"table_rows": combined})
+    """
+    Samples from the last ?minutes= (default 30). With ?max_points=N
+    (clamped to 3..20000), windows holding more than N raw rows per source
+    are reduced on the server:
+      - downsample=rollup (default): answered from the finest rollup level
+        that fits (see rollups.py); rows carry means, min/max and
+        occupancy/duty ratios, and "resolution" names the bucket width.
+      - downsample=lttb, or no rollups built for the window yet: every
+        series is reduced to N points with LTTB (see downsample.py) and
+        returned per source/sensor/field under "series"; "resolution" names
+        the rollup level a very long window was charted from (null: raw).
+    ?format=columnar returns one array per field per source, and
+    ?format=msgpack the same as MessagePack (see wire.py); both are
+    brotli/gzip-compressed when the client accepts it.
+
+    Incremental reads: raw responses include a "cursor"; passing it back as
+    ?since=<cursor> returns only rows stored after it (still bounded by
+    ?minutes=) plus the advanced cursor. Adding ?wait=<seconds> (max 25)
+    holds the request until new rows arrive or the wait runs out.
+    """
+    try:
+        minutes = int(request.GET.get('minutes', 30))
+    except ValueError:
+        return Response({"error": "minutes must be an integer"}, status=400)
+    now = timezone.now()
+    try:
+        cutoff = _minutes_before(now, minutes)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    fmt = request.GET.get('format', 'json')
+    if fmt not in wire.FORMATS:
+        return Response({"error": f"Unknown format '{fmt}'"}, status=400)
+    try:
+        return _recent_response(request, now, cutoff, fmt)
+    except wire.UnsupportedFormat as e:
+        return Response({"error": str(e)}, status=406)
+
+
+def _recent_response(request, now, cutoff, fmt):
+    max_points = request.GET.get('max_points')
+    if max_points:
+        try:
+            max_points = min(max(int(max_points), MIN_POINTS), MAX_POINTS)
+        except ValueError:
+            return Response({"error": "max_points must be an integer"}, status=400)
+        resolution = rollups.pick_resolution(cutoff, now, max_points)
+        if resolution:
+            rows = []
+            if request.GET.get('downsample', 'rollup') == 'rollup':
+                rows = rollups.rollup_rows(resolution, cutoff)
+            if rows:
+                if fmt == 'json':
+                    return Response({"resolution": resolution, "table_rows": rows})
+                return wire.encoded_response(
+                    request, wire.rows_to_columns(rows, resolution=resolution), fmt)
+
+            series, resolutions = downsample.downsampled_series(cutoff, max_points, now)
+            payload = {
+                "downsample": "lttb",
+                "max_points": max_points,
+                "resolution": resolutions,
+                "series": series,
+            }
+            if fmt == 'json':
+                return Response(payload)
+            return wire.encoded_response(request, payload, fmt)
 
+    since = request.GET.get('since')
+    try:
+        cursor = streaming.Cursor.parse(since) if since else streaming.Cursor()
+        wait = min(float(request.GET.get('wait', 0)), MAX_LONG_POLL_WAIT)
+    except ValueError:
+        return Response({"error": "Bad since/wait parameter"}, status=400)
 
+    if since and wait > 0:
+        live.wait_for_data(lambda: streaming.has_rows_after(cursor, cutoff), wait)
+
+    if fmt != 'json':
+        return wire.encoded_response(request, wire.raw_columns(cutoff, cursor), fmt)
+
+    # Raw rows: two chunked tuple streams merged by time, encoded as they go
+    return streaming.stream_response(request, streaming.json_table_rows(
+        streaming.merged_rows(cutoff, cursor),
+        trailer=lambda: {"cursor": str(cursor)},
+    ))
 
 
 @api_view(['GET'])
-def latest_data(request):
+def readings_api(request):
+    """
+    Samples of every board type from the unified readings table (see
+    readings.py) as one time-ordered stream read with a single query:
+    ?minutes= (default 30) or ?start=&end=, optionally ?sensor_id=A,B and
+    ?source=arduino,nodemcu. Rows carry only their own source's fields.
+    The response ends with a "cursor"; ?since=<cursor> returns only readings
+    stored after it.
+    """
+    if not readings.is_enabled():
+        return Response({"error": "Unified readings store is off (IOTDATA_UNIFIED_READINGS)"},
+                        status=404)
     try:
-        arduino = ArduinoData.objects.latest('server_receive_time')
-    except ArduinoData.DoesNotExist:
-        arduino = None
+        start, end = _window_bounds(request, default_minutes=30)
+        since = int(request.GET.get('since', 0))
+    except (ValueError, OverflowError) as e:
+        return Response({"error": f"Bad window parameter: {e}"}, status=400)
+    sensor_ids = [s for s in request.GET.get('sensor_id', '').split(',') if s]
+    sources = [s for s in request.GET.get('source', '').split(',') if s]
 
-    try:
-        nodemcu = NodeMCUData.objects.latest('server_receive_time')
-    except NodeMCUData.DoesNotExist:
-        nodemcu = None
+    cursor = [since]
+    return streaming.stream_response(request, streaming.json_table_rows(
+        readings.stream(start, end, sensor_ids, sources, after_id=since, cursor=cursor),
+        trailer=lambda: {"cursor": cursor[0]},
+    ))
 
-    last_seen = LATEST_IP_INFO['last_seen']
-    if nodemcu:
-        last_seen = nodemcu.server_receive_time
 
-    seconds_ago = (timezone.now() - last_seen).total_seconds()
+@metrics.instrumented('latest_data')
+@api_view(['GET'])
+def latest_data(request):
+    """
+    Newest Arduino/NodeMCU sample, served from the in-memory cache in live.py.
+    Optional ?arduino_id= / ?nodemcu_id= pick a specific board. Clients that
+    send back the ETag get a 304 until something changes.
+    """
+    metrics.note_poller(request.META.get('REMOTE_ADDR'))
+    etag, body = live.latest_body(
+        request.GET.get('arduino_id') or None,
+        request.GET.get('nodemcu_id') or None,
+    )
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
 
-    def format_data(data):
-        if not data:
-            return {
-                "ir1": 0, "ir2": 0, "piezo": 0.0, "speed": 0.0,
-                "arduino_relay": False, "piezo_relay": False, "nodemcu_relay": False
-            }
-        return {
-            "sensor_id": data.sensor_id,
-            "capture_time": str(data.device_capture_time) if data.device_capture_time else "N/A",
-            "receive_time": str(data.server_receive_time),
-            "ir1": getattr(data, 'ir1', 0),
-            "ir2": getattr(data, 'ir2', 0),
-            "piezo": float(getattr(data, 'piezo', 0.0)),
-            "speed": float(getattr(data, 'speed', 0.0)),
-            "arduino_relay": getattr(data, 'arduino_relay', False),
-            "piezo_relay": getattr(data, 'piezo_relay', False),
-            "nodemcu_relay": getattr(data, 'nodemcu_relay', False),
-        }
 
+@api_view(['GET'])
+def device_list(request):
+    """Every known board: IP, first/last seen (epoch s), samples and ingest rate."""
+    now = time.time()
+    boards = sorted(devices.all_devices().values(), key=lambda d: (d["source"], d["sensor_id"]))
+    for board in boards:
+        board["seconds_ago"] = round(now - board["last_seen"], 3)
+        board["is_connected"] = board["seconds_ago"] < live.CONNECTED_WINDOW
+    return Response({"devices": boards})
+
+# ===================== 4. ANALYTICS =====================
+def _minutes_before(end, minutes):
+    """``end`` - ``minutes``; ValueError unless minutes is a finite, non-negative, representable span."""
+    if not math.isfinite(minutes) or minutes < 0:
+        raise ValueError("minutes must be a non-negative number")
+    try:
+        return end - timedelta(minutes=minutes)
+    except OverflowError:
+        raise ValueError("minutes is too large") from None
+
+
+def _window_bounds(request, default_minutes=60):
+    """[start, end) from ?start=&end= (ISO 8601) or ?minutes= before now."""
+    end = request.GET.get('end')
+    end = datetime.fromisoformat(end) if end else timezone.now()
+    start = request.GET.get('start')
+    if start:
+        start = datetime.fromisoformat(start)
+    else:
+        start = _minutes_before(end, float(request.GET.get('minutes', default_minutes)))
+    # Without a UTC offset, times are in the server's TIME_ZONE
+    if timezone.is_naive(start):
+        start = timezone.make_aware(start)
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+    return start, end
+
+
+@api_view(['GET'])
+def latency_api(request):
+    """
+    Arduino-path vs NodeMCU-path latency (see latency.py) for one board pair:
+    ?pair=01 (default) or ?arduino_id=&nodemcu_id=, over ?minutes= (default
+    60) or ?start=&end=. Returns p50/p95/p99/jitter per IR channel and for
+    both, each board's clock offset estimate, and the live tracker's figures.
+    """
+    pair = request.GET.get('pair', '01')
+    arduino_id = request.GET.get('arduino_id') or f"ARDU_{pair}"
+    nodemcu_id = request.GET.get('nodemcu_id') or f"NMCU_{pair}"
+    try:
+        start, end = _window_bounds(request)
+        window_ms = float(request.GET.get('window_ms', latency.pairing_window_ms()))
+    except (ValueError, OverflowError) as e:
+        return Response({"error": f"Bad window parameter: {e}"}, status=400)
+
+    tracker = latency.get_tracker()
     return Response({
-        "arduino": format_data(arduino),
-        "nodemcu": format_data(nodemcu),
-        "nodemcu_ip": LATEST_IP_INFO.get('nodemcu_ip', 'Unknown'),
-        "last_seen": seconds_ago,
-        "is_connected": seconds_ago < 5
+        "start": start, "end": end,
+        "arduino_id": arduino_id, "nodemcu_id": nodemcu_id,
+        "window_ms": window_ms,
+        **latency.window_stats(start, end, arduino_id, nodemcu_id, window_ms),
+        "live": {
+            **tracker.pair_summary(latency.pair_key(nodemcu_id)),
+            "offsets": {arduino_id: tracker.offsets(arduino_id),
+                        nodemcu_id: tracker.offsets(nodemcu_id)},
+        },
     })
 
-# ===================== 4. PAGE VIEWS =====================
+
+@api_view(['GET'])
+def analytics_api(request):
+    """
+    Dashboard aggregates over ?minutes= (default 60) or ?start=&end=, in
+    ?resolution=minute|hour buckets (default: minute up to 6 h, else hour;
+    the window is rounded out to whole buckets): per-sensor totals, speed
+    and piezo histograms, the IR occupancy heatmap, relay duty cycles and
+    vehicle counts per bucket. Buckets are cached and only new rows are read
+    on refresh (see analytics.py).
+    """
+    try:
+        start, end = _window_bounds(request)
+        resolution = analytics.pick_resolution(start, end, request.GET.get('resolution'))
+        result = analytics.window(start, end, resolution)
+    except (ValueError, OverflowError) as e:
+        return Response({"error": f"Bad window parameter: {e}"}, status=400)
+    return Response({"start": start, "end": end, **result, "cache": analytics.stats()})
+
+
+# ===================== 5. PAGE VIEWS =====================
 def dashboard_live_view(request): return render(request, 'dashboard.html')
 def team_view(request): return render(request, 'team.html')
 def live_table_view(request): return render(request, 'live_table.html')
@@ -0,0 +1,143 @@
+# iotdata/wire.py
+"""
+Compact wire formats for the time-series endpoints.
+
+format=columnar returns one array per field per source instead of an object
+per row (no repeated keys, no padding of fields a source doesn't have), with
+timestamps as epoch milliseconds:
+
+    {"format": "columnar",
+     "arduino": {"timestamp": [...], "sensor_id": [...], "speed": [...], ...},
+     "nodemcu": {"timestamp": [...], "sensor_id": [...], "ir1": [...], ...}}
+
+format=msgpack is the same structure encoded with MessagePack (needs the
+``msgpack`` package). Either body is compressed with brotli or gzip when the
+client's Accept-Encoding allows it (brotli needs the ``brotli`` package).
+"""
+import gzip
+import itertools
+import json
+
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from . import archive, delta
+from .models import ArduinoData, NodeMCUData
+from .streaming import CHUNK_SIZE, newest_id
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+COLUMNS = {
+    "arduino": (ArduinoData, ('sensor_id', 'device_capture_time', 'ir1', 'ir2', 'piezo',
+                              'speed', 'arduino_relay', 'piezo_relay')),
+    "nodemcu": (NodeMCUData, ('sensor_id', 'device_capture_time', 'ir1', 'ir2',
+                              'nodemcu_relay')),
+}
+
+FORMATS = ('json', 'columnar', 'msgpack')
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def raw_columns(cutoff, cursor=None):
+    """
+    Raw samples since ``cutoff`` as {source: {field: [values]}}. With a
+    streaming.Cursor only rows past it are read, and the advanced cursor is
+    returned under "cursor".
+    """
+    result = {"format": "columnar"}
+    for source, (model, fields) in COLUMNS.items():
+        names = ('timestamp',) + tuple(
+            'capture_time' if f == 'device_capture_time' else f for f in fields)
+        columns = {name: [] for name in names}
+        appenders = [columns[name].append for name in names]
+        names = ('id', 'server_receive_time', *fields, *delta.RUN_COLUMNS)
+        archived, since = (), cutoff
+        if cursor is None:
+            archived, since = archive.split(source, cutoff, names)
+        qs = model.objects.filter(server_receive_time__gte=since)
+        newest = None
+        if cursor is not None:
+            newest = newest_id(source)
+            qs = qs.filter(id__gt=cursor.ids[source])
+        rows = itertools.chain(archived, (qs.order_by('server_receive_time')
+                                          .values_list(*names)
+                                          .iterator(chunk_size=CHUNK_SIZE)))
+        for pk, *row in delta.expand(rows, 1):
+            if cursor is not None:
+                cursor.see(source, pk)
+            appenders[0](int(row[0].timestamp() * 1000))
+            appenders[1](row[1])                                    # sensor_id
+            appenders[2](str(row[2]) if row[2] is not None else None)  # capture time
+            for append, value in zip(appenders[3:], row[3:]):
+                append(value)
+        if cursor is not None:
+            cursor.see(source, newest)
+        result[source] = columns
+    if cursor is not None:
+        result["cursor"] = str(cursor)
+    return result
+
+
+def rows_to_columns(rows, **extra):
+    """Pivot table_rows-style dicts into {source: {field: [values]}}."""
+    result = {"format": "columnar", **extra}
+    for row in rows:
+        columns = result.setdefault(row["source"], {})
+        for key, value in row.items():
+            if key != "source":
+                columns.setdefault(key, []).append(value)
+    return result
+
+
+def _accepts(request, coding):
+    """True if Accept-Encoding lists ``coding`` with a non-zero q-value."""
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, *params = [p.strip() for p in part.split(';')]
+        if name != coding:
+            continue
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    return float(param[2:]) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def encoded_response(request, payload, fmt):
+    """Serialize ``payload`` as JSON or MessagePack and compress it if the client allows."""
+    if fmt == 'msgpack':
+        if msgpack is None:
+            raise UnsupportedFormat("format=msgpack needs the msgpack package on the server")
+        body, content_type = msgpack.packb(payload, use_bin_type=True), 'application/msgpack'
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        content_type = 'application/json'
+
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        if brotli is not None and _accepts(request, 'br'):
+            body, encoding = brotli.compress(body, quality=5), 'br'
+        elif _accepts(request, 'gzip'):
+            body, encoding = gzip.compress(body, compresslevel=6), 'gzip'
+
+    response = HttpResponse(body, content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,185 @@
+# iotdata/writebehind.py
+"""
+Optional write-behind buffer for the ingest path.
+
+When ``IOTDATA_WRITE_BEHIND`` is on, upload_data hands validated model
+instances to an in-process bounded buffer and returns immediately. A daemon
+thread writes them with bulk_create when either FLUSH_SIZE rows are waiting
+or FLUSH_INTERVAL seconds have passed. A full buffer makes the request wait
+up to PUT_TIMEOUT for space and then rejects it (the view answers 503), so a
+stalled database pushes back on the devices instead of eating memory.
+"""
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+class BufferFull(Exception):
+    pass
+
+
+class WriteBehindBuffer:
+    def __init__(self, writer, max_queue=20000, flush_size=500,
+                 flush_interval=0.5, put_timeout=0.05):
+        self.writer = writer              # callable({source: [instances]})
+        self.max_queue = max_queue
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+
+        self._pending = []                # [(source, instance), ...]
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        # Counters (read via stats())
+        self.enqueued = 0
+        self.written = 0
+        self.rejected = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    # ---------- producer side ----------
+    def put(self, batches):
+        items = [(source, obj) for source, objs in batches.items() for obj in objs]
+        if not items:
+            return
+        self._ensure_started()
+
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            if self._stopping:
+                self.rejected += len(items)
+                raise BufferFull("write-behind buffer is shutting down")
+            while len(self._pending) + len(items) > self.max_queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += len(items)
+                    raise BufferFull(f"write-behind queue full ({len(self._pending)} rows)")
+                self._cond.notify_all()   # wake the flusher early
+                self._cond.wait(remaining)
+            self._pending.extend(items)
+            self.enqueued += len(items)
+            if len(self._pending) >= self.flush_size:
+                self._cond.notify_all()
+
+    # ---------- flusher side ----------
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="iotdata-write-behind", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    if not self._stopping and len(self._pending) < self.flush_size:
+                        self._cond.wait(self.flush_interval)
+                    items, self._pending = self._pending, []
+                    stopping = self._stopping
+                    self._cond.notify_all()   # producers waiting for space
+                if items:
+                    self._write(items)
+                if stopping:
+                    break
+        finally:
+            connection.close()
+
+    def _write(self, items):
+        batches = {}
+        for source, obj in items:
+            batches.setdefault(source, []).append(obj)
+
+        start = time.perf_counter()
+        for attempt in (1, 2):
+            try:
+                self.writer(batches)
+                break
+            except Exception as e:
+                print(f"[WRITE-BEHIND] flush of {len(items)} rows failed (attempt {attempt}): {e}")
+                connection.close()
+                if attempt == 2:
+                    self.failed += len(items)
+                    return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        self.written += len(items)
+        self.flushes += 1
+        self.last_flush_ms = elapsed_ms
+        self.total_flush_ms += elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been handed to the writer."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while self._pending and time.monotonic() < deadline:
+                self._cond.wait(0.05)
+
+    def stop(self, timeout=10.0):
+        """Flush what is queued and stop the thread (registered with atexit)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._pending)
+        return {
+            "enabled": True,
+            "queue_depth": depth,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'IOTDATA_WRITE_BEHIND', False)
+
+
+def get_buffer(writer):
+    """Process-wide buffer, created on first use from settings."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(
+                    writer,
+                    max_queue=getattr(settings, 'IOTDATA_WRITE_BEHIND_MAX_QUEUE', 20000),
+                    flush_size=getattr(settings, 'IOTDATA_WRITE_BEHIND_FLUSH_SIZE', 500),
+                    flush_interval=getattr(settings, 'IOTDATA_WRITE_BEHIND_FLUSH_INTERVAL', 0.5),
+                    put_timeout=getattr(settings, 'IOTDATA_WRITE_BEHIND_PUT_TIMEOUT', 0.05),
+                )
+    return _buffer
+
+
+def stats():
+    if _buffer is None:
+        return {"enabled": is_enabled(), "queue_depth": 0}
+    return _buffer.stats()
@@ -0,0 +1,190 @@
+# iotdata/writer.py
+"""
+Serialized writer for the ingest path.
+
+SQLite allows one writer at a time; request threads that each open their
+own write transaction queue on the database lock (or fail with "database is
+locked") and pay one commit each. With IOTDATA_SERIAL_WRITER on,
+store_samples() hands its batches to a single writer thread with its own
+connection and waits for the commit. The thread takes everything that has
+queued up meanwhile (up to MAX_GROUP requests) and writes it in one
+transaction, so under load many uploads share one commit; if that group
+fails, each request is retried on its own so one bad batch only fails its
+own request. A request that waits longer than IOTDATA_SERIAL_WRITER_TIMEOUT
+withdraws its batch (it is skipped if not yet taken by the thread) and gets
+WriterTimeout, which the upload views answer with 503 and Retry-After: a
+retry then cannot store the same rows twice.
+
+Readers use their own connections and, in WAL mode (the "production"
+SQLite profile in settings.py), never block this writer.
+"""
+import atexit
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.db import connection
+
+# Upload requests merged into one transaction at most
+MAX_GROUP = 64
+
+
+class WriterTimeout(Exception):
+    pass
+
+
+def is_enabled():
+    return getattr(settings, 'IOTDATA_SERIAL_WRITER', False)
+
+
+class SerialWriter:
+    def __init__(self, writer, timeout=10.0):
+        self.writer = writer              # callable({source: [instances]})
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # Counters (read via stats())
+        self.requests = 0
+        self.transactions = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def write(self, batches):
+        """Write ``batches`` on the writer thread; returns once committed (or raises)."""
+        if not any(batches.values()):
+            return
+        self._ensure_started()
+        future = Future()
+        self._queue.put((batches, future))
+        try:
+            future.result(self.timeout)
+        except FutureTimeout:
+            if not future.cancel():
+                # Already being committed: the outcome is seconds away at most
+                future.result()
+                return
+            self.timed_out += 1
+            raise WriterTimeout(f"no commit within {self.timeout}s") from None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="iotdata-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        try:
+            while True:
+                job = self._queue.get()
+                if job is None:
+                    break
+                group = [job]
+                while len(group) < MAX_GROUP:
+                    try:
+                        job = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        self._queue.put(None)   # stop after this group
+                        break
+                    group.append(job)
+                self._commit(group)
+        finally:
+            connection.close()
+
+    def _commit(self, group):
+        # Drop the jobs whose request gave up waiting; the rest can no longer be cancelled
+        group = [job for job in group if job[1].set_running_or_notify_cancel()]
+        if not group:
+            return
+        self._write(group)
+
+    def _write(self, group):
+        merged = {}
+        for batches, _ in group:
+            for source, instances in batches.items():
+                merged.setdefault(source, []).extend(instances)
+        try:
+            self.writer(merged)
+        except Exception:
+            connection.close()
+            if len(group) == 1:
+                self._fail(group)
+                return
+            for job in group:        # isolate the bad batch
+                self._write([job])
+            return
+        self.requests += len(group)
+        self.transactions += 1
+        for _, future in group:
+            future.set_result(None)
+
+    def _fail(self, group):
+        for batches, future in group:
+            try:
+                self.writer(batches)
+            except Exception as e:
+                self.failed += 1
+                print(f"[WRITER] batch failed: {e}")
+                future.set_exception(e)
+            else:
+                self.requests += 1
+                self.transactions += 1
+                future.set_result(None)
+
+    def stop(self, timeout=10.0):
+        """Finish queued writes and stop the thread (registered with atexit)."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "queued": self._queue.qsize(),
+            "requests": self.requests,
+            "transactions": self.transactions,
+            "requests_per_commit": round(self.requests / self.transactions, 2)
+            if self.transactions else None,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(writer):
+    """Process-wide writer, created on first use from settings."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SerialWriter(
+                    writer, timeout=getattr(settings, 'IOTDATA_SERIAL_WRITER_TIMEOUT', 10.0)
+                )
+    return _writer
+
+
+def shutdown():
+    """Stop and forget the process-wide writer (benchmarks switch settings between runs)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
+
+
+def stats():
+    if _writer is None:
+        return {"enabled": is_enabled(), "queued": 0}
+    return _writer.stats()
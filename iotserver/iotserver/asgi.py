@@ -2,6 +2,10 @@
 ASGI config for iotserver project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; ``ws/dashboard/`` goes to the Channels consumer that
+pushes live sensor updates. Run it with an ASGI server, e.g.:
+
+    daphne -b 0.0.0.0 -p 8000 iotserver.asgi:application
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +17,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iotserver.settings')
 
-application = get_asgi_application()
+# Initialise Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from iotdata.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        URLRouter(websocket_urlpatterns)
+    ),
+})
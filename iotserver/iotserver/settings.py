@@ -1,5 +1,8 @@
 
 
+import os
+import tempfile
+from importlib.util import find_spec
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,8 +33,14 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'iotdata',
     'rest_framework',
+    'channels',
 ]
 
+# Daphne's runserver serves HTTP and WebSockets from one process; without it
+# the dashboards fall back to polling /api/latest/.
+if find_spec('daphne'):
+    INSTALLED_APPS.insert(0, 'daphne')
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -40,6 +49,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Last: it runs the profiled views itself (off unless IOTDATA_PROFILE_RATES is set)
+    'iotdata.profiler.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'iotserver.urls'
@@ -61,15 +72,63 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'iotserver.wsgi.application'
+ASGI_APPLICATION = 'iotserver.asgi.application'
+
+# Channel layer for the dashboard WebSocket group. In-memory is enough for a
+# single ASGI process; use channels_redis when running several.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    },
+}
+
+# "devices" holds the board registry (iotdata/devices.py). A file-based cache
+# is shared by every worker process on this host; use Redis or Memcached when
+# workers run on several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'devices': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'iotserver-devices'),
+    },
+}
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite connection profiles, picked with the IOTDATA_SQLITE_PROFILE env var
+# (IOTDATA_SQLITE_PROFILE=production on the server). "default" leaves the
+# database file as it is; WAL mode is stored in the file itself and adds
+# -wal/-shm files beside it, so it is opt-in.
+# "production": WAL journal (readers never block the writer and vice versa),
+# synchronous=NORMAL (fsync at checkpoints, not every commit), 64 MB page
+# cache, 256 MB mmap, and BEGIN IMMEDIATE so writers queue on busy_timeout
+# instead of failing with "database is locked" on lock upgrade.
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA cache_size=-65536;'
+            'PRAGMA mmap_size=268435456;'
+            'PRAGMA temp_store=MEMORY;'
+            'PRAGMA busy_timeout=10000;'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 10,
+    },
+}
+IOTDATA_SQLITE_PROFILE = os.environ.get('IOTDATA_SQLITE_PROFILE', 'default')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': dict(SQLITE_PROFILES[IOTDATA_SQLITE_PROFILE]),
     }
 }
 
@@ -122,3 +181,94 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# ?format= selects recent_data_api's wire format (json/columnar/msgpack), so
+# DRF must not treat it as a renderer override.
+REST_FRAMEWORK = {
+    'URL_FORMAT_OVERRIDE': None,
+}
+
+
+# ---- IoT ingest ----
+# Write-behind mode: upload_data queues validated samples in memory and a
+# background thread writes them in bulk (see iotdata/writebehind.py).
+IOTDATA_WRITE_BEHIND = False
+IOTDATA_WRITE_BEHIND_MAX_QUEUE = 20000      # rows; a full queue answers 503
+IOTDATA_WRITE_BEHIND_FLUSH_SIZE = 500       # flush when this many rows wait...
+IOTDATA_WRITE_BEHIND_FLUSH_INTERVAL = 0.5   # ...or after this many seconds
+IOTDATA_WRITE_BEHIND_PUT_TIMEOUT = 0.05     # seconds a request may wait for space
+
+# Serialized writer: ingest writes from every request thread are handed to
+# one writer thread, which commits whatever has queued up in a single
+# transaction (see iotdata/writer.py). On with the production (WAL) profile
+# only: on the default rollback journal a commit can take seconds, and
+# uploads waiting longer than the timeout are answered 503.
+IOTDATA_SERIAL_WRITER = IOTDATA_SQLITE_PROFILE == 'production'
+IOTDATA_SERIAL_WRITER_TIMEOUT = 10.0        # seconds a request waits for its commit
+
+# Change-only storage: fold runs of identical samples into one row, written
+# when a reading changes or every heartbeat seconds (see iotdata/delta.py).
+IOTDATA_DELTA_STORAGE = False
+IOTDATA_DELTA_HEARTBEAT = 1.0
+
+# Unified readings table: every stored sample of every board type is also
+# written to one narrow table (source, sensor_id, us timestamp, packed
+# values) read by /api/readings/ in a single query (see iotdata/readings.py).
+# Every sample is then written twice, so it is off unless /api/readings/ is
+# used; after turning it on, run `manage.py sync_readings` once to copy the
+# existing rows.
+IOTDATA_UNIFIED_READINGS = False
+
+# Retention: raw rows older than this many days (None = keep forever) are
+# exported to IOTDATA_ARCHIVE_DIR and deleted by `manage.py prune_raw`
+# (see iotdata/archive.py); analytics reads fall back to the archives.
+IOTDATA_RAW_RETENTION_DAYS = None
+IOTDATA_ARCHIVE_DIR = BASE_DIR / 'archive'
+IOTDATA_PRUNE_CHUNK = 5000                  # rows per delete transaction
+
+# Device clocks: the firmware's NTP time of day is in this zone (seconds
+# east of UTC, the NTPClient offset in NodeMcuCode). Latency analytics pair
+# IR edges of the two boards at most this many ms apart (see iotdata/latency.py).
+IOTDATA_DEVICE_UTC_OFFSET = 5.5 * 3600
+IOTDATA_LATENCY_WINDOW_MS = 2000
+
+# /api/analytics/ buckets cached per process (see iotdata/analytics.py); a
+# bucket is final once it ended this many seconds ago (late writes from the
+# write-behind queue, delta runs and the serial writer land well within it).
+IOTDATA_ANALYTICS_SETTLE = 30.0
+IOTDATA_ANALYTICS_CACHE_BUCKETS = 10000
+
+# Line-protocol listener (`manage.py line_server`, see iotdata/lineproto.py):
+# TCP and UDP port for "A...Z"/"N...Z" frames and how often buffered
+# samples are stored (seconds).
+IOTDATA_LINE_PORT = 9000
+IOTDATA_LINE_FLUSH_INTERVAL = 0.05
+
+# Relay commands: per-command deadline (seconds) for each HTTP call to the
+# NodeMCU; "common" sends both commands in parallel (see iotdata/relay.py).
+IOTDATA_RELAY_TIMEOUT = 2.0
+# Queue relay commands per device (coalescing superseded ones) and confirm
+# them from the next relay sample; control_relay then answers 202 at once.
+IOTDATA_RELAY_QUEUE = True
+IOTDATA_RELAY_ACK_TIMEOUT = 10.0
+
+# Request/ingest counters and latency histograms, served in the Prometheus
+# text format at /metrics (see iotdata/metrics.py). Only the addresses or
+# networks listed may scrape it (staff users always can); samples of sensors
+# past the first MAX_SENSORS share one "[other]" sensor_id series.
+IOTDATA_METRICS = True
+IOTDATA_METRICS_ALLOWED_IPS = os.environ.get('IOTDATA_METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+IOTDATA_METRICS_MAX_SENSORS = 200
+
+# Sampling profiler (see iotdata/profiler.py): fraction of requests profiled
+# per URL name, "*" for every other view; empty leaves the middleware out.
+# 1% per view is cheap enough to leave on. Reports, staff only, at
+# /api/profile/ (top functions, or ?format=collapsed for flame graphs).
+IOTDATA_PROFILE_RATES = {}          # e.g. {"upload_data": 0.01, "recent_data_api": 0.01}
+IOTDATA_PROFILE_INTERVAL = 0.001    # seconds between stack samples of a profiled request
+
+# Device registry: cache alias and how often each process merges the boards
+# it has seen into it (seconds).
+IOTDATA_DEVICE_CACHE = 'devices'
+IOTDATA_DEVICE_FLUSH_INTERVAL = 1.0